@@ -1,30 +1,197 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
 import requests
 import os
 import json
+import re
+import hashlib
+import zlib
+import gzip
+import sqlite3
 import uuid
+import contextlib
 import shutil
-from datetime import datetime
+import threading
+import time
+import cProfile
+import pstats
+import io
+import hmac
+import functools
+import tracemalloc
+import tarfile
+import tempfile
+import bisect
+import select
+import socket
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
+import numpy as np
 from pymongo import MongoClient
+import faiss
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from werkzeug.utils import secure_filename
 from docx import Document as DocxDocument
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 from dotenv import load_dotenv
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks, fine for the single-process dev server
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_TAGS_URL = OLLAMA_URL.rsplit("/api/", 1)[0] + "/api/tags"  # Same server as OLLAMA_URL
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3.2:3b")
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "vector_stores")
-ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'json'}
+ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'json', 'jsonl'}
+
+# Rolling memory: turns that fall out of the verbatim window are folded into a stored summary
+ROLLING_MEMORY_ENABLED = os.getenv("ROLLING_MEMORY_ENABLED", "false").lower() == "true"
+ROLLING_MEMORY_WINDOW = int(os.getenv("ROLLING_MEMORY_WINDOW", "4"))  # Messages kept verbatim in the prompt
+ROLLING_MEMORY_SUMMARY_TOKENS = int(os.getenv("ROLLING_MEMORY_SUMMARY_TOKENS", "256"))
+# Unsummarized messages the prompt may carry beyond the window while the summary lags; older ones are dropped
+ROLLING_MEMORY_SLACK = int(os.getenv("ROLLING_MEMORY_SLACK", "8"))
+ROLLING_MEMORY_FOLD_MAX = int(os.getenv("ROLLING_MEMORY_FOLD_MAX", "20"))  # Messages folded in per summary update
+
+# Per-process cache of session documents (seconds); writes invalidate it across workers
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+
+# Vector index strategy: "auto" picks flat, HNSW or IVF by chunk count
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+INDEX_HNSW_MIN_CHUNKS = int(os.getenv("INDEX_HNSW_MIN_CHUNKS", "20000"))
+INDEX_IVF_MIN_CHUNKS = int(os.getenv("INDEX_IVF_MIN_CHUNKS", "200000"))
+INDEX_FILE = "index.faiss"
+INDEX_META_FILE = "index_meta.json"
+CHUNK_STORE_FILE = "chunks.sqlite"
+# Builds are staged in their own directory and published by swapping the CURRENT pointer
+INDEX_POINTER_FILE = "CURRENT"
+INDEX_READERS_LOCK = "readers.lock"  # Held shared by every open store; old versions are deleted once free
+VECTOR_STORE_CACHE_SIZE = int(os.getenv("VECTOR_STORE_CACHE_SIZE", "1000"))  # Loaded stores kept per worker
+
+# Shared index: small sessions live in one partitioned store instead of their own faiss_index
+SHARED_INDEX_ENABLED = os.getenv("SHARED_INDEX_ENABLED", "false").lower() == "true"
+SHARED_INDEX_MAX_CHUNKS = int(os.getenv("SHARED_INDEX_MAX_CHUNKS", "2000"))  # Larger sessions get a dedicated index
+SHARED_INDEX_DIR = "_shared_index"
+INDEX_TYPES = {"auto", "flat", "ivf", "hnsw"}
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none")  # none, fp16 or pq
+INDEX_COMPRESSIONS = {"none", "fp16", "pq"}
+PQ_MIN_CHUNKS = 1024  # Below this, pq falls back to fp16
+
+# Resumable uploads: parts are appended straight to disk; TXT is chunked and embedded as it arrives
+UPLOAD_MAX_FILE_SIZE = int(os.getenv("UPLOAD_MAX_FILE_SIZE", str(5 * 1024 ** 3)))  # 5GB per file
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 ** 2)))  # Suggested part size for clients
+UPLOAD_EXPIRY_HOURS = float(os.getenv("UPLOAD_EXPIRY_HOURS", "24"))
+STREAM_BLOCK_SIZE = 1024 * 1024  # Bytes read per step when copying or chunking uploads
+STREAMING_EXTENSIONS = {'.txt'}
+JSON_EXTENSIONS = {'.json', '.jsonl'}  # Read record by record and embedded in batches at build time
+JSON_EMBED_BATCH = 256  # Chunks embedded per batch while streaming a JSON file
+JSON_MAX_FIELDS = 100  # Scalar fields of one object grouped into a record before it is emitted
+
+# Chunking: text is cut at headings, pages, paragraphs and table rows, then packed up to CHUNK_SIZE
+CHUNK_SIZE_UNIT = os.getenv("CHUNK_SIZE_UNIT", "chars")  # chars, or tokens (approximate word pieces)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))  # Only applies between pieces of one oversized paragraph
+CHUNKING_VERSION = f"structured:{CHUNK_SIZE_UNIT}:{CHUNK_SIZE}:{CHUNK_OVERLAP}"  # Cached chunks must match
+
+# Adaptive retrieval: candidates above a similarity cutoff, between min and max k, diversified with MMR.
+# Per-session overrides are set through PUT /api/sessions/<id>/retrieval/settings
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "2"))  # Always kept, whatever their score
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "10"))
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD", "0.3"))  # Cosine similarity; -1 disables
+RETRIEVAL_MMR = os.getenv("RETRIEVAL_MMR", "true").lower() == "true"
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))  # 1 ranks by relevance only, 0 by diversity only
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))  # Candidates fetched from FAISS before selection
+RETRIEVAL_MAX_FETCH_K = 200
+
+# Model routing: sessions can pin a model, or let the router send simple questions to a small model and
+# long, deep or broad ones to a larger model. Per-session overrides go through PUT /api/sessions/<id>/model/settings
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "false").lower() == "true"
+MODEL_SMALL = os.getenv("MODEL_SMALL", MODEL_NAME)
+MODEL_LARGE = os.getenv("MODEL_LARGE", MODEL_NAME)
+ROUTER_LONG_QUERY_WORDS = int(os.getenv("ROUTER_LONG_QUERY_WORDS", "30"))  # Longer questions go to the large model
+ROUTER_DEEP_CONVERSATION = int(os.getenv("ROUTER_DEEP_CONVERSATION", "8"))  # History messages before switching to large
+ROUTER_MIN_SCORE_SPREAD = float(os.getenv("ROUTER_MIN_SCORE_SPREAD", "0.08"))  # Flatter retrieval scores go to large
+MODEL_TAGS_TTL = float(os.getenv("MODEL_TAGS_TTL", "60"))  # Seconds the /api/tags model list is cached per worker
+
+# Ingest deduplication: byte-identical uploads are skipped; near-duplicate chunks are dropped at build time
+CHUNK_DEDUP_ENABLED = os.getenv("CHUNK_DEDUP_ENABLED", "true").lower() == "true"
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.85"))  # Estimated Jaccard similarity of word shingles
+DOCUMENT_HASHES_FILE = "document_hashes.json"
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 8  # 8 bands of 8 rows: pairs above ~0.77 similarity almost always share a bucket
+SHINGLE_SIZE = 5
+
+# Conditional GETs: read endpoints send strong ETags built from per-session change counters
+VERSIONS_FILE = "versions.json"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # JSON responses at least this large are gzipped
+
+# Admin endpoints (profiling) are disabled unless ADMIN_TOKEN is set; send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# On-demand profiling: armed rules live in a file so every worker sees them; nothing runs while none are armed
+PROFILES_DIR = "_profiles"
+PROFILE_RULES_FILE = "rules.json"
+PROFILE_MAX_REQUESTS = 100  # Per rule
+PROFILE_MAX_ARTIFACTS = int(os.getenv("PROFILE_MAX_ARTIFACTS", "200"))  # Oldest reports are deleted beyond this
+PROFILE_TRACEMALLOC_FRAMES = 10
+
+# Cold-session tiering: sessions idle for TIERING_IDLE_DAYS have their documents, chunk cache and index packed
+# into one compressed archive; the first request for the session unpacks it again
+TIERING_ENABLED = os.getenv("TIERING_ENABLED", "false").lower() == "true"  # Runs the background pass in every worker
+TIERING_IDLE_DAYS = float(os.getenv("TIERING_IDLE_DAYS", "30"))
+TIERING_INTERVAL_MINUTES = float(os.getenv("TIERING_INTERVAL_MINUTES", "360"))
+TIERING_COMPRESS_LEVEL = int(os.getenv("TIERING_COMPRESS_LEVEL", "6"))  # gzip level of the archives
+ARCHIVE_DIR = "_archive"
+ACTIVITY_FILE = "last_access"  # Its mtime is the session's last request, refreshed at most once a minute
+TIERED_DIRS = ("documents", "chunk_cache", "faiss_index")
+# Session snapshots: one streamed .tar.gz with the session, its documents and its built index
+SNAPSHOT_FORMAT = "chatbot-session-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COMPRESS_LEVEL = int(os.getenv("SNAPSHOT_COMPRESS_LEVEL", "6"))
+SNAPSHOT_MAX_SIZE = int(os.getenv("SNAPSHOT_MAX_SIZE", str(2 * 1024 ** 3)))  # Largest accepted import upload
+SNAPSHOT_BATCH_ROWS = 4096  # Index rows read per step when exporting vectors and chunks as plain data
+IMPORTS_DIR = "_imports"  # Imports are unpacked here and moved into place once complete
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Multi-node mode: sessions are spread over CLUSTER_NODES by consistent hashing. A node forwards requests for
+# sessions it does not own to their owner and only stores its own sessions. All nodes share one MongoDB
+CLUSTER_NODES = [node.strip().rstrip("/") for node in os.getenv("CLUSTER_NODES", "").split(",") if node.strip()]
+CLUSTER_SELF = os.getenv("CLUSTER_SELF", "").rstrip("/")  # This node's base URL exactly as listed in CLUSTER_NODES
+CLUSTER_ENABLED = bool(CLUSTER_NODES)
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "128"))  # Points per node on the hash ring
+CLUSTER_FORWARD_TIMEOUT = float(os.getenv("CLUSTER_FORWARD_TIMEOUT", "600"))  # Seconds to wait for the owner
+CLUSTER_REBALANCE_MINUTES = float(os.getenv("CLUSTER_REBALANCE_MINUTES", "10"))  # Retries of sessions left to move
+CLUSTER_FILE = "_cluster.json"  # Node list in force and the one before it, replaced when membership changes
+CLUSTER_HOP_HEADER = "X-Cluster-Hop"  # Marks requests from another node, which are never forwarded again
+if CLUSTER_ENABLED and not CLUSTER_SELF:
+    raise RuntimeError("CLUSTER_SELF must be set to this node's URL when CLUSTER_NODES is set")
+
+# Batch question answering limits
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "4"))
+
+# Request deadlines: a chat gets REQUEST_DEADLINE_SECONDS (less if the client sends X-Request-Deadline-Ms) for
+# retrieval and generation. Answers are streamed from Ollama and the stream is dropped once the deadline passes
+# or the client disconnects, which stops Ollama from generating tokens nobody will read
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "110"))  # Under gunicorn's and nginx's 120s
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+PARTIAL_ANSWER_POLICY = os.getenv("PARTIAL_ANSWER_POLICY", "save")  # save or discard answers cut off this way
+DISCONNECT_CHECK_INTERVAL = 0.25  # Seconds between looks at the client's socket while tokens arrive
+
 DEFAULT_SYSTEM_PROMPT = (
     "You are a smart assistant that strictly follows the user's custom instructions.\n"
     "IMPORTANT: You must ONLY answer questions based on the content provided in the 'Relevant Information' section below. "
@@ -49,6 +216,229 @@ app.config['DEBUG'] = True
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 
+# Prometheus metrics. Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in gunicorn_config.py) makes every
+# worker write its samples to that directory and /metrics sums them over all workers
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CHAT_STAGE_SECONDS = Histogram(
+    "chatbot_chat_stage_seconds", "Time spent per stage of answering a chat message", ["stage"],
+    buckets=LATENCY_BUCKETS)
+INGEST_STAGE_SECONDS = Histogram(
+    "chatbot_ingest_stage_seconds", "Time spent per stage of ingesting documents", ["stage"],
+    buckets=LATENCY_BUCKETS + (300, 900))
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "chatbot_ollama_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration)",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200))
+CONTEXT_CHUNKS = Histogram(
+    "chatbot_context_chunks", "Document chunks placed in each prompt by retrieval",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50))
+MODEL_GENERATION_SECONDS = Histogram(
+    "chatbot_model_generation_seconds", "Ollama request time per model", ["model"], buckets=LATENCY_BUCKETS)
+MODEL_TTFT_SECONDS = Histogram(
+    "chatbot_model_ttft_seconds", "Ollama time to first token per model", ["model"], buckets=LATENCY_BUCKETS)
+MODEL_ROUTES = Counter("chatbot_model_routes_total", "Chat prompts per chosen model and routing reason",
+                       ["model", "route"])
+TIERING_SECONDS = Histogram(
+    "chatbot_tiering_seconds", "Time to archive an idle session or restore it on first access", ["operation"],
+    buckets=LATENCY_BUCKETS)
+CLUSTER_FORWARDS = Counter("chatbot_cluster_forwards_total", "Requests forwarded to the node that owns their session",
+                           ["outcome"])
+CLUSTER_MOVES = Counter("chatbot_cluster_session_moves_total", "Sessions moved between nodes after the node list "
+                        "changed", ["direction", "outcome"])
+MODEL_FALLBACKS = Counter("chatbot_model_fallbacks_total", "Prompts sent to another model because the chosen "
+                          "one is not installed", ["requested", "model"])
+GENERATIONS_CANCELLED = Counter("chatbot_generations_cancelled_total", "Ollama generations stopped before they "
+                                "finished", ["reason"])
+GENERATION_TOKENS_SAVED = Counter("chatbot_generation_tokens_saved_total", "Estimated completion tokens not generated "
+                                  "because a generation was stopped", ["reason"])
+OLLAMA_TOKENS = Counter("chatbot_ollama_tokens_total", "Tokens processed by Ollama", ["kind"])
+OLLAMA_ERRORS = Counter("chatbot_ollama_errors_total", "Failed Ollama generation requests", ["reason"])
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "HTTP request duration per endpoint", ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "chatbot_requests_in_flight", "HTTP requests currently being handled", ["endpoint"],
+    multiprocess_mode="livesum")
+
+@app.before_request
+def start_request_metrics():
+    request.metrics_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels(request.endpoint or "unknown").inc()
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    started = getattr(request, "metrics_started", None)
+    if started is not None:
+        REQUESTS_IN_FLIGHT.labels(request.endpoint or "unknown").dec()
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(request, "metrics_started", None)
+    if started is not None:
+        REQUEST_SECONDS.labels(request.endpoint or "unknown", request.method,
+                               str(response.status_code)).observe(time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip large JSON bodies for clients that accept it"""
+    if (response.status_code != 200 or response.mimetype != "application/json" or response.is_streamed
+            or response.direct_passthrough or "Content-Encoding" in response.headers
+            or "gzip" not in request.accept_encodings):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag:
+        # A strong ETag names one exact byte sequence, so the gzipped body needs its own tag
+        response.set_etag(f"{etag}-gzip", weak)
+    return response
+
+# Request profiling state: rules file ((mtime, inode), rules) cache and the one request profiled at a time
+_profile_rules_cache = (None, [])
+_profile_lock = threading.Lock()  # cProfile supports a single active profiler per process
+
+def get_profiles_path():
+    return os.path.join(UPLOAD_FOLDER, PROFILES_DIR)
+
+def read_profile_rules():
+    """Armed profiling rules; a single stat per request while none are armed"""
+    global _profile_rules_cache
+    rules_file = os.path.join(get_profiles_path(), PROFILE_RULES_FILE)
+    try:
+        stat = os.stat(rules_file)
+    except FileNotFoundError:
+        return []
+    # Rules are replaced, never rewritten in place, so a new inode also marks a change
+    token = (stat.st_mtime_ns, stat.st_ino)
+    if _profile_rules_cache[0] != token:
+        try:
+            with open(rules_file) as f:
+                _profile_rules_cache = (token, json.load(f))
+        except (OSError, ValueError):
+            return []
+    return [dict(rule) for rule in _profile_rules_cache[1]]
+
+def write_profile_rules(rules):
+    profiles_path = get_profiles_path()
+    os.makedirs(profiles_path, exist_ok=True)
+    rules_file = os.path.join(profiles_path, PROFILE_RULES_FILE)
+    if not rules:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(rules_file)
+        return
+    tmp_file = f"{rules_file}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(rules, f)
+    os.replace(tmp_file, rules_file)
+
+def profile_rule_matches(rule, endpoint, session_id):
+    if rule.get("session_id") and rule["session_id"] != session_id:
+        return False
+    if rule.get("endpoint") and rule["endpoint"] != endpoint:
+        return False
+    return time.time() < rule["expires_at"]
+
+def claim_profile_slot(endpoint, session_id):
+    """Take one request from the first matching rule, across all workers; returns the rule or None"""
+    with file_lock(os.path.join(get_profiles_path(), "rules.lock")):
+        rules = [rule for rule in read_profile_rules() if time.time() < rule["expires_at"]]
+        claimed = None
+        for rule in rules:
+            if profile_rule_matches(rule, endpoint, session_id):
+                rule["remaining"] -= 1
+                claimed = rule
+                break
+        write_profile_rules([rule for rule in rules if rule["remaining"] > 0])
+    return claimed
+
+@app.before_request
+def start_request_profile():
+    rules = read_profile_rules()
+    if not rules or (request.endpoint or "").startswith("admin_"):
+        return
+    session_id = (request.view_args or {}).get("session_id")
+    if not any(profile_rule_matches(rule, request.endpoint, session_id) for rule in rules):
+        return
+    # Requests arriving while another one is profiled in this worker are not profiled and use no slot
+    if not _profile_lock.acquire(blocking=False):
+        return
+    rule = claim_profile_slot(request.endpoint, session_id)
+    if rule is None:
+        _profile_lock.release()
+        return
+    
+    if rule.get("tracemalloc"):
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        request.profile_snapshot = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    request.profile = (rule, session_id, profiler, time.perf_counter())
+    profiler.enable()
+
+@app.teardown_request
+def finish_request_profile(exc=None):
+    state = getattr(request, "profile", None)
+    if state is None:
+        return
+    rule, session_id, profiler, started = state
+    profiler.disable()
+    request.profile = None
+    try:
+        snapshot = None
+        if rule.get("tracemalloc"):
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        save_profile_report(rule, session_id, profiler, time.perf_counter() - started,
+                            request.profile_snapshot if snapshot else None, snapshot,
+                            peak if snapshot else 0)
+    except Exception as e:
+        print(f"Error saving request profile: {e}")
+    finally:
+        _profile_lock.release()
+
+def save_profile_report(rule, session_id, profiler, elapsed_s, start_snapshot, end_snapshot, peak_bytes):
+    """Write the raw cProfile stats (.prof) and a readable summary (.txt) for one profiled request"""
+    profiles_path = get_profiles_path()
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{request.endpoint}_{rule['id']}"
+    profiler.dump_stats(os.path.join(profiles_path, f"{name}.prof"))
+    
+    report = io.StringIO()
+    report.write(f"{request.method} {request.path}\n")
+    report.write(f"Session: {session_id or '-'}  Rule: {rule['id']}  Worker pid: {os.getpid()}\n")
+    report.write(f"Wall time: {elapsed_s * 1000:.1f} ms\n\n")
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats("cumulative").print_stats(40)
+    stats.sort_stats("tottime").print_stats(20)
+    if end_snapshot is not None:
+        report.write(f"\nPeak traced memory: {peak_bytes / 1024 ** 2:.1f} MB\n")
+        report.write("Top allocations made during the request (by line):\n")
+        skip = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = end_snapshot.filter_traces(skip).compare_to(start_snapshot.filter_traces(skip), "lineno")
+        for difference in differences[:25]:
+            report.write(f"  {difference}\n")
+    with open(os.path.join(profiles_path, f"{name}.txt"), "w") as f:
+        f.write(report.getvalue())
+    
+    artifacts = sorted(Path(profiles_path).glob("*.prof"))
+    for old in artifacts[:max(0, len(artifacts) - PROFILE_MAX_ARTIFACTS)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".txt").unlink(missing_ok=True)
+
+def require_admin(view):
+    """Reject requests without the ADMIN_TOKEN; all admin endpoints are off when it is unset"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled; set ADMIN_TOKEN to enable them"}), 403
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+            return jsonify({"error": "Invalid admin token"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
 # MongoDB connection - Load from environment variable
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 
@@ -60,6 +450,8 @@ try:
     db = client["enhanced_chatbot"]
     sessions_collection = db["sessions"]
     conversations_collection = db["conversations"]
+    summaries_collection = db["conversation_summaries"]
+    versions_collection = db["versions"]
 except Exception as e:
     print(f"MongoDB connection failed: {e}")
     print("Falling back to local file storage...")
@@ -77,6 +469,7 @@ except Exception as e:
             self.query = query or {}
             self._sort_field = None
             self._sort_order = 1
+            self._skip_count = 0
             self._limit_count = None
         
         def sort(self, field, order=1):
@@ -84,6 +477,10 @@ except Exception as e:
             self._sort_order = order
             return self
         
+        def skip(self, count):
+            self._skip_count = count
+            return self
+        
         def limit(self, count):
             self._limit_count = count
             return self
@@ -102,7 +499,9 @@ except Exception as e:
                     reverse=(self._sort_order == -1)
                 )
             
-            # Apply limit if specified
+            # Apply skip and limit if specified
+            if self._skip_count:
+                filtered_data = filtered_data[self._skip_count:]
             if self._limit_count:
                 filtered_data = filtered_data[:self._limit_count]
             
@@ -138,13 +537,20 @@ except Exception as e:
         def find(self, query=None, projection=None):
             return LocalQuery(self.data, query)
         
-        def update_one(self, query, update):
+        def update_one(self, query, update, upsert=False):
             for doc in self.data:
                 if all(doc.get(k) == v for k, v in query.items()):
                     if '$set' in update:
                         doc.update(update['$set'])
+                    for k, v in update.get('$inc', {}).items():
+                        doc[k] = doc.get(k, 0) + v
                     self._save_data()
                     return doc
+            if upsert:
+                doc = dict(query)
+                doc.update(update.get('$set', {}))
+                doc.update(update.get('$inc', {}))
+                return self.insert_one(doc)
             return None
         
         def delete_many(self, query):
@@ -164,12 +570,15 @@ except Exception as e:
     db = LocalDB()
     sessions_collection = db["sessions"]
     conversations_collection = db["conversations"]
+    summaries_collection = db["conversation_summaries"]
+    versions_collection = db["versions"]
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Initialize embeddings model
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -183,6 +592,12 @@ def get_documents_path(session_id):
 def get_vector_store_path(session_id):
     return os.path.join(get_session_path(session_id), "faiss_index")
 
+def get_uploads_path(session_id):
+    return os.path.join(get_session_path(session_id), "uploads")
+
+def get_chunk_cache_path(session_id):
+    return os.path.join(get_session_path(session_id), "chunk_cache")
+
 def create_session_directories(session_id):
     session_path = get_session_path(session_id)
     documents_path = get_documents_path(session_id)
@@ -194,30 +609,394 @@ def create_session_directories(session_id):
     
     return session_path, documents_path, vector_store_path
 
+@contextlib.contextmanager
+def file_lock(lock_path, blocking=True):
+    """Hold an exclusive lock on ``lock_path`` across processes (gunicorn workers)
+    
+    Yields True once the lock is held. With ``blocking=False`` it yields False instead of waiting
+    when another process holds the lock.
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Session configuration cache
+# Each worker keeps session documents for SESSION_CACHE_TTL seconds. Every write goes through
+# update_session(), which replaces the session's version file; the file's identity is part of the
+# cache key, so other workers notice the change on their next lookup with a single stat() call.
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+def get_session_version_path(session_id):
+    return os.path.join(get_session_path(session_id), "session.version")
+
+def _session_version_token(session_id):
+    try:
+        stat = os.stat(get_session_version_path(session_id))
+        return (stat.st_ino, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+def bump_session_version(session_id):
+    """Signal all workers that the session document changed"""
+    version_path = get_session_version_path(session_id)
+    if not os.path.isdir(os.path.dirname(version_path)):
+        return
+    tmp_path = f"{version_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(datetime.utcnow().isoformat())
+    # Replacing the file gives it a new inode, which changes the token even on coarse-mtime filesystems
+    os.replace(tmp_path, version_path)
+
+def get_versions_path(session_id=None):
+    """Change counters of one session, or the global counters file when ``session_id`` is None"""
+    if session_id is None:
+        return os.path.join(UPLOAD_FOLDER, f"_{VERSIONS_FILE}")
+    return os.path.join(get_session_path(session_id), VERSIONS_FILE)
+
+def read_versions(session_id=None):
+    try:
+        with open(get_versions_path(session_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def bump_versions(session_id, *kinds):
+    """Advance a session's change counters for ``kinds`` (session, documents, conversations, index)
+    
+    The global ``sessions`` counter, which covers the session list, is advanced as well. Each file
+    gets a random epoch on creation so that counters restarting from zero never repeat an ETag.
+    In multi-node mode the session list shows changes made on every node, so its counter is also
+    kept in the shared database.
+    """
+    if CLUSTER_ENABLED:
+        try:
+            versions_collection.update_one({"name": "sessions"}, {"$inc": {"version": 1}}, upsert=True)
+        except Exception as e:
+            print(f"Error advancing the shared sessions version: {e}")
+    for versions_path, names in ((get_versions_path(session_id), kinds), (get_versions_path(), ("sessions",))):
+        if not os.path.isdir(os.path.dirname(versions_path)):
+            continue
+        with file_lock(f"{versions_path}.lock"):
+            try:
+                with open(versions_path) as f:
+                    versions = json.load(f)
+            except (OSError, ValueError):
+                versions = {"epoch": uuid.uuid4().hex}
+            for name in names:
+                versions[name] = versions.get(name, 0) + 1
+            tmp_path = f"{versions_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(versions, f)
+            os.replace(tmp_path, versions_path)
+
+def read_shared_sessions_version():
+    """The session list's counter in the shared database (multi-node mode), or None if it cannot be read"""
+    try:
+        versions = versions_collection.find_one({"name": "sessions"}) or {}
+    except Exception as e:
+        print(f"Error reading the shared sessions version: {e}")
+        return None
+    # A re-created document gets a new _id, so a counter restarting from zero never repeats an ETag
+    return [str(versions.get("_id")), versions.get("version", 0)]
+
+def make_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    """A 304 response if the request's If-None-Match already names ``etag``, otherwise None"""
+    # Gzipped responses carry the same tag with a -gzip suffix (see compress_response)
+    tags = {tag[:-5] if tag.endswith("-gzip") else tag for tag in request.if_none_match.as_set()}
+    if etag in tags or request.if_none_match.star_tag:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # Always revalidate; a 304 costs no body
+    return response
+
+def invalidate_session_cache(session_id):
+    with _session_cache_lock:
+        _session_cache.pop(session_id, None)
+
+def get_session(session_id):
+    """Return the session document, served from the per-process cache when still valid
+    
+    The returned dict is shared with the cache and must not be modified by callers.
+    """
+    token = _session_version_token(session_id)
+    now = time.monotonic()
+    with _session_cache_lock:
+        cached = _session_cache.get(session_id)
+    if cached and cached[1] == token and now - cached[2] < SESSION_CACHE_TTL:
+        return cached[0]
+    
+    session_data = sessions_collection.find_one({"session_id": session_id})
+    if session_data is not None:
+        with _session_cache_lock:
+            _session_cache[session_id] = (session_data, token, now)
+    else:
+        invalidate_session_cache(session_id)
+    return session_data
+
+def update_session(session_id, fields):
+    """Write-through update of a session document"""
+    result = sessions_collection.update_one({"session_id": session_id}, {"$set": fields})
+    invalidate_session_cache(session_id)
+    bump_session_version(session_id)
+    bump_versions(session_id, "session")
+    return result
+
+def build_system_prompt(session_data, custom_prompt=None):
+    """Final system prompt = predefined + user instructions"""
+    user_prompt = ""
+    if session_data and session_data.get("custom_prompt"):
+        user_prompt = session_data["custom_prompt"]
+    elif custom_prompt:
+        user_prompt = custom_prompt
+
+    if user_prompt:
+        return f"{DEFAULT_SYSTEM_PROMPT}\n\nCustom Instructions:\n{user_prompt}"
+    return DEFAULT_SYSTEM_PROMPT
+
 def load_docx(file_path):
-    """Load content from DOCX file"""
+    """Load content from DOCX file, keeping headings and tables in document order"""
     try:
         docx_file = DocxDocument(file_path)
-        full_text = "\n".join([para.text for para in docx_file.paragraphs])
+        # Resolving paragraph.style searches the style part every time; look names up once
+        style_names = {style.style_id: style.name or "" for style in docx_file.styles}
+        blocks = []
+        for element in docx_file.element.body.iterchildren():
+            if element.tag == qn("w:p"):
+                text = Paragraph(element, docx_file).text.strip()
+                if not text:
+                    continue
+                style = style_names.get(element.style, "")
+                if style.startswith("Heading") or style == "Title":
+                    text = f"# {text}"
+                blocks.append(text)
+            elif element.tag == qn("w:tbl"):
+                rows = docx_table_rows(Table(element, docx_file))
+                if rows:
+                    blocks.append("\n".join(rows))
+        full_text = "\n\n".join(blocks)
         return [Document(page_content=full_text, metadata={"source": file_path})]
     except Exception as e:
         print(f"Error loading DOCX file {file_path}: {e}")
         return []
 
+def docx_table_rows(table):
+    """One line per table row; when the first row is a header, cells read ``Header: value``"""
+    rows = []
+    for row in table.rows:
+        cells = []
+        previous = None
+        for cell in row.cells:
+            # Merged cells are returned once per grid column
+            if cell._tc is previous:
+                continue
+            previous = cell._tc
+            cells.append(" ".join(cell.text.split()))
+        if any(cells):
+            rows.append(cells)
+    if len(rows) > 1 and all(rows[0]):
+        header = rows[0]
+        lines = [" | ".join(header)]
+        for cells in rows[1:]:
+            pairs = [f"{name}: {value}" for name, value in zip(header, cells) if value]
+            lines.append(" | ".join(pairs + [value for value in cells[len(header):] if value]))
+        return lines
+    return [" | ".join(cell for cell in cells if cell) for cells in rows]
+
+class JsonRecordReader:
+    """Walk a JSON document and yield (path, value) records without loading the whole file
+    
+    Array elements are records (``$.products[123]``). Objects on the way to them are walked
+    too, and their scalar fields are grouped into one record under the object's path. Only
+    one record is decoded at a time, so memory is bounded by the largest record.
+    """
+    
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+    _NUMBER_CHARS = re.compile(r"[0-9.eE+-]*")
+    _IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+    MAX_OBJECT_DEPTH = 2  # Deeper objects are kept whole inside their record
+    
+    def __init__(self, file_obj, read_size=STREAM_BLOCK_SIZE):
+        self._file = file_obj
+        self._read_size = read_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+    
+    def __iter__(self):
+        char = self._peek()
+        if char == "[":
+            yield from self._walk_array("$")
+        elif char == "{":
+            yield from self._walk_object("$", 0)
+        elif char:
+            yield "$", self._decode()
+    
+    def _fill(self, size):
+        """Append up to ``size`` more characters, dropping what has been consumed"""
+        data = self._file.read(size)
+        if not data:
+            self._eof = True
+            return
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+    
+    def _peek(self):
+        """Skip whitespace and return the next character, or "" at the end of the input"""
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                return ""
+            self._fill(self._read_size)
+    
+    def _decode(self):
+        """Decode one complete value at the cursor, reading more input until it is complete"""
+        size = self._read_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number is complete only once a character that cannot continue it follows: "12" or
+                # "12." at the buffer end may be the start of "12.99", and "1.5" of "1.5e3"
+                complete = (self._eof or isinstance(value, bool) or not isinstance(value, (int, float))
+                            or self._NUMBER_CHARS.match(self._buffer, end).end() < len(self._buffer))
+                if complete:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill(size)
+            size *= 2  # Large records take a few reads, not one per block
+    
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self._pos} of the current JSON block")
+        self._pos += 1
+    
+    def _child_path(self, path, key):
+        return f"{path}.{key}" if self._IDENTIFIER.match(key) else f"{path}[{json.dumps(key)}]"
+    
+    def _walk_array(self, path):
+        self._expect("[")
+        index = 0
+        while True:
+            char = self._peek()
+            if char == "]":
+                self._pos += 1
+                return
+            if char == ",":
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError("Unexpected end of JSON input")
+            yield f"{path}[{index}]", self._decode()
+            index += 1
+    
+    def _walk_object(self, path, depth):
+        self._expect("{")
+        fields = {}
+        while True:
+            char = self._peek()
+            if char == "}":
+                self._pos += 1
+                break
+            if char == ",":
+                self._pos += 1
+                continue
+            if not char:
+                raise ValueError("Unexpected end of JSON input")
+            key = self._decode()
+            self._expect(":")
+            child_path = self._child_path(path, str(key))
+            char = self._peek()
+            if char == "[" and self._array_of_containers():
+                yield from self._walk_array(child_path)
+            elif char == "{" and depth < self.MAX_OBJECT_DEPTH:
+                yield from self._walk_object(child_path, depth + 1)
+            else:
+                fields[key] = self._decode()
+                if len(fields) >= JSON_MAX_FIELDS:
+                    yield path, fields
+                    fields = {}
+        if fields:
+            yield path, fields
+    
+    def _array_of_containers(self):
+        """True if the array at the cursor starts with an object or array (lists of scalars stay one field)"""
+        start = self._pos + 1
+        while True:
+            end = self._WHITESPACE.match(self._buffer, start).end()
+            if end < len(self._buffer) or self._eof:
+                return end < len(self._buffer) and self._buffer[end] in "[{"
+            offset = start - self._pos
+            self._fill(self._read_size)
+            start = self._pos + offset
+
+def flatten_json(value, prefix=""):
+    """Compact ``a.b: value`` lines for a JSON value, instead of pretty-printed JSON"""
+    if isinstance(value, dict):
+        lines = []
+        for key, item in value.items():
+            lines.extend(flatten_json(item, f"{prefix}.{key}" if prefix else str(key)))
+        return lines
+    if isinstance(value, list):
+        if any(isinstance(item, (dict, list)) for item in value):
+            lines = []
+            for index, item in enumerate(value):
+                lines.extend(flatten_json(item, f"{prefix}[{index}]"))
+            return lines
+        if not value:
+            return []
+        text = ", ".join(_json_scalar(item) for item in value)
+    else:
+        text = _json_scalar(value)
+    return [f"{prefix}: {text}" if prefix else text]
+
+def _json_scalar(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def iter_json_documents(file_path):
+    """Yield one Document per JSON record (or JSON-lines line) with its path as metadata"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        if Path(file_path).suffix.lower() == ".jsonl":
+            records = ((f"$[{line_number}]", json.loads(line))
+                       for line_number, line in enumerate(f) if line.strip())
+        else:
+            records = JsonRecordReader(f)
+        for path, value in records:
+            content = "\n".join(flatten_json(value))
+            if content.strip():
+                yield Document(page_content=content, metadata={"source": file_path, "json_path": path})
+
 def load_json_file(file_path):
     """Load content from JSON file"""
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        if isinstance(data, dict):
-            content = json.dumps(data, indent=2)
-        elif isinstance(data, list):
-            content = "\n".join([json.dumps(item, indent=2) for item in data])
-        else:
-            content = str(data)
-            
-        return [Document(page_content=content, metadata={"source": file_path})]
+        return list(iter_json_documents(file_path))
     except Exception as e:
         print(f"Error loading JSON file {file_path}: {e}")
         return []
@@ -235,7 +1014,7 @@ def process_document(file_path):
             return loader.load()
         elif file_extension == '.docx':
             return load_docx(file_path)
-        elif file_extension == '.json':
+        elif file_extension in JSON_EXTENSIONS:
             return load_json_file(file_path)
         else:
             print(f"Unsupported file type: {file_extension}")
@@ -244,153 +1023,2850 @@ def process_document(file_path):
         print(f"Error processing document {file_path}: {e}")
         return []
 
-def build_vector_store_for_session(session_id):
+class StructuredChunker:
+    """Single-pass chunker that cuts at headings, pages, paragraphs and table rows
+    
+    Text is read as blocks separated by blank lines. A ``#`` line or a short all-caps line is a
+    heading and starts a new chunk; a form feed is a page break. Blocks are packed whole up to
+    ``chunk_size``. Only a block longer than that is split, by lines, then sentences, then
+    words, with ``chunk_overlap`` repeated between its pieces.
+    """
+    
+    _BLOCK_BREAK = re.compile(r"\s*\f\s*|\n[ \t]*\n\s*")
+    _SPLITTERS = (re.compile(r"\n"), re.compile(r"(?<=[.!?])\s+"), re.compile(r"\s+"))
+    _JOINERS = ("\n", " ", " ")
+    _TOKEN = re.compile(r"\w+|[^\w\s]")
+    
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, unit=CHUNK_SIZE_UNIT):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.unit = unit
+    
+    def length(self, text):
+        if self.unit == "tokens":
+            return len(self._TOKEN.findall(text))
+        return len(text)
+    
+    @staticmethod
+    def is_heading(block):
+        return block.startswith("#") or ("\n" not in block and len(block) <= 80 and block.isupper())
+    
+    def split_text(self, text, section=""):
+        """Return (chunk, section) pairs; ``section`` is the heading in effect where ``text`` starts"""
+        # The streaming chunker fed everything at once, so streamed and whole-file chunks cannot differ
+        return StreamingTextChunker(self, {"section": section})._feed(text, final=True)
+    
+    def _pieces(self, text, level):
+        """Break an oversized text into (piece, joiner, length) parts that each fit a chunk"""
+        parts = []
+        for part in self._SPLITTERS[level].split(text):
+            part = part.strip()
+            if not part:
+                continue
+            length = self.length(part)
+            if length > self.chunk_size and level + 1 < len(self._SPLITTERS):
+                parts.extend(self._pieces(part, level + 1))
+            else:
+                parts.append((part, self._JOINERS[level], length))
+        return parts
+    
+    def _pack(self, packing, piece):
+        """Add a piece to ``packing`` ([pieces, length]); returns the chunk the piece closed, if any"""
+        closed = None
+        joiner_length = 0 if self.unit == "tokens" else 1
+        current, current_length = packing  # The length includes one joiner per piece, so it never undercounts
+        if current and current_length + piece[2] > self.chunk_size:
+            closed = self._join(current)
+            # Carry the tail of the previous chunk over, up to chunk_overlap
+            overlap = []
+            overlap_length = 0
+            for previous in reversed(current):
+                if overlap_length + previous[2] + joiner_length > self.chunk_overlap:
+                    break
+                overlap.insert(0, previous)
+                overlap_length += previous[2] + joiner_length
+            current, current_length = overlap, overlap_length
+        current.append(piece)
+        packing[:] = [current, current_length + piece[2] + joiner_length]
+        return closed
+    
+    @staticmethod
+    def _join(pieces):
+        text = pieces[0][0]
+        for piece, joiner, _ in pieces[1:]:
+            text += joiner + piece
+        return text
+    
+    def split_documents(self, documents):
+        """Chunk each Document on its own; chunks keep its metadata plus the section heading"""
+        chunks = []
+        for doc in documents:
+            for text, section in self.split_text(doc.page_content):
+                metadata = dict(doc.metadata)
+                if section:
+                    metadata["section"] = section
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+class StreamingTextChunker:
+    """Chunk text that arrives in parts exactly as StructuredChunker.split_text chunks it whole
+    
+    A block is chunked once the break after it has arrived. A block that grows past ``max_buffer``
+    without one must be longer than a chunk, so it is cut as it arrives, at the lines, sentences and
+    words where _pieces would cut it, and packed the same way. ``state()`` is small and JSON-serializable,
+    so uploads persist it between parts.
+    """
+    
+    def __init__(self, chunker=None, state=None):
+        self.chunker = chunker or StructuredChunker()
+        state = state or {}
+        self.buffer = state.get("buffer", "")  # Text of the unfinished block
+        self.section = state.get("section", "")
+        self.current = state.get("current", [])  # Blocks of the chunk being filled
+        self.current_length = state.get("current_length", 0)
+        # The oversized block being cut, if any: its packing, the split level its unfinished text is
+        # at (0 lines, 1 sentences, 2 words) and headings still to be put in front of its first chunk
+        self.block = state.get("block")
+        # A block without blank lines is only cut once it is this long
+        self.max_buffer = max(self.chunker.chunk_size * (8 if self.chunker.unit == "tokens" else 1) * 4, 4096)
+    
+    def state(self):
+        return {"buffer": self.buffer, "section": self.section, "current": self.current,
+                "current_length": self.current_length, "block": self.block}
+    
+    def feed(self, text, final=False):
+        """Add text and return the (chunk, section) pairs that are now complete; ``final`` flushes the rest
+        
+        Line endings are normalized like a text-mode file read, as TextLoader reads whole files.
+        """
+        text = self.buffer + text
+        self.buffer = ""
+        pending_cr = not final and text.endswith("\r")  # Maybe the first half of a \r\n
+        if pending_cr:
+            text = text[:-1]
+        chunks = self._feed(text.replace("\r\n", "\n").replace("\r", "\n"), final)
+        if pending_cr:
+            self.buffer += "\r"
+        return chunks
+    
+    def flush(self):
+        """Return whatever is left as the final chunks"""
+        return self.feed("", final=True)
+    
+    def _feed(self, text, final):
+        chunks = []
+        position = 0
+        for match in self.chunker._BLOCK_BREAK.finditer(text):
+            if match.end() == len(text) and not final:
+                break  # More whitespace, or a form feed, may still extend this break
+            self._add_block(text[position:match.start()], chunks, complete=True)
+            position = match.end()
+            if "\f" in match.group() and self.current:
+                # Never carry a chunk across a page break
+                self._flush_current(chunks)
+        self.buffer = self._add_block(text[position:], chunks, complete=final)
+        if final and self.current:
+            self._flush_current(chunks)
+        return chunks
+    
+    def _flush_current(self, chunks):
+        chunks.append(("\n\n".join(self.current), self.section))
+        self.current, self.current_length = [], 0
+    
+    def _add_block(self, text, chunks, complete):
+        """Chunk a block; returns the part of an unfinished block that has to wait for more text"""
+        chunker = self.chunker
+        if self.block is None:
+            block = text.strip()
+            if not complete:
+                # A heading stays whole; other blocks are cut once they are known to be oversized
+                if (len(text) <= self.max_buffer or chunker.is_heading(block)
+                        or chunker.length(block) <= chunker.chunk_size):
+                    return text
+                self._start_oversized_block(chunks)
+            elif not block:
+                return ""
+            else:
+                if chunker.is_heading(block):
+                    if self.current:
+                        self._flush_current(chunks)
+                    self.section = block.lstrip("#").strip()
+                length = chunker.length(block)
+                separator_length = 0 if chunker.unit == "tokens" else 2
+                if length > chunker.chunk_size:
+                    self._start_oversized_block(chunks)
+                elif self.current and self.current_length + separator_length + length > chunker.chunk_size:
+                    self._flush_current(chunks)
+                    self.current, self.current_length = [block], length
+                    return ""
+                else:
+                    self.current_length += (separator_length if self.current else 0) + length
+                    self.current.append(block)
+                    return ""
+        
+        pieces, rest, self.block["level"] = self._stream_pieces(text, 0, self.block["level"], complete)
+        for piece in pieces:
+            closed = chunker._pack(self.block["packing"], piece)
+            if closed is not None:
+                chunks.append((self._with_headings(closed), self.section))
+        if not complete:
+            return rest
+        # The last piece can still share a chunk with the blocks that follow
+        last = self._with_headings(chunker._join(self.block["packing"][0]))
+        self.current, self.current_length = [last], chunker.length(last)
+        self.block = None
+        return ""
+    
+    def _start_oversized_block(self, chunks):
+        headings = []
+        if self.current and all(self.chunker.is_heading(item) for item in self.current):
+            # Keep a heading with the text it introduces
+            headings = self.current
+        elif self.current:
+            self._flush_current(chunks)
+        self.block = {"packing": [[], 0], "level": 0, "headings": headings}
+        self.current, self.current_length = [], 0
+    
+    def _with_headings(self, chunk):
+        if self.block["headings"]:
+            chunk = "\n\n".join(self.block["headings"] + [chunk])
+            self.block["headings"] = []
+        return chunk
+    
+    def _stream_pieces(self, text, level, open_level, complete):
+        """Cut ``text`` into _pieces' pieces as far as text still to come cannot change them
+        
+        ``text`` starts inside a unit already being split at ``open_level`` (the unit itself was
+        split at ``level``). Returns (pieces, unconsumed rest, the level the rest is split at).
+        """
+        chunker = self.chunker
+        # A separator in the whitespace at the end may still grow, or turn out to be part of a block break
+        content_end = len(text) if complete else len(text.rstrip())
+        separators = [match for match in chunker._SPLITTERS[level].finditer(text) if match.start() < content_end]
+        pieces = []
+        bounds = [0] + [position for match in separators for position in (match.start(), match.end())] + [len(text)]
+        segments = [text[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds), 2)]
+        for index, segment in enumerate(segments):
+            is_last = index == len(segments) - 1
+            if index == 0 and open_level > level:
+                # The rest of a unit whose splitting started in an earlier part
+                if is_last and not complete:
+                    more, rest, rest_level = self._stream_pieces(segment, level + 1, open_level, False)
+                    return pieces + more, rest, rest_level
+                pieces.extend(self._stream_pieces(segment, level + 1, open_level, True)[0])
+                continue
+            if is_last and not complete:
+                unit = segment.strip()
+                if (len(segment) > self.max_buffer and level + 1 < len(chunker._SPLITTERS)
+                        and chunker.length(unit) > chunker.chunk_size):
+                    # Oversized already, so it will be split one level down; cut that as it arrives
+                    more, rest, rest_level = self._stream_pieces(segment, level + 1, level + 1, False)
+                    return pieces + more, rest, rest_level
+                return pieces, segment, level
+            unit = segment.strip()
+            if not unit:
+                continue
+            length = chunker.length(unit)
+            if length > chunker.chunk_size and level + 1 < len(chunker._SPLITTERS):
+                pieces.extend(chunker._pieces(unit, level + 1))
+            else:
+                pieces.append((unit, chunker._JOINERS[level], length))
+        return pieces, "", level
+
+def file_sha256(file_obj):
+    """SHA-256 of a binary file object, read in blocks; the object is rewound afterwards"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(STREAM_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+def get_document_hashes(session_id):
+    """Map filename -> SHA-256 for the session's documents, hashing only files that changed"""
+    documents_path = get_documents_path(session_id)
+    hashes_path = os.path.join(get_session_path(session_id), DOCUMENT_HASHES_FILE)
+    try:
+        with open(hashes_path, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    
+    entries = {}
+    for file_path in Path(documents_path).glob("*"):
+        if not file_path.is_file():
+            continue
+        stat = file_path.stat()
+        entry = cached.get(file_path.name)
+        if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            with open(file_path, "rb") as f:
+                entry = {"sha256": file_sha256(f), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entries[file_path.name] = entry
+    
+    if entries != cached:
+        tmp_path = f"{hashes_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, hashes_path)
+    return {filename: entry["sha256"] for filename, entry in entries.items()}
+
+class ChunkDeduplicator:
+    """Near-duplicate detection for chunk texts with MinHash signatures and LSH banding
+    
+    Each text is reduced to word shingles, hashed into a MinHash signature, and bucketed by
+    band. Only texts sharing a bucket are compared, so a build stays linear in chunk count.
+    """
+    
+    _PRIME = (1 << 31) - 1
+    
+    def __init__(self, threshold=CHUNK_DEDUP_THRESHOLD, permutations=MINHASH_PERMUTATIONS,
+                 bands=MINHASH_BANDS, shingle_size=SHINGLE_SIZE):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(1)  # Fixed seed so signatures are comparable across builds
+        self._a = rng.integers(1, self._PRIME, size=(permutations, 1), dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, size=(permutations, 1), dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+        self.skipped = 0
+    
+    def signature(self, text):
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes + self._b) % self._PRIME).min(axis=1)
+    
+    def is_duplicate(self, text):
+        """True if ``text`` nearly matches a text seen before; otherwise remember it and return False"""
+        signature = self.signature(text)
+        if signature is None:
+            return False
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                self.skipped += 1
+                return True
+        
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return False
+
+def build_vector_store_for_session(session_id, stats=None):
     """Build or rebuild vector store for a specific session"""
     documents_path = get_documents_path(session_id)
     vector_store_path = get_vector_store_path(session_id)
     
-    # Load all documents in the session's documents folder
+    # Load all documents in the session's documents folder; streamed uploads come with their
+    # chunks already embedded, everything else is parsed, split and embedded here
+    dedup = ChunkDeduplicator() if CHUNK_DEDUP_ENABLED else None
     all_docs = []
+    chunks = []
+    vector_parts = []
     for file_path in Path(documents_path).glob("*"):
         if file_path.is_file() and allowed_file(file_path.name):
-            docs = process_document(str(file_path))
+            cached = load_chunk_cache(session_id, file_path)
+            if not cached and file_path.suffix.lower() in JSON_EXTENSIONS:
+                with INGEST_STAGE_SECONDS.labels("json_stream").time():
+                    cached = embed_json_document(session_id, file_path)
+                if not cached:
+                    continue
+            if cached:
+                cached_chunks, cached_vectors = cached
+                if dedup:
+                    keep = [not dedup.is_duplicate(chunk.page_content) for chunk in cached_chunks]
+                    cached_chunks = [chunk for chunk, kept in zip(cached_chunks, keep) if kept]
+                    cached_vectors = cached_vectors[np.asarray(keep, dtype=bool)]
+                chunks.extend(cached_chunks)
+                vector_parts.append(cached_vectors)
+                continue
+            with INGEST_STAGE_SECONDS.labels("parse").time():
+                docs = process_document(str(file_path))
             all_docs.extend(docs)
     
-    if not all_docs:
+    if not all_docs and not chunks:
         print(f"No documents found for session {session_id}")
+        if SHARED_INDEX_ENABLED:
+            get_shared_index().remove_session(session_id)
         return False
     
     # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50
-    )
-    chunks = text_splitter.split_documents(all_docs)
+    with INGEST_STAGE_SECONDS.labels("chunk").time():
+        new_chunks = StructuredChunker().split_documents(all_docs)
+        if dedup:
+            # Drop near-duplicates before embedding so they cost neither compute nor index space
+            new_chunks = [chunk for chunk in new_chunks if not dedup.is_duplicate(chunk.page_content)]
+    if stats is not None:
+        stats["duplicate_chunks_skipped"] = dedup.skipped if dedup else 0
     
     # Create vector store
+    session_data = get_session(session_id) or {}
     try:
-        vector_store = FAISS.from_documents(chunks, embeddings)
-        vector_store.save_local(vector_store_path)
-        print(f"Vector store built for session {session_id} with {len(chunks)} chunks")
+        if new_chunks:
+            texts = [chunk.page_content for chunk in new_chunks]
+            with INGEST_STAGE_SECONDS.labels("embed").time():
+                vector_parts.append(np.asarray(embeddings.embed_documents(texts), dtype="float32"))
+            chunks.extend(new_chunks)
+        vectors = np.concatenate(vector_parts)
+        vector_parts.clear()  # Unmaps the chunk cache files
+        
+        if use_shared_index(len(chunks), session_data):
+            with INGEST_STAGE_SECONDS.labels("index").time():
+                get_shared_index().put_session(session_id, vectors, chunks)
+                version = publish_index_version(vector_store_path, None)
+            collect_index_versions(vector_store_path)
+            print(f"Vector store built for session {session_id} with {len(chunks)} chunks (shared index, v{version})")
+            return True
+        
+        settings = choose_index_settings(len(chunks), session_data.get("index_settings"), vectors.shape[1])
+        with INGEST_STAGE_SECONDS.labels("index").time():
+            index = create_faiss_index(vectors, settings)
+            version = save_vector_store(vector_store_path, index, chunks, settings)
+        if SHARED_INDEX_ENABLED:
+            # The session outgrew the shared index (or has custom settings); drop its old partition
+            get_shared_index().remove_session(session_id)
+        print(f"Vector store built for session {session_id} with {len(chunks)} chunks "
+              f"({settings['index_type']} index, v{version})")
         return True
     except Exception as e:
         print(f"Error building vector store for session {session_id}: {e}")
         return False
 
-def load_vector_store_for_session(session_id):
-    """Load vector store for a specific session"""
-    vector_store_path = get_vector_store_path(session_id)
-    
+def get_build_state_path(session_id):
+    return os.path.join(get_session_path(session_id), "build_state.json")
+
+def read_build_state(session_id):
+    """Per-session build counters shared by all workers"""
+    state = {"requested": 0, "completed": 0, "builds": 0, "coalesced": 0}
     try:
-        if os.path.exists(vector_store_path) and os.listdir(vector_store_path):
-            return FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
+        with open(get_build_state_path(session_id), "r") as f:
+            state.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return state
+
+def _update_build_state(session_id, increment=(), **values):
+    """Bump the named counters and set ``values`` under a short lock; returns the new state"""
+    state_path = get_build_state_path(session_id)
+    with file_lock(f"{state_path}.lock"):
+        state = read_build_state(session_id)
+        for key in increment:
+            state[key] += 1
+        state.update(values)
+        tmp_path = f"{state_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    return state
+
+def request_vector_store_build(session_id, stats=None):
+    """Rebuild a session's vector store, folding concurrent requests into as few builds as possible
+    
+    Each caller takes a ticket, then waits for the session's build lock. A build covers every
+    ticket issued before it started, so a caller whose ticket was covered while it waited returns
+    that build's result instead of building again. Call this after the document changes are on disk.
+    """
+    ticket = _update_build_state(session_id, increment=("requested",))["requested"]
+    with file_lock(os.path.join(get_session_path(session_id), "build.lock")):
+        state = read_build_state(session_id)
+        if state["completed"] >= ticket:
+            _update_build_state(session_id, increment=("coalesced",))
+            if stats is not None:
+                stats.update(state.get("last_stats", {}))
+            return state.get("last_result", False)
+        
+        covered = state["requested"]
+        build_stats = {}
+        with INGEST_STAGE_SECONDS.labels("build").time():
+            result = build_vector_store_for_session(session_id, stats=build_stats)
+        _update_build_state(session_id, increment=("builds",), completed=covered,
+                            last_result=result, last_stats=build_stats)
+        bump_versions(session_id, "index")
+    if stats is not None:
+        stats.update(build_stats)
+    return result
+
+def choose_index_settings(chunk_count, overrides=None, dimension=384):
+    """Pick an index type, compression and their parameters for a corpus of ``chunk_count`` chunks
+    
+    ``overrides`` comes from the session's ``index_settings`` and may force the type and any parameter.
+    """
+    overrides = overrides or {}
+    index_type = overrides.get("index_type") or INDEX_TYPE
+    if index_type == "auto":
+        if chunk_count >= INDEX_IVF_MIN_CHUNKS:
+            index_type = "ivf"
+        elif chunk_count >= INDEX_HNSW_MIN_CHUNKS:
+            index_type = "hnsw"
         else:
-            return None
-    except Exception as e:
-        print(f"Error loading vector store for session {session_id}: {e}")
-        return None
+            index_type = "flat"
+    
+    settings = {"index_type": index_type}
+    if index_type == "ivf":
+        # Rule of thumb: ~4*sqrt(n) centroids, but keep at least 39 training points per centroid
+        nlist = int(overrides.get("nlist") or 4 * int(chunk_count ** 0.5))
+        nlist = max(1, min(nlist, chunk_count // 39 or 1))
+        settings["nlist"] = nlist
+        settings["nprobe"] = max(1, min(int(overrides.get("nprobe") or max(8, nlist // 8)), nlist))
+    elif index_type == "hnsw":
+        settings["hnsw_m"] = int(overrides.get("hnsw_m") or 32)
+        settings["ef_construction"] = int(overrides.get("ef_construction") or 128)
+        settings["ef_search"] = int(overrides.get("ef_search") or 128)
+    
+    compression = overrides.get("compression") or INDEX_COMPRESSION
+    if compression == "pq" and chunk_count < PQ_MIN_CHUNKS:
+        # Too few vectors to train 256 centroids per sub-quantizer; half precision still halves the size
+        compression = "fp16"
+    settings["compression"] = compression
+    if compression == "pq":
+        # Sub-quantizer count must divide the dimension; default to 8 dimensions per 1-byte code
+        pq_m = int(overrides.get("pq_m") or dimension // 8)
+        while dimension % pq_m:
+            pq_m -= 1
+        settings["pq_m"] = pq_m
+        # Candidates re-ranked per requested result; 0 keeps only the PQ codes (smallest, least accurate)
+        rerank_factor = overrides.get("rerank_factor")
+        settings["rerank_factor"] = int(4 if rerank_factor is None else rerank_factor)
+    return settings
 
-def retrieve_context_for_session(session_id, query, k=10):  # Increased to retrieve more relevant chunks
-    """Retrieve context from session-specific vector store"""
-    vector_store = load_vector_store_for_session(session_id)
+def create_faiss_index(vectors, settings):
+    """Create and fill a FAISS index for ``vectors`` according to ``settings``
     
-    if vector_store is None:
-        return ""
+    With ``pq`` compression and a positive ``rerank_factor`` the index is wrapped in IndexRefine:
+    candidates found with the product-quantized codes are re-ranked using half-precision copies of
+    the full vectors, which stay on disk (memory-mapped) until a candidate needs them.
+    """
+    dimension = vectors.shape[1]
+    index_type = settings["index_type"]
+    compression = settings.get("compression", "none")
+    
+    if index_type == "ivf":
+        quantizer = faiss.IndexFlatL2(dimension)
+        if compression == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, settings["nlist"], settings["pq_m"], 8)
+        elif compression == "fp16":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, settings["nlist"],
+                                                  faiss.ScalarQuantizer.QT_fp16)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, settings["nlist"])
+        index.nprobe = settings["nprobe"]
+    elif index_type == "hnsw":
+        if compression == "pq":
+            index = faiss.IndexHNSWPQ(dimension, settings["pq_m"], settings["hnsw_m"])
+        elif compression == "fp16":
+            index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, settings["hnsw_m"])
+        else:
+            index = faiss.IndexHNSWFlat(dimension, settings["hnsw_m"])
+        index.hnsw.efConstruction = settings["ef_construction"]
+        index.hnsw.efSearch = settings["ef_search"]
+    else:
+        if compression == "pq":
+            index = faiss.IndexPQ(dimension, settings["pq_m"], 8)
+        elif compression == "fp16":
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+    
+    if compression == "pq" and settings["rerank_factor"] > 0:
+        index = faiss.IndexRefine(index, faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16))
+        index.k_factor = settings["rerank_factor"]
     
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+def apply_search_settings(index, settings):
+    """Apply search-time parameters (nprobe, efSearch, re-rank factor) recorded in the index metadata"""
+    if settings.get("compression") == "pq" and settings.get("rerank_factor"):
+        index = faiss.downcast_index(index)
+        index.k_factor = settings["rerank_factor"]
+        index = faiss.downcast_index(index.base_index)
+    if settings.get("index_type") == "ivf" and settings.get("nprobe"):
+        faiss.extract_index_ivf(index).nprobe = settings["nprobe"]
+    elif settings.get("index_type") == "hnsw" and settings.get("ef_search"):
+        faiss.downcast_index(index).hnsw.efSearch = settings["ef_search"]
+
+def save_index_meta(vector_store_path, settings, chunk_count, dimension):
+    meta = dict(settings)
+    meta.update({
+        "chunks": chunk_count,
+        "dimension": dimension,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "built_at": datetime.utcnow().isoformat()
+    })
+    tmp_path = os.path.join(vector_store_path, f"{INDEX_META_FILE}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(vector_store_path, INDEX_META_FILE))
+
+def load_index_meta(vector_store_path):
+    """Return the metadata written next to an index, or {} for indexes built before it existed"""
     try:
-        results = vector_store.similarity_search(query, k=k)
-        # No limit on context length since we removed num_ctx limit
-        context_parts = []
-        for doc in results:
-            context_parts.append(doc.page_content)
-        return "\n\n".join(context_parts)
-    except Exception as e:
-        print(f"Error retrieving context for session {session_id}: {e}")
-        return ""
+        with open(os.path.join(vector_store_path, INDEX_META_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-def get_conversation_context(session_id, conversation_id=None, limit=5):  # Increased to 5 exchanges
-    """Get recent conversation context"""
-    query = {"session_id": session_id}
-    if conversation_id:
-        query["conversation_id"] = conversation_id
+def write_chunk_store(chunk_store_path, chunks):
+    """Write chunk text and metadata to SQLite, keyed by the chunk's row in the FAISS index"""
+    connection = sqlite3.connect(chunk_store_path)
+    try:
+        connection.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+        connection.executemany(
+            "INSERT INTO chunks (id, content, metadata) VALUES (?, ?, ?)",
+            ((i, chunk.page_content, json.dumps(chunk.metadata, default=str)) for i, chunk in enumerate(chunks))
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+def read_index_pointer(vector_store_path):
+    """The published version: {"version": n, "directory": "v0000n"}, with directory None when the
+    session lives in the shared index; None if nothing was published yet"""
+    try:
+        with open(os.path.join(vector_store_path, INDEX_POINTER_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def get_published_index_path(vector_store_path):
+    """Directory of the currently published dedicated index, or None"""
+    pointer = read_index_pointer(vector_store_path)
+    if pointer and pointer.get("directory"):
+        return os.path.join(vector_store_path, pointer["directory"])
+    return None
+
+def _next_index_version(vector_store_path):
+    pointer = read_index_pointer(vector_store_path) or {}
+    versions = [int(name[1:]) for name in os.listdir(vector_store_path) if re.fullmatch(r"v\d+", name)]
+    return max(versions + [pointer.get("version", 0)]) + 1
+
+def publish_index_version(vector_store_path, directory, version=None):
+    """Point readers at ``directory`` (None: the shared index) with a single atomic rename"""
+    os.makedirs(vector_store_path, exist_ok=True)
+    if version is None:
+        version = _next_index_version(vector_store_path)
+    tmp_path = os.path.join(vector_store_path, f"{INDEX_POINTER_FILE}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": version, "directory": directory, "published_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp_path, os.path.join(vector_store_path, INDEX_POINTER_FILE))
+    return version
+
+def save_vector_store(vector_store_path, index, chunks, settings):
+    """Write an index, its chunk store and metadata to a new version directory and publish it
     
-    recent_messages = list(conversations_collection.find(query)
-                          .sort("timestamp", -1)
-                          .limit(limit * 2))  # Get more to account for user/bot pairs
+    Everything is written to a staging directory first, so readers only ever see complete
+    versions. Returns the published version number.
+    """
+    os.makedirs(vector_store_path, exist_ok=True)
+    staging_path = os.path.join(vector_store_path, f"staging-{uuid.uuid4().hex}")
+    os.makedirs(staging_path)
+    try:
+        version = _next_index_version(vector_store_path)
+        faiss.write_index(index, os.path.join(staging_path, INDEX_FILE))
+        write_chunk_store(os.path.join(staging_path, CHUNK_STORE_FILE), chunks)
+        save_index_meta(staging_path, dict(settings, version=version), len(chunks), index.d)
+        directory = f"v{version:06d}"
+        # Renaming onto an existing version fails, so two concurrent builds cannot share one
+        os.rename(staging_path, os.path.join(vector_store_path, directory))
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+    publish_index_version(vector_store_path, directory, version)
+    collect_index_versions(vector_store_path)
+    return version
+
+def collect_index_versions(vector_store_path):
+    """Delete superseded versions that no open store still uses, plus staging left by crashed builds"""
+    pointer = read_index_pointer(vector_store_path) or {}
+    try:
+        names = os.listdir(vector_store_path)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(vector_store_path, name)
+        if re.fullmatch(r"v\d+", name) and name != pointer.get("directory"):
+            with file_lock(os.path.join(path, INDEX_READERS_LOCK), blocking=False) as unused:
+                if unused:
+                    shutil.rmtree(path, ignore_errors=True)
+        elif name.startswith("staging-") and time.time() - os.path.getmtime(path) > 3600:
+            shutil.rmtree(path, ignore_errors=True)
+
+class SessionVectorStore:
+    """A memory-mapped FAISS index plus a SQLite chunk store that is read only for search hits
     
-    context = []
-    for msg in reversed(recent_messages):
-        if msg.get("message_type") == "user":
-            # No truncation - include full messages
-            message = msg.get('message', '')
-            context.append(f"User: {message}")
-        elif msg.get("message_type") == "bot":
-            # No truncation - include full messages
-            message = msg.get('message', '')
-            context.append(f"Assistant: {message}")
+    Mapping the index lets every worker share the same pages through the OS page cache, and
+    chunk text never has to be unpickled or held in the heap.
+    """
     
-    return "\n".join(context[-10:])  # Last 5 exchanges (10 messages)
+    def __init__(self, vector_store_path):
+        self.path = vector_store_path
+        # A shared lock for as long as this store is referenced keeps the version from being collected
+        self._readers_lock = open(os.path.join(vector_store_path, INDEX_READERS_LOCK), "a")
+        if fcntl:
+            fcntl.flock(self._readers_lock, fcntl.LOCK_SH)
+        self.meta = load_index_meta(vector_store_path)
+        self.index = read_index_mmap(os.path.join(vector_store_path, INDEX_FILE), self.meta.get("index_type"))
+        apply_search_settings(self.index, self.meta)
+        # Keep the connection open so a rebuild that replaces the file cannot tear an in-use store
+        self._connection = sqlite3.connect(
+            f"file:{os.path.join(vector_store_path, CHUNK_STORE_FILE)}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._holders = 0  # Threads between hold() and release()
+        self._retired = False
+    
+    def hold(self):
+        with self._lock:
+            self._holders += 1
+    
+    def release(self):
+        with self._lock:
+            self._holders -= 1
+            close = self._retired and not self._holders
+        if close:
+            self.close()
+    
+    def retire(self):
+        """Close once the last holder releases; called when the store leaves the worker's cache"""
+        with self._lock:
+            self._retired = True
+            close = not self._holders
+        if close:
+            self.close()
+    
+    def close(self):
+        """Unmap the index, close the chunk store and let go of the version's readers lock"""
+        with self._lock:
+            if self._connection is None:
+                return
+            self._connection.close()
+            self._connection = None
+            self.index = None
+        self._readers_lock.close()
+    
+    def get_chunks(self, ids):
+        """Return {row id: Document} for the requested index rows"""
+        ids = [int(i) for i in ids if i != -1]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+    
+    def search(self, query_vectors, k):
+        """Squared L2 distances and row ids of the ``k`` nearest chunks per query; missing hits are -1"""
+        return self.index.search(np.asarray(query_vectors, dtype="float32"), k)
+    
+    def get_vectors(self, ids):
+        """Stored vectors for index rows (decoded, so approximate for compressed indexes), or None"""
+        ids = np.asarray(ids, dtype="int64")
+        try:
+            return self.index.reconstruct_batch(ids)
+        except RuntimeError:
+            if self.meta.get("index_type") != "ivf":
+                return None
+        # IVF indexes need a row -> list map to reconstruct; build it once for this open store
+        try:
+            faiss.extract_index_ivf(self.index).make_direct_map()
+            return self.index.reconstruct_batch(ids)
+        except RuntimeError:
+            return None
+    
+    def similarity_search_by_vectors(self, query_vectors, k=4):
+        """Search several query vectors at once; returns one list of Documents per query"""
+        _, indices = self.search(query_vectors, k)
+        chunks = self.get_chunks({int(i) for row in indices for i in row})
+        return [[chunks[i] for i in row if i in chunks] for row in indices]
+    
+    def similarity_search(self, query, k=4):
+        query_vector = np.asarray([embeddings.embed_query(query)], dtype="float32")
+        return self.similarity_search_by_vectors(query_vector, k)[0]
 
-def query_llm_with_session(session_id, query, conversation_id=None, custom_prompt=None):
-    """Query LLM with session-specific context and custom prompt"""
-    # Get document context
-    doc_context = retrieve_context_for_session(session_id, query)
+def read_index_mmap(index_file, index_type=None):
+    """Open a FAISS index memory-mapped, falling back to a regular read if the type does not support it"""
+    # IVF keeps vectors in inverted lists (IO_FLAG_MMAP); flat/HNSW storage is flat codes (IO_FLAG_MMAP_IFC)
+    flags = faiss.IO_FLAG_MMAP if index_type == "ivf" else faiss.IO_FLAG_MMAP_IFC
+    try:
+        return faiss.read_index(index_file, flags | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        print(f"Memory-mapped read failed for {index_file}, loading into memory: {e}")
+        return faiss.read_index(index_file)
+
+def migrate_legacy_vector_store(vector_store_path):
+    """Move an index written before versioned publishing into its first version directory
     
-    # Get conversation context
-    conv_context = get_conversation_context(session_id, conversation_id)
+    Stores from LangChain's save_local() (pickled docstore, trusted: this application wrote it)
+    are converted to the SQLite chunk store on the way. Runs once per store.
+    """
+    with file_lock(os.path.join(vector_store_path, "migrate.lock")):
+        if read_index_pointer(vector_store_path) is not None:
+            return
+        legacy_docstore = os.path.join(vector_store_path, "index.pkl")
+        settings = load_index_meta(vector_store_path) or {"index_type": "flat"}
+        if os.path.exists(legacy_docstore) and not os.path.exists(os.path.join(vector_store_path, CHUNK_STORE_FILE)):
+            legacy_store = FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
+            chunks = [legacy_store.docstore.search(legacy_store.index_to_docstore_id[i])
+                      for i in range(legacy_store.index.ntotal)]
+            settings = {key: value for key, value in settings.items()
+                        if key not in ("chunks", "dimension", "embedding_model", "built_at")}
+            save_vector_store(vector_store_path, legacy_store.index, chunks, settings)
+            print(f"Migrated legacy vector store at {vector_store_path} ({len(chunks)} chunks)")
+        else:
+            # Already an mmap/SQLite store, just not versioned: move its files as they are
+            version = _next_index_version(vector_store_path)
+            directory = f"v{version:06d}"
+            os.makedirs(os.path.join(vector_store_path, directory))
+            for filename in (INDEX_FILE, CHUNK_STORE_FILE, INDEX_META_FILE):
+                if os.path.exists(os.path.join(vector_store_path, filename)):
+                    os.rename(os.path.join(vector_store_path, filename),
+                              os.path.join(vector_store_path, directory, filename))
+            publish_index_version(vector_store_path, directory, version)
+        for filename in (INDEX_FILE, CHUNK_STORE_FILE, INDEX_META_FILE, "index.pkl"):
+            if os.path.exists(os.path.join(vector_store_path, filename)):
+                os.remove(os.path.join(vector_store_path, filename))
+
+# Loaded vector stores per worker, most recently used last, guarded by _vector_store_lock
+_vector_store_cache = OrderedDict()
+_vector_store_lock = threading.Lock()
+
+def load_vector_store_for_session(session_id, hold=False):
+    """Load vector store for a specific session
+    
+    With ``hold``, a SessionVectorStore is returned held: it stays open, even if it is evicted from
+    the cache meanwhile, until the caller passes it to release_vector_store().
+    """
+    vector_store_path = get_vector_store_path(session_id)
+    
+    try:
+        if (read_index_pointer(vector_store_path) is None
+                and os.path.exists(os.path.join(vector_store_path, INDEX_FILE))):
+            migrate_legacy_vector_store(vector_store_path)
+        
+        for attempt in range(3):
+            pointer = read_index_pointer(vector_store_path)
+            if not pointer or not pointer.get("directory"):
+                return get_shared_index().get_view(session_id) if SHARED_INDEX_ENABLED else None
+            
+            with _vector_store_lock:
+                cached = _vector_store_cache.get(session_id)
+                if cached and cached[1] == pointer["version"]:
+                    _vector_store_cache.move_to_end(session_id)
+                    if hold:
+                        # Under the cache lock, so the store cannot be retired before it is held
+                        cached[0].hold()
+                    return cached[0]
+            
+            try:
+                vector_store = SessionVectorStore(os.path.join(vector_store_path, pointer["directory"]))
+            except (OSError, RuntimeError, sqlite3.Error):
+                # The version was superseded and collected between reading the pointer and opening it
+                if attempt == 2:
+                    raise
+                continue
+            if hold:
+                vector_store.hold()
+            with _vector_store_lock:
+                replaced = _vector_store_cache.get(session_id)
+                _vector_store_cache[session_id] = (vector_store, pointer["version"])
+                _vector_store_cache.move_to_end(session_id)
+                retired = [replaced[0]] if replaced else []
+                while len(_vector_store_cache) > VECTOR_STORE_CACHE_SIZE:
+                    retired.append(_vector_store_cache.popitem(last=False)[1][0])
+            for store in retired:
+                store.retire()
+            if cached:
+                # This worker just let go of an older version; it may have been the last reader
+                collect_index_versions(vector_store_path)
+            return vector_store
+    except Exception as e:
+        print(f"Error loading vector store for session {session_id}: {e}")
+        return None
+
+def release_vector_store(vector_store):
+    """Release a store returned by load_vector_store_for_session(hold=True)"""
+    if isinstance(vector_store, SessionVectorStore):
+        vector_store.release()
+
+def use_shared_index(chunk_count, session_data):
+    """Small sessions without custom index settings go into the shared index"""
+    return (SHARED_INDEX_ENABLED and chunk_count <= SHARED_INDEX_MAX_CHUNKS
+            and not (session_data or {}).get("index_settings"))
+
+class SharedVectorIndex:
+    """One vector store for many small sessions, partitioned by session id
+    
+    Vectors live in a single append-only float32 file. Each session's vectors are one contiguous
+    row range, so a search reads only that range (exact search, filtered to the calling session).
+    SQLite holds the row ranges and the chunk text. Rebuilding a session appends a new range and
+    leaves the old rows dead; compact() rewrites the file once dead rows outnumber live ones.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.db_path = os.path.join(path, "shared.sqlite")
+        self.lock_path = os.path.join(path, "write.lock")
+        self._vectors = {}  # vectors file name -> (memmap, rows)
+        self._vectors_lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, row_start INTEGER NOT NULL, "
+                "row_count INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (session_id TEXT NOT NULL, position INTEGER NOT NULL, "
+                "content TEXT NOT NULL, metadata TEXT NOT NULL, PRIMARY KEY (session_id, position))"
+            )
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('vectors_file', 'vectors.0.f32')")
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('dead_rows', '0')")
+    
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def _meta(self, connection, key):
+        return connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+    
+    def _file_rows(self, vectors_file, dimension):
+        try:
+            return os.path.getsize(os.path.join(self.path, vectors_file)) // (4 * dimension)
+        except OSError:
+            return 0
+    
+    def put_session(self, session_id, vectors, chunks):
+        """Store (or replace) a session's vectors and chunks"""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with file_lock(self.lock_path), self._connect() as connection:
+            vectors_file = self._meta(connection, "vectors_file")
+            dimension_row = connection.execute("SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+            if dimension_row is None:
+                connection.execute("INSERT INTO meta VALUES ('dimension', ?)", (str(vectors.shape[1]),))
+            elif int(dimension_row[0]) != vectors.shape[1]:
+                raise ValueError(f"Shared index holds {dimension_row[0]}-dim vectors, got {vectors.shape[1]}")
+            
+            row_start = self._file_rows(vectors_file, vectors.shape[1])
+            with open(os.path.join(self.path, vectors_file), "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            
+            previous = connection.execute(
+                "SELECT row_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if previous:
+                dead_rows = int(self._meta(connection, "dead_rows")) + previous[0]
+                connection.execute("UPDATE meta SET value = ? WHERE key = 'dead_rows'", (str(dead_rows),))
+            connection.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+            connection.executemany(
+                "INSERT INTO chunks (session_id, position, content, metadata) VALUES (?, ?, ?, ?)",
+                ((session_id, i, chunk.page_content, json.dumps(chunk.metadata, default=str))
+                 for i, chunk in enumerate(chunks))
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, row_start, row_count) VALUES (?, ?, ?)",
+                (session_id, row_start, len(chunks))
+            )
+        self._maybe_compact()
+    
+    def remove_session(self, session_id):
+        """Delete a session's chunks; its vector rows are reclaimed by the next compaction"""
+        with file_lock(self.lock_path), self._connect() as connection:
+            previous = connection.execute(
+                "SELECT row_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not previous:
+                return False
+            dead_rows = int(self._meta(connection, "dead_rows")) + previous[0]
+            connection.execute("UPDATE meta SET value = ? WHERE key = 'dead_rows'", (str(dead_rows),))
+            connection.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._maybe_compact()
+        return True
+    
+    def session_chunk_counts(self):
+        with self._connect() as connection:
+            return dict(connection.execute("SELECT session_id, row_count FROM sessions").fetchall())
+    
+    def _maybe_compact(self):
+        with self._connect() as connection:
+            dead_rows = int(self._meta(connection, "dead_rows"))
+            live_rows = connection.execute("SELECT COALESCE(SUM(row_count), 0) FROM sessions").fetchone()[0]
+        if dead_rows > max(live_rows, 10000):
+            self.compact()
+    
+    def compact(self):
+        """Rewrite the vectors file without dead rows; readers keep using the old file until they reload"""
+        with file_lock(self.lock_path), self._connect() as connection:
+            old_file = self._meta(connection, "vectors_file")
+            dimension_row = connection.execute("SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+            if dimension_row is None:
+                return
+            dimension = int(dimension_row[0])
+            generation = int(old_file.split(".")[1]) + 1
+            new_file = f"vectors.{generation}.f32"
+            
+            old_vectors = self._open_vectors(old_file, dimension)
+            new_ranges = []
+            row = 0
+            with open(os.path.join(self.path, new_file), "wb") as f:
+                for session_id, row_start, row_count in connection.execute(
+                        "SELECT session_id, row_start, row_count FROM sessions ORDER BY row_start").fetchall():
+                    f.write(np.asarray(old_vectors[row_start:row_start + row_count]).tobytes())
+                    new_ranges.append((row, session_id))
+                    row += row_count
+                f.flush()
+                os.fsync(f.fileno())
+            
+            connection.executemany("UPDATE sessions SET row_start = ? WHERE session_id = ?", new_ranges)
+            connection.execute("UPDATE meta SET value = ? WHERE key = 'vectors_file'", (new_file,))
+            connection.execute("UPDATE meta SET value = '0' WHERE key = 'dead_rows'")
+        
+        # Workers that still map the old file keep their pages until they drop the mapping
+        os.remove(os.path.join(self.path, old_file))
+        print(f"Compacted shared index to {row} rows")
+    
+    def _open_vectors(self, vectors_file, dimension, min_rows=0):
+        """Memory-map the vectors file, remapping when it has grown past the cached mapping"""
+        with self._vectors_lock:
+            cached = self._vectors.get(vectors_file)
+            if cached and cached[1] >= min_rows:
+                return cached[0]
+            rows = self._file_rows(vectors_file, dimension)
+            vectors = np.memmap(os.path.join(self.path, vectors_file), dtype="float32", mode="r",
+                                shape=(rows, dimension))
+            # Only the current generation is worth keeping mapped
+            self._vectors = {vectors_file: (vectors, rows)}
+            return vectors
+    
+    def get_view(self, session_id, retry=True):
+        """Return a searchable view of one session's partition, or None if it is not stored here"""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT s.row_start, s.row_count, m.value, d.value FROM sessions s, meta m, meta d "
+                "WHERE s.session_id = ? AND m.key = 'vectors_file' AND d.key = 'dimension'", (session_id,)
+            ).fetchone()
+        if not row or not row[1]:
+            return None
+        row_start, row_count, vectors_file, dimension = row
+        try:
+            vectors = self._open_vectors(vectors_file, int(dimension), row_start + row_count)
+        except FileNotFoundError:
+            # A compaction replaced the file between reading the ranges and opening it
+            if retry:
+                return self.get_view(session_id, retry=False)
+            raise
+        return SharedSessionView(self, session_id, vectors[row_start:row_start + row_count])
+
+class SharedSessionView:
+    """The part of the shared index that belongs to one session, with the SessionVectorStore search API"""
+    
+    def __init__(self, shared_index, session_id, vectors):
+        self.shared_index = shared_index
+        self.session_id = session_id
+        self.vectors = vectors
+        self.meta = {"index_type": "shared", "chunks": len(vectors)}
+    
+    def get_chunks(self, positions):
+        positions = [int(p) for p in positions if p != -1]
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        with self.shared_index._connect() as connection:
+            rows = connection.execute(
+                f"SELECT position, content, metadata FROM chunks WHERE session_id = ? AND position IN ({placeholders})",
+                [self.session_id] + positions
+            ).fetchall()
+        return {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+    
+    def search(self, query_vectors, k):
+        return faiss.knn(np.asarray(query_vectors, dtype="float32"), np.ascontiguousarray(self.vectors),
+                         min(k, len(self.vectors)))
+    
+    def get_vectors(self, positions):
+        return np.asarray(self.vectors[np.asarray(positions, dtype="int64")], dtype="float32")
+    
+    def similarity_search_by_vectors(self, query_vectors, k=4):
+        _, indices = self.search(query_vectors, k)
+        chunks = self.get_chunks({int(i) for row in indices for i in row})
+        return [[chunks[i] for i in row if i in chunks] for row in indices]
+    
+    def similarity_search(self, query, k=4):
+        query_vector = np.asarray([embeddings.embed_query(query)], dtype="float32")
+        return self.similarity_search_by_vectors(query_vector, k)[0]
+
+_shared_index = None
+
+def get_shared_index():
+    global _shared_index
+    if _shared_index is None:
+        _shared_index = SharedVectorIndex(os.path.join(UPLOAD_FOLDER, SHARED_INDEX_DIR))
+    return _shared_index
+
+def get_index_info(session_id):
+    """Index metadata for /status: the published version's metadata or the session's shared partition"""
+    vector_store_path = get_vector_store_path(session_id)
+    pointer = read_index_pointer(vector_store_path)
+    index_path = get_published_index_path(vector_store_path)
+    meta = load_index_meta(index_path) if index_path else {}
+    if not meta and SHARED_INDEX_ENABLED:
+        chunk_count = get_shared_index().session_chunk_counts().get(session_id)
+        if chunk_count:
+            meta = {"index_type": "shared", "chunks": chunk_count}
+    if meta and pointer:
+        meta["version"] = pointer["version"]
+    return meta
+
+def is_vector_store_ready(session_id, shared_sessions=None):
+    """True if the session has a dedicated index or a partition in the shared index"""
+    vector_store_path = get_vector_store_path(session_id)
+    if get_published_index_path(vector_store_path) or os.path.exists(os.path.join(vector_store_path, INDEX_FILE)):
+        return True
+    if SHARED_INDEX_ENABLED:
+        if shared_sessions is None:
+            shared_sessions = get_shared_index().session_chunk_counts()
+        return session_id in shared_sessions
+    return False
+
+def get_archive_path(session_id):
+    return os.path.join(UPLOAD_FOLDER, ARCHIVE_DIR, f"{session_id}.tar.gz")
+
+def get_activity_path(session_id):
+    return os.path.join(get_session_path(session_id), ACTIVITY_FILE)
+
+def touch_session_activity(session_id):
+    """Record a request for the session in its activity file's mtime, writing at most once a minute"""
+    activity_path = get_activity_path(session_id)
+    try:
+        if time.time() - os.stat(activity_path).st_mtime >= 60:
+            os.utime(activity_path)
+    except FileNotFoundError:
+        if os.path.isdir(get_session_path(session_id)):
+            open(activity_path, "a").close()
+
+def get_last_activity(session_id, session_data=None):
+    """Unix time of the session's last request or write, else its creation time; None if unknown"""
+    times = []
+    for path in (get_activity_path(session_id), get_versions_path(session_id)):
+        try:
+            times.append(os.path.getmtime(path))
+        except OSError:
+            pass
+    if times:
+        return max(times)
+    created_at = (session_data or {}).get("created_at")
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            return None
+    # Stored with datetime.utcnow(), so naive UTC
+    return created_at.replace(tzinfo=timezone.utc).timestamp() if created_at else None
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def drop_cached_vector_store(session_id):
+    """Forget this worker's loaded store; it is closed once threads still searching it are done"""
+    with _vector_store_lock:
+        cached = _vector_store_cache.pop(session_id, None)
+    if cached:
+        cached[0].retire()
+
+def _archive_filter(member):
+    # Locks, temporary files and unfinished builds are not worth keeping
+    name = os.path.basename(member.name)
+    if name.endswith((".lock", ".tmp")) or name.startswith("staging-"):
+        return None
+    return member
+
+def _add_archive_bytes(archive, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(payload))
+
+def archive_session(session_id, idle_before=None):
+    """Pack a session's documents, chunk cache and published index into one archive and remove them
+    
+    Superseded index versions are dropped first. A shared-index partition is moved into the archive
+    as ``shared/vectors.npy`` and ``shared/chunks.jsonl``. With ``idle_before`` (Unix time) the session
+    is skipped if it was used since. Returns the archive summary, or None if nothing was archived.
+    """
+    session_path = get_session_path(session_id)
+    if not os.path.isdir(session_path):
+        return None
+    started = time.perf_counter()
+    with file_lock(os.path.join(session_path, "tiering.lock")), file_lock(os.path.join(session_path, "build.lock")):
+        invalidate_session_cache(session_id)
+        session_data = get_session(session_id)
+        if not session_data or session_data.get("archived"):
+            return None
+        last_activity = get_last_activity(session_id, session_data)
+        if idle_before is not None and (last_activity is None or last_activity > idle_before):
+            return None
+        uploads_path = get_uploads_path(session_id)
+        if os.path.isdir(uploads_path) and os.listdir(uploads_path):
+            return None  # A resumable upload is still open
+        
+        collect_index_versions(get_vector_store_path(session_id))
+        original_bytes = sum(directory_size(os.path.join(session_path, name)) for name in TIERED_DIRS)
+        documents_path = get_documents_path(session_id)
+        documents = [f for f in os.listdir(documents_path)
+                     if os.path.isfile(os.path.join(documents_path, f))] if os.path.isdir(documents_path) else []
+        shared_view = get_shared_index().get_view(session_id) if SHARED_INDEX_ENABLED else None
+        
+        archive_path = get_archive_path(session_id)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        tmp_path = f"{archive_path}.{uuid.uuid4().hex}.tmp"
+        with tarfile.open(tmp_path, "w:gz", compresslevel=TIERING_COMPRESS_LEVEL) as archive:
+            for name in TIERED_DIRS:
+                if os.path.isdir(os.path.join(session_path, name)):
+                    archive.add(os.path.join(session_path, name), arcname=name, filter=_archive_filter)
+            # Exact mtimes, which the chunk cache compares against and tar would round
+            _add_archive_bytes(archive, "mtimes.json", json.dumps({
+                name: os.stat(os.path.join(documents_path, name)).st_mtime_ns for name in documents
+            }).encode())
+            if shared_view is not None:
+                vectors = io.BytesIO()
+                np.save(vectors, np.asarray(shared_view.vectors))
+                _add_archive_bytes(archive, "shared/vectors.npy", vectors.getvalue())
+                chunks = shared_view.get_chunks(range(len(shared_view.vectors)))
+                _add_archive_bytes(archive, "shared/chunks.jsonl", "".join(
+                    json.dumps({"content": chunks[i].page_content, "metadata": chunks[i].metadata}, default=str) + "\n"
+                    for i in sorted(chunks)
+                ).encode())
+        os.replace(tmp_path, archive_path)
+        
+        archive_info = {
+            "archived_at": datetime.utcnow().isoformat(),
+            "documents_count": len(documents),
+            "original_bytes": original_bytes,
+            "archive_bytes": os.path.getsize(archive_path)
+        }
+        # Marked first: a crash below leaves originals that the restore simply overwrites
+        update_session(session_id, {"archived": archive_info})
+        for name in TIERED_DIRS:
+            shutil.rmtree(os.path.join(session_path, name), ignore_errors=True)
+        if shared_view is not None:
+            get_shared_index().remove_session(session_id)
+        drop_cached_vector_store(session_id)
+    
+    elapsed_s = time.perf_counter() - started
+    TIERING_SECONDS.labels("archive").observe(elapsed_s)
+    print(f"Archived session {session_id}: {original_bytes} -> {archive_info['archive_bytes']} bytes "
+          f"in {elapsed_s:.2f}s")
+    return archive_info
+
+def restore_session(session_id):
+    """Unpack an archived session in place; returns the restore time in ms, or None if it was not archived"""
+    session_path = get_session_path(session_id)
+    if not os.path.isdir(session_path):
+        return None
+    started = time.perf_counter()
+    with file_lock(os.path.join(session_path, "tiering.lock")):
+        # Another worker may have restored it while this one waited for the lock
+        invalidate_session_cache(session_id)
+        session_data = get_session(session_id)
+        if not session_data or not session_data.get("archived"):
+            return None
+        
+        archive_path = get_archive_path(session_id)
+        with tarfile.open(archive_path, "r:gz") as archive:
+            members = archive.getmembers()
+            for member in members:
+                if (not (member.isfile() or member.isdir()) or os.path.isabs(member.name)
+                        or ".." in member.name.split("/")):
+                    raise ValueError(f"Unsafe entry {member.name!r} in {archive_path}")
+            archive.extractall(session_path, members=[member for member in members
+                                                      if member.name.split("/")[0] in TIERED_DIRS])
+            names = {member.name for member in members}
+            if "mtimes.json" in names:
+                for name, mtime_ns in json.load(archive.extractfile("mtimes.json")).items():
+                    os.utime(os.path.join(get_documents_path(session_id), name), ns=(mtime_ns, mtime_ns))
+            if "shared/vectors.npy" in names:
+                vectors = np.load(io.BytesIO(archive.extractfile("shared/vectors.npy").read()))
+                chunks = [Document(page_content=record["content"], metadata=record["metadata"])
+                          for record in map(json.loads, archive.extractfile("shared/chunks.jsonl"))]
+                get_shared_index().put_session(session_id, vectors, chunks)
+        create_session_directories(session_id)
+        
+        restore_ms = round((time.perf_counter() - started) * 1000, 1)
+        update_session(session_id, {"archived": None, "last_restore": {
+            "restored_at": datetime.utcnow().isoformat(),
+            "restore_ms": restore_ms,
+            "archive_bytes": session_data["archived"].get("archive_bytes")
+        }})
+        os.remove(archive_path)
+    
+    TIERING_SECONDS.labels("restore").observe(restore_ms / 1000)
+    print(f"Restored session {session_id} from its archive in {restore_ms:.0f} ms")
+    return restore_ms
+
+def run_tiering_pass(idle_days=None, dry_run=False):
+    """Archive every session idle for ``idle_days``; only one worker runs a pass at a time
+    
+    Returns the sessions archived (or, with ``dry_run``, the ones that would be), or None if another
+    pass is running.
+    """
+    idle_days = TIERING_IDLE_DAYS if idle_days is None else idle_days
+    idle_before = time.time() - idle_days * 86400
+    with file_lock(os.path.join(UPLOAD_FOLDER, "_tiering.lock"), blocking=False) as locked:
+        if not locked:
+            return None
+        results = []
+        for session in list(sessions_collection.find({})):
+            session_id = session["session_id"]
+            if session.get("archived") or not owns_session(session_id):
+                continue
+            last_activity = get_last_activity(session_id, session)
+            if last_activity is None or last_activity > idle_before:
+                continue
+            entry = {"session_id": session_id, "idle_days": round((time.time() - last_activity) / 86400, 1)}
+            if not dry_run:
+                try:
+                    archive_info = archive_session(session_id, idle_before)
+                except Exception as e:
+                    print(f"Error archiving session {session_id}: {e}")
+                    continue
+                if archive_info is None:
+                    continue
+                entry.update(archive_info)
+            results.append(entry)
+        return results
+
+def start_tiering_worker():
+    """Background thread that runs a tiering pass every TIERING_INTERVAL_MINUTES"""
+    def run():
+        while True:
+            time.sleep(TIERING_INTERVAL_MINUTES * 60)
+            try:
+                archived = run_tiering_pass()
+                if archived:
+                    print(f"Tiering pass archived {len(archived)} idle sessions")
+            except Exception as e:
+                print(f"Error in tiering pass: {e}")
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def ring_hash(key):
+    """Stable 64-bit position on the hash ring (Python's hash() differs between processes)"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hashing of session ids onto nodes
+    
+    Every node is placed at ``vnodes`` points on the ring and a session belongs to the first point
+    after its own hash, so adding or removing a node only moves the sessions next to that node's points.
+    """
+    
+    def __init__(self, nodes, vnodes=CLUSTER_VNODES):
+        self.nodes = list(nodes)
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+    
+    def owner(self, key):
+        if not self.hashes:
+            return None
+        return self.owners[bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)]
+
+# Cluster state cache: ((mtime, inode) of the cluster file, {"state", "ring", "previous_ring"})
+_cluster_cache = (None, None)
+cluster_http = requests.Session()  # Pooled connections to the other nodes
+
+def get_cluster_path():
+    return os.path.join(UPLOAD_FOLDER, CLUSTER_FILE)
+
+def get_cluster():
+    """The node list in force and its rings; re-read only when the cluster file changes"""
+    global _cluster_cache
+    try:
+        stat = os.stat(get_cluster_path())
+        key = (stat.st_mtime_ns, stat.st_ino)
+    except FileNotFoundError:
+        key = None
+    if _cluster_cache[1] is None or _cluster_cache[0] != key:
+        state = {"epoch": 0, "nodes": CLUSTER_NODES, "previous_nodes": [], "configured": CLUSTER_NODES}
+        if key is not None:
+            try:
+                with open(get_cluster_path()) as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading cluster file: {e}")
+        previous_nodes = state.get("previous_nodes") or []
+        _cluster_cache = (key, {
+            "state": state,
+            "ring": HashRing(state["nodes"]),
+            "previous_ring": HashRing(previous_nodes) if previous_nodes and previous_nodes != state["nodes"] else None
+        })
+    return _cluster_cache[1]
+
+def write_cluster_nodes(nodes):
+    """Put a new node list in force, keeping the current one as the previous owners; returns the new state"""
+    with file_lock(f"{get_cluster_path()}.lock"):
+        current = get_cluster()["state"]
+        if nodes == current["nodes"]:
+            return current
+        state = {"epoch": current.get("epoch", 0) + 1, "nodes": nodes, "previous_nodes": current["nodes"],
+                 "configured": CLUSTER_NODES, "updated_at": datetime.utcnow().isoformat()}
+        tmp_path = f"{get_cluster_path()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, get_cluster_path())
+    print(f"Cluster nodes changed to {', '.join(nodes)} (epoch {state['epoch']})")
+    return state
+
+def sync_cluster_config():
+    """Adopt CLUSTER_NODES if it changed since the cluster file was written (a restart with a new node list)"""
+    if os.path.exists(get_cluster_path()) and get_cluster()["state"].get("configured") != CLUSTER_NODES:
+        write_cluster_nodes(CLUSTER_NODES)
+
+def get_session_owner(session_id):
+    """Base URL of the node that owns the session, or None outside multi-node mode"""
+    return get_cluster()["ring"].owner(session_id) if CLUSTER_ENABLED else None
+
+def owns_session(session_id):
+    return not CLUSTER_ENABLED or get_session_owner(session_id) == CLUSTER_SELF
+
+def is_cluster_member():
+    return not CLUSTER_ENABLED or CLUSTER_SELF in get_cluster()["state"]["nodes"]
+
+def new_session_id():
+    """A random session id; in multi-node mode one this node owns, so the new session stays here"""
+    while True:
+        session_id = str(uuid.uuid4())
+        if owns_session(session_id):
+            return session_id
+
+class WrongNodeError(Exception):
+    """The session id belongs to another node of the cluster"""
+    
+    def __init__(self, session_id, owner):
+        super().__init__(f"Session {session_id} belongs to {owner}")
+        self.owner = owner
+
+# Not passed on when a request is forwarded to another node
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                      "transfer-encoding", "upgrade", "host", "content-length"}
+
+class _ForwardedBody:
+    """The incoming body as a file of known length, so it is forwarded as it is read and with its Content-Length"""
+    
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+    
+    def __len__(self):
+        return self.length
+    
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+def forward_request(node):
+    """Proxy the current request to ``node`` and stream its response back"""
+    # The owner applies its own size limits
+    request.max_content_length = None
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+    headers[CLUSTER_HOP_HEADER] = CLUSTER_SELF
+    headers["X-Forwarded-For"] = ", ".join(filter(None, [request.headers.get("X-Forwarded-For"), request.remote_addr]))
+    body = None
+    if request.content_length:
+        body = _ForwardedBody(request.stream, request.content_length)
+    elif request.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        body = iter(lambda: request.stream.read(STREAM_BLOCK_SIZE), b"")
+    url = node + request.path + (f"?{request.query_string.decode()}" if request.query_string else "")
+    
+    try:
+        upstream = cluster_http.request(request.method, url, headers=headers, data=body, stream=True,
+                                        allow_redirects=False, timeout=(10, CLUSTER_FORWARD_TIMEOUT))
+    except requests.exceptions.RequestException as e:
+        CLUSTER_FORWARDS.labels("unreachable").inc()
+        print(f"Error forwarding {request.method} {request.path} to {node}: {e}")
+        return jsonify({"error": f"The node serving this session ({node}) is unreachable"}), 503
+    CLUSTER_FORWARDS.labels("forwarded").inc()
+    
+    def relay():
+        # Passed through as received (still gzipped, if it was), so streamed answers arrive as they are produced
+        try:
+            yield from upstream.raw.stream(STREAM_BLOCK_SIZE, decode_content=False)
+        finally:
+            upstream.close()
+    
+    response = Response(relay(), status=upstream.status_code)
+    for key, value in upstream.headers.items():
+        if key.lower() not in HOP_BY_HOP_HEADERS - {"content-length"}:
+            response.headers[key] = value
+    return response
+
+def pull_session(session_id):
+    """Fetch a session this node has just taken over from its previous owner, on its first request here
+    
+    Returns the pull time in ms, or None if there was nothing to pull.
+    """
+    previous_ring = get_cluster()["previous_ring"]
+    previous = previous_ring.owner(session_id) if previous_ring else None
+    if not previous or previous == CLUSTER_SELF or not get_session(session_id):
+        return None
+    imports_path = os.path.join(UPLOAD_FOLDER, IMPORTS_DIR)
+    os.makedirs(imports_path, exist_ok=True)
+    started = time.perf_counter()
+    with file_lock(os.path.join(imports_path, f"{session_id}.lock")):
+        # Another worker may have pulled it while this one waited for the lock
+        if os.path.isdir(get_session_path(session_id)):
+            return None
+        with cluster_http.get(f"{previous}/api/sessions/{session_id}/export", headers={CLUSTER_HOP_HEADER: CLUSTER_SELF},
+                              stream=True, timeout=(10, CLUSTER_FORWARD_TIMEOUT)) as response:
+            if response.status_code == 404:
+                return None  # Already pushed here, or never stored there
+            response.raise_for_status()
+            import_session_snapshot(response.raw, move=True, trust_index=True)
+    
+    pull_ms = round((time.perf_counter() - started) * 1000, 1)
+    CLUSTER_MOVES.labels("pull", "moved").inc()
+    print(f"Pulled session {session_id} from {previous} in {pull_ms:.0f} ms")
+    return pull_ms
+
+def remove_session_files(session_id):
+    """Delete everything this node stores for a session (not its database records); returns the bytes freed"""
+    bytes_freed = 0
+    archive_path = get_archive_path(session_id)
+    if os.path.exists(archive_path):
+        bytes_freed += os.path.getsize(archive_path)
+        os.remove(archive_path)
+    if SHARED_INDEX_ENABLED:
+        get_shared_index().remove_session(session_id)
+    session_path = get_session_path(session_id)
+    if os.path.isdir(session_path):
+        bytes_freed += directory_size(session_path)
+        # No build may be writing into the directory while it is removed
+        with file_lock(os.path.join(session_path, "build.lock")):
+            shutil.rmtree(session_path, ignore_errors=True)
+    drop_cached_vector_store(session_id)
+    invalidate_session_cache(session_id)
+    return bytes_freed
+
+def push_session(session_id, node):
+    """Stream a session to the node that now owns it and delete the local copy; returns the outcome"""
+    session_data = get_session(session_id)
+    if not session_data:
+        remove_session_files(session_id)  # Deleted on its owner; only leftover files remain here
+        return "removed"
+    if session_data.get("archived"):
+        restore_session(session_id)
+        session_data = get_session(session_id)
+    
+    with file_lock(os.path.join(get_session_path(session_id), "build.lock")):
+        entries = iter_session_snapshot(session_id, session_data)
+        # The index files come from a node of this deployment, so they are used as they are
+        response = cluster_http.post(f"{node}/api/sessions/import", params={"move": "true", "trust_index": "true"},
+                                     data=iter_tar_gz(entries),
+                                     headers={"Content-Type": "application/gzip", CLUSTER_HOP_HEADER: CLUSTER_SELF,
+                                              "X-Admin-Token": ADMIN_TOKEN},
+                                     timeout=(10, CLUSTER_FORWARD_TIMEOUT))
+    if response.status_code == 201:
+        outcome = "moved"
+    elif response.status_code == 409:
+        outcome = "already_moved"  # The owner pulled it on a first request
+    else:
+        raise RuntimeError(f"HTTP {response.status_code} {response.text[:200]}")
+    remove_session_files(session_id)
+    return outcome
+
+def run_rebalance_pass():
+    """Move every session stored here that another node owns to that node; only one worker runs a pass at a time
+    
+    Returns the sessions handled, or None if another pass is running.
+    """
+    with file_lock(os.path.join(UPLOAD_FOLDER, "_rebalance.lock"), blocking=False) as locked:
+        if not locked:
+            return None
+        results = []
+        for session_id in sorted(os.listdir(UPLOAD_FOLDER)):
+            if not SESSION_ID_PATTERN.fullmatch(session_id) or not os.path.isdir(get_session_path(session_id)):
+                continue
+            owner = get_session_owner(session_id)
+            if owner == CLUSTER_SELF:
+                continue
+            entry = {"session_id": session_id, "node": owner}
+            try:
+                entry["outcome"] = push_session(session_id, owner)
+            except Exception as e:
+                print(f"Error moving session {session_id} to {owner}: {e}")
+                entry.update(outcome="error", error=str(e))
+            CLUSTER_MOVES.labels("push", entry["outcome"]).inc()
+            results.append(entry)
+        return results
+
+def start_rebalance_worker():
+    """Background thread that moves misplaced sessions shortly after start-up and every CLUSTER_REBALANCE_MINUTES"""
+    def run():
+        time.sleep(30)  # The other nodes may be starting too
+        while True:
+            try:
+                moved = run_rebalance_pass()
+                if moved:
+                    print(f"Rebalance pass handled {len(moved)} sessions owned by other nodes")
+            except Exception as e:
+                print(f"Error in rebalance pass: {e}")
+            time.sleep(CLUSTER_REBALANCE_MINUTES * 60)
+    
+    threading.Thread(target=run, daemon=True).start()
+
+@app.before_request
+def route_to_session_owner():
+    """Forward session requests to the node that owns the session, and pull sessions this node has taken over"""
+    session_id = (request.view_args or {}).get("session_id")
+    if not CLUSTER_ENABLED or not session_id:
+        return
+    owner = get_session_owner(session_id)
+    if owner != CLUSTER_SELF:
+        # A request another node sent here is served even while the two disagree about the node list
+        if not request.headers.get(CLUSTER_HOP_HEADER):
+            return forward_request(owner)
+        return
+    if not os.path.isdir(get_session_path(session_id)) and request.endpoint != "delete_session":
+        try:
+            pull_session(session_id)
+        except Exception as e:
+            CLUSTER_MOVES.labels("pull", "error").inc()
+            print(f"Error pulling session {session_id}: {e}")
+            return jsonify({"error": f"Session is moving to this node and could not be fetched yet: {str(e)}"}), 503
+
+@app.after_request
+def report_session_node(response):
+    if CLUSTER_ENABLED and (request.view_args or {}).get("session_id") and "X-Session-Node" not in response.headers:
+        response.headers["X-Session-Node"] = CLUSTER_SELF
+    return response
+
+@app.before_request
+def restore_archived_session():
+    """Note activity on session routes and restore an archived session before its first request is handled"""
+    session_id = (request.view_args or {}).get("session_id")
+    if not session_id or (request.endpoint or "").startswith("admin_") or request.endpoint == "delete_session":
+        return
+    session_data = get_session(session_id)
+    if not session_data:
+        return
+    touch_session_activity(session_id)
+    if session_data.get("archived"):
+        try:
+            request.session_restore_ms = restore_session(session_id)
+        except Exception as e:
+            print(f"Error restoring session {session_id}: {e}")
+            return jsonify({"error": f"Failed to restore archived session: {str(e)}"}), 500
+
+@app.after_request
+def report_session_restore(response):
+    restore_ms = getattr(request, "session_restore_ms", None)
+    if restore_ms is not None:
+        response.headers["X-Session-Restore-Ms"] = str(restore_ms)
+    return response
+
+def _tar_header(name, size, mtime=None):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    info.mtime = int(time.time() if mtime is None else mtime)
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+def iter_tar_gz(entries, level=SNAPSHOT_COMPRESS_LEVEL):
+    """Stream a .tar.gz of ``entries`` block by block, without building it in memory or on disk
+    
+    Each entry is ``(name, source)`` where source is bytes, a file path or an open binary file.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 writes a gzip container
+    
+    def tar_blocks():
+        for name, source in entries:
+            if isinstance(source, bytes):
+                size = len(source)
+                yield _tar_header(name, size)
+                yield source
+            else:
+                with (open(source, "rb") if isinstance(source, str) else source) as f:
+                    stat = os.fstat(f.fileno())
+                    size = stat.st_size
+                    f.seek(0)
+                    yield _tar_header(name, size, stat.st_mtime if isinstance(source, str) else None)
+                    remaining = size
+                    while remaining:
+                        block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                        if not block:
+                            raise OSError(f"{name} shrank while it was being exported")
+                        remaining -= len(block)
+                        yield block
+            if size % tarfile.BLOCKSIZE:
+                yield b"\0" * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+        yield b"\0" * (2 * tarfile.BLOCKSIZE)
+    
+    for block in tar_blocks():
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _snapshot_json(value):
+    return (json.dumps(value, default=lambda v: v.isoformat() if hasattr(v, "isoformat") else str(v)) + "\n").encode()
+
+def _parse_timestamp(value):
+    """Datetimes come back from a snapshot as ISO strings"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return value
+
+def iter_session_snapshot(session_id, session_data, include_conversations=False):
+    """Yield the ``(name, source)`` entries of a session snapshot, manifest first
+    
+    The published index version is held with a shared readers lock while it is read, so a rebuild
+    during the export cannot collect it.
+    """
+    session_path = get_session_path(session_id)
+    documents_path = get_documents_path(session_id)
+    vector_store_path = get_vector_store_path(session_id)
+    if (read_index_pointer(vector_store_path) is None
+            and os.path.exists(os.path.join(vector_store_path, INDEX_FILE))):
+        migrate_legacy_vector_store(vector_store_path)
+    
+    pointer = read_index_pointer(vector_store_path)
+    index_path = get_published_index_path(vector_store_path)
+    readers_lock = open(os.path.join(index_path, INDEX_READERS_LOCK), "a") if index_path else None
+    try:
+        if readers_lock and fcntl:
+            fcntl.flock(readers_lock, fcntl.LOCK_SH)
+        index_meta = load_index_meta(index_path) if index_path else {}
+        shared_view = None
+        if not index_path and SHARED_INDEX_ENABLED:
+            shared_view = get_shared_index().get_view(session_id)
+        if shared_view is not None:
+            index_meta = {"index_type": "shared", "chunks": len(shared_view.vectors),
+                          "dimension": shared_view.vectors.shape[1], "embedding_model": EMBEDDING_MODEL_NAME}
+        
+        # The vectors and chunks as plain data too, so an import can build its own index from them instead
+        # of deserializing the FAISS files. Spooled before anything is sent, so a failure cannot truncate the archive
+        partition = []
+        if index_path:
+            vector_store = SessionVectorStore(index_path)
+            try:
+                partition = _spool_snapshot_partition("index_vectors", vector_store, vector_store.index.ntotal,
+                                                      vector_store.index.d)
+            finally:
+                vector_store.close()
+        elif shared_view is not None:
+            partition = _spool_snapshot_partition("shared", shared_view, *shared_view.vectors.shape)
+        
+        documents = sorted(f for f in os.listdir(documents_path)
+                           if os.path.isfile(os.path.join(documents_path, f))) if os.path.isdir(documents_path) else []
+        yield "manifest.json", _snapshot_json({
+            "format": SNAPSHOT_FORMAT,
+            "format_version": SNAPSHOT_VERSION,
+            "session_id": session_id,
+            "exported_at": datetime.utcnow().isoformat(),
+            "embedding_model": index_meta.get("embedding_model", EMBEDDING_MODEL_NAME),
+            "chunking": CHUNKING_VERSION,
+            "index": {key: index_meta.get(key) for key in ("index_type", "compression", "chunks", "dimension")},
+            "documents": documents,
+            # Exact mtimes, which the chunk cache compares against and tar would round
+            "document_mtimes": {name: os.stat(os.path.join(documents_path, name)).st_mtime_ns for name in documents},
+            "conversations": include_conversations
+        })
+        yield "session.json", _snapshot_json({key: value for key, value in session_data.items()
+                                              if key not in ("_id", "archived", "last_restore")})
+        if os.path.exists(os.path.join(session_path, DOCUMENT_HASHES_FILE)):
+            yield DOCUMENT_HASHES_FILE, os.path.join(session_path, DOCUMENT_HASHES_FILE)
+        for name in documents:
+            yield f"documents/{name}", os.path.join(documents_path, name)
+        
+        chunk_cache_path = get_chunk_cache_path(session_id)
+        if os.path.isdir(chunk_cache_path):
+            for name in sorted(os.listdir(chunk_cache_path)):
+                if not name.endswith(".tmp") and os.path.isfile(os.path.join(chunk_cache_path, name)):
+                    yield f"chunk_cache/{name}", os.path.join(chunk_cache_path, name)
+        
+        if index_path:
+            for name in (INDEX_FILE, CHUNK_STORE_FILE, INDEX_META_FILE):
+                if os.path.exists(os.path.join(index_path, name)):
+                    yield f"faiss_index/{pointer['directory']}/{name}", os.path.join(index_path, name)
+            yield f"faiss_index/{INDEX_POINTER_FILE}", _snapshot_json(pointer)
+        yield from partition
+        
+        if include_conversations:
+            for name, collection in (("conversations.jsonl", conversations_collection),
+                                     ("summaries.jsonl", summaries_collection)):
+                # Spooled to a temporary file: tar needs each member's size before its content
+                spool = tempfile.TemporaryFile()
+                for doc in collection.find({"session_id": session_id}):
+                    spool.write(_snapshot_json({key: value for key, value in doc.items() if key != "_id"}))
+                spool.flush()
+                yield name, spool
+    finally:
+        if readers_lock:
+            readers_lock.close()
+
+def _spool_snapshot_partition(prefix, store, count, dimension):
+    """Spool a store's vectors (.npy) and chunks (JSON lines) to temporary files, SNAPSHOT_BATCH_ROWS rows at a time
+    
+    ``store`` is a SessionVectorStore or a shared-index view. Returns the two snapshot entries, or none if
+    the store cannot return its vectors.
+    """
+    vectors_file = tempfile.TemporaryFile()
+    chunks_file = tempfile.TemporaryFile()
+    np.lib.format.write_array_header_1_0(vectors_file, {
+        "descr": np.lib.format.dtype_to_descr(np.dtype("float32")), "fortran_order": False, "shape": (count, dimension)})
+    for start in range(0, count, SNAPSHOT_BATCH_ROWS):
+        rows = range(start, min(start + SNAPSHOT_BATCH_ROWS, count))
+        vectors = store.get_vectors(rows)
+        if vectors is None:
+            vectors_file.close()
+            chunks_file.close()
+            return []
+        vectors_file.write(np.ascontiguousarray(vectors, dtype="float32").tobytes())
+        chunks = store.get_chunks(rows)
+        for i in rows:
+            if i in chunks:
+                chunks_file.write(_snapshot_json({"content": chunks[i].page_content, "metadata": chunks[i].metadata}))
+    vectors_file.flush()
+    chunks_file.flush()
+    return [(f"{prefix}/vectors.npy", vectors_file), (f"{prefix}/chunks.jsonl", chunks_file)]
+
+def _copy_member(archive, member, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with archive.extractfile(member) as source, open(path, "wb") as target:
+        shutil.copyfileobj(source, target, STREAM_BLOCK_SIZE)
+
+def import_session_snapshot(stream, keep_id=False, rebuild=False, move=False, trust_index=False):
+    """Create a session from a snapshot stream, reading it once from start to end
+    
+    The snapshot's embedding model must match EMBEDDING_MODEL_NAME, and its chunks and vectors are
+    then used as they are: the index is built from them without re-embedding. The FAISS files it
+    ships are native data that faiss.read_index would deserialize, so they are only used instead with
+    ``trust_index``. With ``rebuild`` a mismatched snapshot is accepted: only the documents are kept
+    and re-embedded. Everything is unpacked into a staging directory that is moved
+    into place once complete. Raises ValueError for an invalid snapshot, FileExistsError when
+    ``keep_id`` names an existing session and WrongNodeError when another node owns that id.
+    
+    ``move`` takes over the files of a session another node held (multi-node rebalancing): the id is
+    kept and the session's database records, shared by all nodes, are left as they are.
+    """
+    staging_path = os.path.join(UPLOAD_FOLDER, IMPORTS_DIR, uuid.uuid4().hex)
+    os.makedirs(staging_path)
+    try:
+        manifest = None
+        session_doc = None
+        with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+            for member in archive:
+                if manifest is None:
+                    if member.name != "manifest.json" or not member.isfile():
+                        raise ValueError("Not a session snapshot: manifest.json must be the first entry")
+                    manifest = json.load(archive.extractfile(member))
+                    if manifest.get("format") != SNAPSHOT_FORMAT:
+                        raise ValueError("Not a session snapshot")
+                    if manifest.get("format_version", 0) > SNAPSHOT_VERSION:
+                        raise ValueError(f"Snapshot format version {manifest['format_version']} is newer "
+                                         f"than this server supports ({SNAPSHOT_VERSION})")
+                    if manifest.get("embedding_model") != EMBEDDING_MODEL_NAME and not rebuild:
+                        raise ValueError(f"Snapshot was embedded with {manifest.get('embedding_model')} but this "
+                                         f"server uses {EMBEDDING_MODEL_NAME}; import with rebuild=true to re-embed")
+                    continue
+                
+                parts = member.name.split("/")
+                if os.path.isabs(member.name) or ".." in parts or "" in parts:
+                    raise ValueError(f"Unsafe entry {member.name!r} in snapshot")
+                if not member.isfile():
+                    continue
+                if member.name == "session.json":
+                    session_doc = json.load(archive.extractfile(member))
+                elif parts[0] in ("chunk_cache", "faiss_index", "shared", "index_vectors") and rebuild:
+                    continue
+                elif parts[0] == ("index_vectors" if trust_index else "faiss_index"):
+                    continue
+                elif (parts[0] in ("documents", "chunk_cache", "faiss_index", "shared", "index_vectors")
+                      or member.name in (DOCUMENT_HASHES_FILE, "conversations.jsonl", "summaries.jsonl")):
+                    _copy_member(archive, member, os.path.join(staging_path, *parts))
+        if not isinstance(session_doc, dict):
+            raise ValueError("Snapshot has no session.json")
+        
+        keep_id = keep_id or move
+        original_id = session_doc.get("session_id")
+        session_id = original_id if keep_id else new_session_id()
+        if keep_id and (not original_id or not SESSION_ID_PATTERN.fullmatch(original_id)):
+            raise ValueError("Snapshot has no valid session_id to keep")
+        # A move comes from a node that may see the new node list before this one does
+        if not move and not owns_session(session_id):
+            raise WrongNodeError(session_id, get_session_owner(session_id))
+        documents_path = os.path.join(staging_path, "documents")
+        for name, mtime_ns in manifest.get("document_mtimes", {}).items():
+            if os.path.isfile(os.path.join(documents_path, name)):
+                os.utime(os.path.join(documents_path, name), ns=(mtime_ns, mtime_ns))
+        
+        session_path = get_session_path(session_id)
+        existing = get_session(session_id)
+        if (existing and not move) or os.path.exists(session_path):
+            raise FileExistsError(f"Session {session_id} already exists")
+        os.rename(staging_path, session_path)
+    except BaseException:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+    
+    conversations_file = os.path.join(session_path, "conversations.jsonl")
+    summaries_file = os.path.join(session_path, "summaries.jsonl")
+    partition_paths = [os.path.join(session_path, "shared"), os.path.join(session_path, "index_vectors")]
+    # Snapshots from before index_vectors was exported only ship FAISS files; re-embed their documents
+    index_imported = (any(os.path.isdir(path) for path in partition_paths)
+                      or os.path.isdir(get_vector_store_path(session_id)))
+    build_index = rebuild or (bool(manifest.get("documents")) and not index_imported)
+    create_session_directories(session_id)
+    for partition_path in partition_paths:
+        if not os.path.isdir(partition_path):
+            continue
+        # Plain vectors and chunks: into the shared index, or into an index of the session's own built here
+        vectors = np.load(os.path.join(partition_path, "vectors.npy"))
+        with open(os.path.join(partition_path, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [Document(page_content=record["content"], metadata=record["metadata"])
+                      for record in map(json.loads, f)]
+        if use_shared_index(len(chunks), session_doc):
+            get_shared_index().put_session(session_id, vectors, chunks)
+            publish_index_version(get_vector_store_path(session_id), None)
+        else:
+            settings = choose_index_settings(len(chunks), session_doc.get("index_settings"), vectors.shape[1])
+            save_vector_store(get_vector_store_path(session_id), create_faiss_index(vectors, settings), chunks, settings)
+        shutil.rmtree(partition_path)
+    
+    if not existing:
+        session_doc = {key: value for key, value in session_doc.items() if key not in ("_id", "archived", "last_restore")}
+        session_doc.update(session_id=session_id, created_at=_parse_timestamp(session_doc.get("created_at")),
+                           imported_at=datetime.utcnow(), imported_from=original_id)
+        sessions_collection.insert_one(session_doc)
+    
+    counts = {"conversations": 0, "summaries": 0}
+    for kind, path, collection in (("conversations", conversations_file, conversations_collection),
+                                   ("summaries", summaries_file, summaries_collection)):
+        if os.path.exists(path) and existing:
+            os.remove(path)  # Already in the shared database
+        elif os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    doc = json.loads(line)
+                    doc["session_id"] = session_id
+                    for key in ("timestamp", "updated_at"):
+                        if key in doc:
+                            doc[key] = _parse_timestamp(doc[key])
+                    collection.insert_one(doc)
+                    counts[kind] += 1
+            os.remove(path)
+    bump_versions(session_id, "session", "documents", "index", "conversations")
+    
+    rebuilt = request_vector_store_build(session_id) if build_index else False
+    return {
+        "session_id": session_id,
+        "imported_from": original_id,
+        "documents": len(manifest.get("documents", [])),
+        "messages_imported": counts["conversations"],
+        "summaries_imported": counts["summaries"],
+        "rebuilt": rebuilt,
+        "index": get_index_info(session_id)
+    }
+
+def get_retrieval_settings(session_data=None, k=None):
+    """Effective retrieval settings: environment defaults overlaid with the session's overrides
+    
+    A fixed ``k`` turns adaptive selection off and returns exactly the ``k`` nearest chunks.
+    """
+    if k is not None:
+        return {"min_k": k, "max_k": k, "score_threshold": -1.0, "mmr": False,
+                "mmr_lambda": RETRIEVAL_MMR_LAMBDA, "fetch_k": k}
+    settings = {
+        "min_k": RETRIEVAL_MIN_K,
+        "max_k": RETRIEVAL_MAX_K,
+        "score_threshold": RETRIEVAL_SCORE_THRESHOLD,
+        "mmr": RETRIEVAL_MMR,
+        "mmr_lambda": RETRIEVAL_MMR_LAMBDA,
+        "fetch_k": RETRIEVAL_FETCH_K
+    }
+    if session_data and session_data.get("retrieval_settings"):
+        settings.update(session_data["retrieval_settings"])
+    return settings
+
+def select_context_chunks(distances, vectors, settings):
+    """Pick which ranked candidates go into the prompt; returns their positions in selection order
+    
+    ``distances`` are FAISS squared L2 distances, nearest first. The embeddings are unit length, so
+    cosine similarity is 1 - d / 2. Candidates under ``score_threshold`` are dropped unless that
+    leaves fewer than ``min_k``. With ``mmr`` and candidate ``vectors``, up to ``max_k`` are chosen
+    greedily by maximal marginal relevance, so near-identical chunks do not fill the prompt.
+    """
+    similarities = 1 - np.asarray(distances, dtype="float32") / 2
+    keep = [i for i, similarity in enumerate(similarities) if similarity >= settings["score_threshold"]]
+    if len(keep) < settings["min_k"]:
+        keep = list(range(min(settings["min_k"], len(similarities))))
+    if not settings["mmr"] or vectors is None or len(keep) <= 1:
+        return keep[:settings["max_k"]]
+    
+    candidates = np.asarray(vectors, dtype="float32")[keep]
+    pairwise = candidates @ candidates.T
+    relevance = similarities[keep]
+    selected = [0]
+    remaining = list(range(1, len(keep)))
+    while remaining and len(selected) < settings["max_k"]:
+        redundancy = pairwise[np.ix_(remaining, selected)].max(axis=1)
+        scores = settings["mmr_lambda"] * relevance[remaining] - (1 - settings["mmr_lambda"]) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [keep[i] for i in selected]
+
+def search_context_chunks(vector_store, query_vectors, settings, signals=None):
+    """Adaptive retrieval for each query vector; returns one list of Documents per query
+    
+    If a ``signals`` list is passed, one dict per query is appended to it with the number of
+    ``candidates``, the best one's cosine similarity (``top_score``) and how far it stands above the
+    candidates' mean (``score_spread``).
+    """
+    distances, indices = vector_store.search(query_vectors, max(settings["fetch_k"], settings["max_k"]))
+    selections = []
+    for row_distances, row_ids in zip(distances, indices):
+        found = row_ids != -1
+        row_distances, row_ids = row_distances[found], row_ids[found]
+        if signals is not None:
+            similarities = 1 - row_distances / 2
+            signals.append({
+                "candidates": len(similarities),
+                "top_score": round(float(similarities[0]), 4) if len(similarities) else 0.0,
+                "score_spread": round(float(similarities[0] - similarities.mean()), 4) if len(similarities) else 0.0
+            })
+        vectors = vector_store.get_vectors(row_ids) if settings["mmr"] and len(row_ids) > 1 else None
+        selections.append([int(row_ids[i]) for i in select_context_chunks(row_distances, vectors, settings)])
+    chunks = vector_store.get_chunks({i for ids in selections for i in ids})
+    return [[chunks[i] for i in ids if i in chunks] for ids in selections]
+
+def retrieve_context_for_session(session_id, query, k=None, stats=None, deadline=None):
+    """Retrieve context from session-specific vector store
+    
+    The session's retrieval settings decide how many chunks are used unless a fixed ``k`` is given.
+    If a ``stats`` dict is passed, the number of chunks is stored in it as ``context_chunks`` along
+    with the score signals of search_context_chunks. Nothing is searched once ``deadline`` has stopped
+    the request, e.g. because loading a cold index used it up.
+    """
+    with CHAT_STAGE_SECONDS.labels("index_load").time():
+        vector_store = load_vector_store_for_session(session_id, hold=True)
+    
+    if vector_store is None:
+        return ""
+    
+    try:
+        if deadline is not None and deadline.check():
+            return ""
+        settings = get_retrieval_settings(get_session(session_id), k)
+        with CHAT_STAGE_SECONDS.labels("query_embedding").time():
+            query_vector = embeddings.embed_query(query)
+        signals = []
+        with CHAT_STAGE_SECONDS.labels("faiss_search").time():
+            results = search_context_chunks(vector_store, [query_vector], settings, signals)[0]
+        CONTEXT_CHUNKS.observe(len(results))
+        if stats is not None:
+            stats["context_chunks"] = len(results)
+            stats.update(signals[0])
+        # No limit on context length since we removed num_ctx limit
+        context_parts = []
+        for doc in results:
+            context_parts.append(doc.page_content)
+        return "\n\n".join(context_parts)
+    except Exception as e:
+        print(f"Error retrieving context for session {session_id}: {e}")
+        return ""
+    finally:
+        release_vector_store(vector_store)
+
+def retrieve_contexts_for_session(session_id, queries, k=None, signals=None):
+    """Retrieve context for many queries with one embedding batch and one multi-query search
+    
+    A ``signals`` list receives the score signals of each query, as in search_context_chunks.
+    """
+    with CHAT_STAGE_SECONDS.labels("index_load").time():
+        vector_store = load_vector_store_for_session(session_id, hold=True)
+    
+    if vector_store is None or not queries:
+        release_vector_store(vector_store)
+        return ["" for _ in queries]
+    
+    try:
+        settings = get_retrieval_settings(get_session(session_id), k)
+        with CHAT_STAGE_SECONDS.labels("query_embedding").time():
+            query_vectors = embeddings.embed_documents(list(queries))
+        with CHAT_STAGE_SECONDS.labels("faiss_search").time():
+            results = search_context_chunks(vector_store, query_vectors, settings, signals)
+        for docs in results:
+            CONTEXT_CHUNKS.observe(len(docs))
+        return ["\n\n".join(doc.page_content for doc in docs) for docs in results]
+    except Exception as e:
+        print(f"Error retrieving batch context for session {session_id}: {e}")
+        return ["" for _ in queries]
+    finally:
+        release_vector_store(vector_store)
+
+def format_conversation_messages(messages):
+    """Render stored messages as User/Assistant lines"""
+    context = []
+    for msg in messages:
+        if msg.get("message_type") == "user":
+            # No truncation - include full messages
+            message = msg.get('message', '')
+            context.append(f"User: {message}")
+        elif msg.get("message_type") == "bot":
+            # No truncation - include full messages
+            message = msg.get('message', '')
+            context.append(f"Assistant: {message}")
+    return context
+
+def get_conversation_context(session_id, conversation_id=None, limit=5, rolling_memory=False,  # Increased to 5 exchanges
+                             stats=None):
+    """Get recent conversation context
+    
+    A ``stats`` dict receives ``history_messages``, the conversation's length including summarized turns.
+    """
+    query = {"session_id": session_id}
+    if conversation_id:
+        query["conversation_id"] = conversation_id
+    
+    if rolling_memory and conversation_id:
+        # Running summary of older turns plus the messages it does not cover yet, verbatim. That is at
+        # least the last ROLLING_MEMORY_WINDOW messages, up to ROLLING_MEMORY_SLACK more while the
+        # background summary lags behind; if it fails for longer, the oldest unsummarized messages are left out.
+        # The summary is read first, so a summary written meanwhile can only overlap the messages
+        summary_doc = summaries_collection.find_one(query) or {}
+        summarized_count = summary_doc.get("summarized_count", 0)
+        recent_messages = list(conversations_collection.find(query)
+                              .sort("timestamp", 1)
+                              .skip(summarized_count))
+        context = format_conversation_messages(recent_messages[-(ROLLING_MEMORY_WINDOW + ROLLING_MEMORY_SLACK):])
+        if summary_doc.get("summary"):
+            context.insert(0, f"Summary of earlier conversation: {summary_doc['summary']}")
+        if stats is not None:
+            stats["history_messages"] = len(recent_messages) + summarized_count
+        return "\n".join(context)
+    
+    recent_messages = list(conversations_collection.find(query)
+                          .sort("timestamp", -1)
+                          .limit(limit * 2))  # Get more to account for user/bot pairs
+    
+    context = format_conversation_messages(reversed(recent_messages))
+    if stats is not None:
+        stats["history_messages"] = len(recent_messages)
+    return "\n".join(context[-10:])  # Last 5 exchanges (10 messages)
+
+# Conversations currently being summarized in the background, guarded by _summary_lock
+_summary_jobs = set()
+_summary_lock = threading.Lock()
+
+def update_conversation_summary(session_id, conversation_id):
+    """Fold messages that fell out of the verbatim window into the stored running summary
+    
+    At most ROLLING_MEMORY_FOLD_MAX messages are folded in per call, so a summary that fell behind
+    catches up over the next turns with prompts of bounded size.
+    """
+    query = {"session_id": session_id, "conversation_id": conversation_id}
+    summary_doc = summaries_collection.find_one(query) or {}
+    summarized_count = summary_doc.get("summarized_count", 0)
+    messages = list(conversations_collection.find(query).sort("timestamp", 1).skip(summarized_count))
+    
+    # Only messages older than the verbatim window are folded in
+    fold_count = min(len(messages) - ROLLING_MEMORY_WINDOW, ROLLING_MEMORY_FOLD_MAX)
+    if fold_count < 2:
+        return False
+    fold_until = summarized_count + fold_count
+    
+    to_fold = format_conversation_messages(messages[:fold_count])
+    previous_summary = summary_doc.get("summary", "")
+    prompt = (
+        "Update the running summary of a conversation between a user and an assistant. "
+        "Keep facts, names, numbers, decisions and open questions. Be concise and write plain prose.\n\n"
+        f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+        "New messages:\n" + "\n".join(to_fold) + "\n\nUpdated summary:"
+    )
+    
+    try:
+        response = requests.post(OLLAMA_URL, json={
+            "model": choose_model(get_session(session_id), "")[0],
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.1,
+                "num_predict": ROLLING_MEMORY_SUMMARY_TOKENS
+            }
+        }, timeout=120)
+        if response.status_code != 200:
+            print(f"Summary update failed for conversation {conversation_id}: HTTP {response.status_code}")
+            return False
+        summary = response.json().get("response", "").strip()
+    except Exception as e:
+        print(f"Summary update failed for conversation {conversation_id}: {e}")
+        return False
+    
+    if not summary:
+        return False
+    
+    summaries_collection.update_one(query, {"$set": {
+        "summary": summary,
+        "summarized_count": fold_until,
+        "updated_at": datetime.utcnow()
+    }}, upsert=True)
+    return True
+
+def schedule_conversation_summary(session_id, conversation_id):
+    """Run update_conversation_summary in a background thread, one job per conversation"""
+    key = (session_id, conversation_id)
+    with _summary_lock:
+        if key in _summary_jobs:
+            return
+        _summary_jobs.add(key)
+    
+    def run():
+        try:
+            update_conversation_summary(session_id, conversation_id)
+        finally:
+            with _summary_lock:
+                _summary_jobs.discard(key)
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def get_generation_stats(result):
+    """Extract prompt size and latency figures (in ms) from an Ollama response body"""
+    # Ollama reports durations in nanoseconds; prefill time is load + prompt evaluation
+    load_ms = result.get("load_duration", 0) / 1e6
+    prompt_eval_ms = result.get("prompt_eval_duration", 0) / 1e6
+    return {
+        "prompt_tokens": result.get("prompt_eval_count", 0),
+        "completion_tokens": result.get("eval_count", 0),
+        "time_to_first_token_ms": round(load_ms + prompt_eval_ms, 1),
+        "total_duration_ms": round(result.get("total_duration", 0) / 1e6, 1)
+    }
+
+# Running mean of completion tokens per model (this worker), for estimating the tokens a stopped generation saved
+_completion_tokens_mean = {}
+
+def record_generation_metrics(result, elapsed_s, model=MODEL_NAME):
+    """Observe Ollama's time to first token, total time and generation speed for one response"""
+    if result.get("eval_count"):
+        mean = _completion_tokens_mean.get(model)
+        _completion_tokens_mean[model] = result["eval_count"] if mean is None else 0.9 * mean + 0.1 * result["eval_count"]
+    ttft_s = (result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)) / 1e9
+    CHAT_STAGE_SECONDS.labels("ollama_generation").observe(elapsed_s)
+    CHAT_STAGE_SECONDS.labels("ollama_ttft").observe(ttft_s)
+    MODEL_GENERATION_SECONDS.labels(model).observe(elapsed_s)
+    MODEL_TTFT_SECONDS.labels(model).observe(ttft_s)
+    OLLAMA_TOKENS.labels("prompt").inc(result.get("prompt_eval_count", 0))
+    OLLAMA_TOKENS.labels("completion").inc(result.get("eval_count", 0))
+    if result.get("eval_count") and result.get("eval_duration"):
+        OLLAMA_TOKENS_PER_SECOND.observe(result["eval_count"] / (result["eval_duration"] / 1e9))
+
+# Models reported by Ollama's /api/tags, refreshed every MODEL_TAGS_TTL seconds; None while unreachable
+_model_tags = {"models": None, "checked": 0.0}
+_model_tags_lock = threading.Lock()
+
+def get_available_models(refresh=False):
+    """Names of the models installed in Ollama, or None if the list cannot be fetched"""
+    with _model_tags_lock:
+        if not refresh and time.monotonic() - _model_tags["checked"] < MODEL_TAGS_TTL:
+            return _model_tags["models"]
+        try:
+            response = requests.get(OLLAMA_TAGS_URL, timeout=5)
+            response.raise_for_status()
+            _model_tags["models"] = {model.get("name", "") for model in response.json().get("models", [])}
+        except Exception as e:
+            print(f"Error listing Ollama models: {e}")
+            _model_tags["models"] = None
+        _model_tags["checked"] = time.monotonic()
+        return _model_tags["models"]
+
+def is_model_available(model, available):
+    """Ollama lists untagged models as name:latest"""
+    return model in available or f"{model}:latest" in available
+
+def resolve_model(preferred, fallbacks=()):
+    """The first of ``preferred`` and ``fallbacks`` that Ollama has installed
+    
+    If none is installed, or the model list is unavailable, ``preferred`` is returned unchanged so
+    that the usual Ollama error reaches the user.
+    """
+    available = get_available_models()
+    if available is None:
+        return preferred
+    for model in (preferred, *fallbacks):
+        if is_model_available(model, available):
+            if model != preferred:
+                MODEL_FALLBACKS.labels(preferred, model).inc()
+            return model
+    return preferred
+
+def get_model_settings(session_data=None):
+    """Effective model settings: environment defaults overlaid with the session's overrides"""
+    settings = {
+        "model": None,  # Pins one model for the session and bypasses the router
+        "router": MODEL_ROUTER_ENABLED,
+        "small_model": MODEL_SMALL,
+        "large_model": MODEL_LARGE,
+        "long_query_words": ROUTER_LONG_QUERY_WORDS,
+        "deep_conversation_messages": ROUTER_DEEP_CONVERSATION,
+        "min_score_spread": ROUTER_MIN_SCORE_SPREAD
+    }
+    if session_data and session_data.get("model_settings"):
+        settings.update(session_data["model_settings"])
+    return settings
+
+def route_query(query, settings, signals=None, history_messages=0):
+    """Pick "small" or "large" for a question from cheap signals; returns (tier, reason)
+    
+    Long questions, deep conversations and flat retrieval scores (the answer is spread over many
+    similarly relevant chunks) go to the large model; everything else is treated as a lookup.
+    """
+    if len(query.split()) > settings["long_query_words"]:
+        return "large", "long_query"
+    if history_messages >= settings["deep_conversation_messages"]:
+        return "large", "deep_conversation"
+    if signals and signals.get("candidates", 0) > 1 and signals["score_spread"] < settings["min_score_spread"]:
+        return "large", "flat_scores"
+    return "small", "lookup"
+
+def choose_model(session_data, query, signals=None, history_messages=0):
+    """Model for one prompt, with a fallback when it is not installed; returns (model, route)"""
+    settings = get_model_settings(session_data)
+    if settings["model"]:
+        model, route = settings["model"], "pinned"
+        fallbacks = (MODEL_NAME,)
+    elif settings["router"] and settings["small_model"] != settings["large_model"]:
+        tier, route = route_query(query, settings, signals, history_messages)
+        model = settings[f"{tier}_model"]
+        # A missing large model degrades to the small one and vice versa before the global default
+        fallbacks = (settings["small_model" if tier == "large" else "large_model"], MODEL_NAME)
+    else:
+        model, route = settings["small_model"] if settings["router"] else MODEL_NAME, "default"
+        fallbacks = (MODEL_NAME,)
+    resolved = resolve_model(model, fallbacks)
+    return resolved, route if resolved == model else "fallback"
+
+def query_llm_with_session(session_id, query, conversation_id=None, custom_prompt=None, stats=None,
+                           session_data=None, deadline=None):
+    """Query LLM with session-specific context and custom prompt
+    
+    Callers that already hold the session document pass it as ``session_data`` to avoid a second
+    lookup. If a ``stats`` dict is passed it is filled with Ollama's prompt token count and timings
+    and the model the question was routed to. ``deadline`` (a RequestDeadline) bounds retrieval and
+    generation together.
+    """
+    # Get document context
+    retrieval_stats = {}
+    doc_context = retrieve_context_for_session(session_id, query, stats=retrieval_stats, deadline=deadline)
+    
+    # Get session configuration
+    if session_data is None:
+        with CHAT_STAGE_SECONDS.labels("session_lookup").time():
+            session_data = get_session(session_id)
+    
+    # Get conversation context
+    rolling_memory = session_data.get("rolling_memory", ROLLING_MEMORY_ENABLED) if session_data else ROLLING_MEMORY_ENABLED
+    history_stats = {}
+    with CHAT_STAGE_SECONDS.labels("history_fetch").time():
+        conv_context = get_conversation_context(session_id, conversation_id, rolling_memory=rolling_memory,
+                                                stats=history_stats)
+    
+    with CHAT_STAGE_SECONDS.labels("prompt_build").time():
+        system_prompt = build_system_prompt(session_data, custom_prompt)
+        full_prompt = build_prompt(system_prompt, query, doc_context, conv_context)
+    model, route = choose_model(session_data, query, retrieval_stats, history_stats.get("history_messages", 0))
+    MODEL_ROUTES.labels(model, route).inc()
+    response_text = generate_response(full_prompt, stats=stats, model=model, deadline=deadline)
+    if stats is not None:
+        stats["model"] = model
+        stats["route"] = route
+        stats["rolling_memory"] = bool(rolling_memory)
+        stats["context_used"] = bool(doc_context)
+        stats["context_chunks"] = retrieval_stats.get("context_chunks", 0)
+    return response_text
+
+def build_prompt(system_prompt, query, doc_context="", conv_context=""):
+    """Assemble the complete prompt sent to the model"""
+    prompt_parts = [system_prompt]
+    
+    if doc_context:
+        prompt_parts.append(f"\nRelevant Information:\n{doc_context}")
+    
+    if conv_context:
+        prompt_parts.append(f"\nConversation History:\n{conv_context}")
+    
+    prompt_parts.append(f"\nUser Question: {query}\n\nAssistant:")
+    
+    return "\n".join(prompt_parts)
+
+def client_disconnected(client_socket):
+    """True if the client has closed its connection: the socket is readable but has nothing left to read"""
+    try:
+        readable, _, _ = select.select([client_socket], [], [], 0)
+        return bool(readable) and client_socket.recv(1, socket.MSG_PEEK) == b""
+    except ValueError:
+        return False  # TLS sockets cannot be peeked at; only the deadline applies
+    except OSError:
+        return True
+
+class RequestDeadline:
+    """A request's time budget, plus a check for its client having gone away
+    
+    ``check()`` returns why work on the request should stop, "deadline" or "disconnect", or None.
+    Once set, the reason sticks, so the threads of a batch all see it.
+    """
+    
+    def __init__(self, seconds=None, client_socket=None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.client_socket = client_socket
+        self.reason = None
+        self._checked_at = 0.0
+    
+    def remaining(self):
+        return None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+    
+    def cancel(self, reason):
+        self.reason = self.reason or reason
+    
+    def check(self):
+        if self.reason is None:
+            now = time.monotonic()
+            if self.expires_at is not None and now >= self.expires_at:
+                self.cancel("deadline")
+            elif self.client_socket is not None and now - self._checked_at >= DISCONNECT_CHECK_INTERVAL:
+                self._checked_at = now
+                if client_disconnected(self.client_socket):
+                    self.cancel("disconnect")
+        return self.reason
+
+def get_request_deadline(default_seconds=REQUEST_DEADLINE_SECONDS):
+    """Deadline of the current request: ``default_seconds``, shortened by the X-Request-Deadline-Ms header"""
+    seconds = default_seconds
+    try:
+        requested = float(request.headers.get(DEADLINE_HEADER, "")) / 1000
+        if requested > 0:
+            seconds = min(seconds, requested) if seconds else requested
+    except ValueError:
+        pass
+    # The WSGI servers hand out the client's socket, which is how a disconnect is noticed mid-request
+    client_socket = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    return RequestDeadline(seconds, client_socket)
+
+def deadline_message(deadline):
+    """What a chat answers when its deadline ran out before any text was generated"""
+    if deadline.reason == "deadline":
+        return "**Timeout Error**: No answer could be generated within the request's time limit. Please try again or ask a shorter question."
+    return ""  # Nobody is left to read it
+
+def record_cancelled_generation(model, reason, completion_tokens, stats=None):
+    """Count a generation stopped by a deadline or disconnect and estimate the tokens that saved
+    
+    The estimate is None until this worker has seen the model finish an answer: chat generations set
+    no num_predict cap, so there is nothing else to estimate from.
+    """
+    expected = _completion_tokens_mean.get(model)
+    saved = max(0, round(expected - completion_tokens)) if expected is not None else None
+    GENERATIONS_CANCELLED.labels(reason).inc()
+    if saved is not None:
+        GENERATION_TOKENS_SAVED.labels(reason).inc(saved)
+    OLLAMA_TOKENS.labels("completion").inc(completion_tokens)
+    if stats is not None:
+        stats.update(cancelled=reason, completion_tokens=completion_tokens, tokens_saved_estimate=saved)
+
+def generate_response(full_prompt, stats=None, http=None, model=None, deadline=None):
+    """Send a prompt to Ollama and return the response text or a user-facing error message
+    
+    ``http`` may be a ``requests.Session`` so that batch callers reuse pooled connections.
+    ``model`` defaults to MODEL_NAME. The answer is streamed, so that when ``deadline`` (a
+    RequestDeadline) runs out or its client disconnects, closing the stream stops the generation;
+    the text received until then is returned, and ``stats["cancelled"]`` says why it stopped.
+    """
+    http = http or requests
+    model = model or MODEL_NAME
+    # Read once: a budget that runs out between two reads would leave requests a zero timeout, which it rejects
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is not None and remaining <= 0:
+        deadline.cancel("deadline")
+    if deadline is not None and deadline.check():
+        record_cancelled_generation(model, deadline.reason, 0, stats)
+        return deadline_message(deadline)
+    
+    # Query Ollama with extended timeout; the read timeout bounds the wait for each streamed token.
+    # Both the connection and each read are capped by what is left of the request's budget
+    connect_timeout, read_timeout = (10, 120) if remaining is None else (min(10, remaining), min(120, remaining))
+    started = time.perf_counter()
+    parts = []
+    try:
+        with http.post(OLLAMA_URL, json={
+            "model": model,
+            "prompt": full_prompt,
+            "stream": True,
+            "options": {
+                "temperature": 0.1,  # Very focused/deterministic responses
+                "top_k": 40,
+                "top_p": 0.8,  # More conservative word selection
+                "num_ctx": 32768  # Large context window for llama3.2
+            }
+        }, stream=True, timeout=(connect_timeout, read_timeout)) as response:  # Increased timeout for larger contexts
+            
+            if response.status_code != 200:
+                OLLAMA_ERRORS.labels(f"http_{response.status_code}").inc()
+                if response.status_code == 404:
+                    # The model was removed since /api/tags was last read; route around it from now on
+                    get_available_models(refresh=True)
+                return f"**Ollama Error ({response.status_code})**: The local AI server returned an error. Please ensure Ollama is running with the `{model}` model installed."
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if result.get("error"):
+                    raise RuntimeError(result["error"])
+                parts.append(result.get("response", ""))
+                if result.get("done"):
+                    record_generation_metrics(result, time.perf_counter() - started, model)
+                    if stats is not None:
+                        stats.update(get_generation_stats(result))
+                    return "".join(parts) or "No response received."
+                if deadline is not None and deadline.check():
+                    # Leaving the block closes the connection, and Ollama stops generating
+                    break
+        if deadline is not None and deadline.reason:
+            # Each streamed line carries one token
+            record_cancelled_generation(model, deadline.reason, len(parts), stats)
+            return "".join(parts) or deadline_message(deadline)
+        OLLAMA_ERRORS.labels("incomplete").inc()
+        return "".join(parts) or "No response received."
+    except requests.exceptions.RequestException as e:
+        if deadline is not None and deadline.check():
+            # A read that timed out because the deadline passed is a cancellation, not an Ollama failure
+            record_cancelled_generation(model, deadline.reason, len(parts), stats)
+            return "".join(parts) or deadline_message(deadline)
+        if isinstance(e, requests.exceptions.Timeout):
+            OLLAMA_ERRORS.labels("timeout").inc()
+            return "**Timeout Error**: The AI model is taking longer than expected. This often happens on the first request when the model needs to load into memory. Please try again - subsequent requests should be faster."
+        if isinstance(e, requests.exceptions.ConnectionError):
+            OLLAMA_ERRORS.labels("connection").inc()
+            return f"**Connection Error**: Cannot connect to Ollama server at {OLLAMA_URL}. Please start Ollama by running `ollama serve` in your terminal, then ensure the `{model}` model is installed with `ollama pull {model}`."
+        OLLAMA_ERRORS.labels("other").inc()
+        return f"**AI Service Error**: {str(e)}"
+    except Exception as e:
+        OLLAMA_ERRORS.labels("other").inc()
+        return f"**AI Service Error**: {str(e)}"
+
+def read_chunk_cache_meta(session_id, file_path):
+    """The chunk cache metadata of a document if the cache still matches the file, else None"""
+    cache_base = os.path.join(get_chunk_cache_path(session_id), Path(file_path).name)
+    try:
+        with open(f"{cache_base}.meta.json", "r") as f:
+            meta = json.load(f)
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return None
+    if (meta.get("size") != stat.st_size or meta.get("mtime_ns") != stat.st_mtime_ns
+            or meta.get("embedding_model") != EMBEDDING_MODEL_NAME
+            or meta.get("chunking") != CHUNKING_VERSION):
+        return None
+    return meta
+
+def load_chunk_cache(session_id, file_path):
+    """Return (chunks, vectors) embedded earlier (streamed upload or JSON build) if they still match the file
+    
+    ``vectors`` is a read-only memory map of the cache file.
+    """
+    cache_base = os.path.join(get_chunk_cache_path(session_id), Path(file_path).name)
+    meta = read_chunk_cache_meta(session_id, file_path)
+    if meta is None:
+        return None
+    try:
+        chunks = []
+        with open(f"{cache_base}.chunks.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                chunks.append(Document(page_content=record["content"], metadata=record["metadata"]))
+        # Memory-mapped: a build copies the vectors once, into the array the index is made from
+        vectors = np.memmap(f"{cache_base}.f32", dtype="float32", mode="r", shape=(len(chunks), meta["dimension"]))
+        return chunks, vectors
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_chunk_cache_meta(cache_base, document_path, chunk_count):
+    """Record which version of the document a chunk cache belongs to; written last"""
+    stat = os.stat(document_path)
+    with open(f"{cache_base}.meta.json", "w") as f:
+        json.dump({
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunks": chunk_count,
+            "dimension": os.path.getsize(f"{cache_base}.f32") // (4 * chunk_count),
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "chunking": CHUNKING_VERSION
+        }, f)
+
+def save_chunk_cache(session_id, file_path, chunks, vectors):
+    """Store a document's chunks and embeddings so that builds use them instead of embedding it again"""
+    filename = Path(file_path).name
+    cache_path = get_chunk_cache_path(session_id)
+    os.makedirs(cache_path, exist_ok=True)
+    cache_base = os.path.join(cache_path, filename)
+    remove_chunk_cache(session_id, filename)
+    with open(f"{cache_base}.chunks.jsonl", "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps({"content": chunk.page_content, "metadata": chunk.metadata}) + "\n")
+    np.asarray(vectors, dtype="float32").tofile(f"{cache_base}.f32")
+    write_chunk_cache_meta(cache_base, file_path, len(chunks))
+
+def embed_json_document(session_id, file_path):
+    """Stream a JSON/JSONL file into the chunk cache record by record, embedding in batches
+    
+    Returns (chunks, vectors) like load_chunk_cache, or None if the file has no records or
+    cannot be parsed.
+    """
+    filename = Path(file_path).name
+    cache_path = get_chunk_cache_path(session_id)
+    os.makedirs(cache_path, exist_ok=True)
+    cache_base = os.path.join(cache_path, filename)
+    remove_chunk_cache(session_id, filename)
+    
+    chunker = StructuredChunker()
+    chunk_count = 0
+    try:
+        with open(f"{cache_base}.chunks.jsonl", "w", encoding="utf-8") as chunks_file, \
+                open(f"{cache_base}.f32", "wb") as vectors_file:
+            batch = []
+            
+            def write_batch():
+                vectors = np.asarray(embeddings.embed_documents([c.page_content for c in batch]), dtype="float32")
+                for chunk in batch:
+                    chunks_file.write(json.dumps({"content": chunk.page_content, "metadata": chunk.metadata}) + "\n")
+                vectors_file.write(vectors.tobytes())
+            
+            for doc in iter_json_documents(str(file_path)):
+                # Records are split on their own so no chunk straddles two records
+                batch.extend(chunker.split_documents([doc]))
+                if len(batch) >= JSON_EMBED_BATCH:
+                    write_batch()
+                    chunk_count += len(batch)
+                    batch = []
+            if batch:
+                write_batch()
+                chunk_count += len(batch)
+    except Exception as e:
+        print(f"Error loading JSON file {file_path}: {e}")
+        remove_chunk_cache(session_id, filename)
+        return None
     
-    # Get session configuration
-    session_data = sessions_collection.find_one({"session_id": session_id})
-    user_prompt = ""
-    if session_data and session_data.get("custom_prompt"):
-        user_prompt = session_data["custom_prompt"]
-    elif custom_prompt:
-        user_prompt = custom_prompt
+    if not chunk_count:
+        remove_chunk_cache(session_id, filename)
+        return None
+    write_chunk_cache_meta(cache_base, file_path, chunk_count)
+    return load_chunk_cache(session_id, file_path)
 
-    # Final system prompt = predefined + user
-    if user_prompt:
-        system_prompt = f"{DEFAULT_SYSTEM_PROMPT}\n\nCustom Instructions:\n{user_prompt}"
-    else:
-        system_prompt = DEFAULT_SYSTEM_PROMPT
+def remove_chunk_cache(session_id, filename):
+    cache_base = os.path.join(get_chunk_cache_path(session_id), filename)
+    for suffix in (".meta.json", ".chunks.jsonl", ".f32"):
+        if os.path.exists(cache_base + suffix):
+            os.remove(cache_base + suffix)
 
-    # Build the complete prompt
-    print(system_prompt)
-    prompt_parts = [system_prompt]
+# Resumable uploads
+# Each upload lives in vector_stores/<session_id>/uploads/<upload_id>/:
+#   upload.json      - filename and declared size (written once)
+#   data.part        - bytes received so far; its size is the resume offset
+#   progress.json    - bytes consumed, the streaming chunker's state (unfinished block, open chunk, section)
+#                      and the lengths of chunks.jsonl/vectors.f32 at that point
+#   chunks.jsonl/.f32 - chunks and embeddings produced so far
+# Parts are appended under write.lock; background chunking runs under index.lock, so any
+# worker can take any part and progress survives worker restarts.
+
+def get_upload_path(session_id, upload_id):
+    return os.path.join(get_uploads_path(session_id), secure_filename(upload_id))
+
+def load_upload(session_id, upload_id):
+    try:
+        with open(os.path.join(get_upload_path(session_id, upload_id), "upload.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def upload_received_bytes(upload_path):
+    try:
+        return os.path.getsize(os.path.join(upload_path, "data.part"))
+    except OSError:
+        return 0
+
+def _read_upload_progress(upload_path):
+    try:
+        with open(os.path.join(upload_path, "progress.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"consumed": 0, "chunks": 0, "chunks_bytes": 0, "vectors_bytes": 0}
+
+def _upload_chunk_file_sizes(upload_path):
+    """Lengths of the upload's chunk and vector files, recorded with the progress they belong to"""
+    sizes = {}
+    for key, name in (("chunks_bytes", "chunks.jsonl"), ("vectors_bytes", "vectors.f32")):
+        try:
+            sizes[key] = os.path.getsize(os.path.join(upload_path, name))
+        except OSError:
+            sizes[key] = 0
+    return sizes
+
+def _truncate_upload_chunk_files(upload_path, progress):
+    """Drop rows a worker appended but died before recording in progress.json, so they are not added twice"""
+    for key, name in (("chunks_bytes", "chunks.jsonl"), ("vectors_bytes", "vectors.f32")):
+        path = os.path.join(upload_path, name)
+        # Uploads started before the lengths were recorded have none; their files are left as they are
+        if progress.get(key) is not None and os.path.exists(path) and os.path.getsize(path) > progress[key]:
+            os.truncate(path, progress[key])
+
+def _write_upload_progress(upload_path, progress):
+    tmp_path = os.path.join(upload_path, "progress.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, os.path.join(upload_path, "progress.json"))
+
+def _append_upload_chunks(upload_path, chunks, source):
+    """Embed finished (chunk, section) pairs and append them to the upload's chunk and vector files"""
+    if not chunks:
+        return
+    with INGEST_STAGE_SECONDS.labels("stream_embed").time():
+        vectors = np.asarray(embeddings.embed_documents([text for text, _ in chunks]), dtype="float32")
+    with open(os.path.join(upload_path, "chunks.jsonl"), "a", encoding="utf-8") as f:
+        for text, section in chunks:
+            metadata = {"source": source, "section": section} if section else {"source": source}
+            f.write(json.dumps({"content": text, "metadata": metadata}) + "\n")
+    with open(os.path.join(upload_path, "vectors.f32"), "ab") as f:
+        f.write(vectors.tobytes())
+
+def process_upload_increment(session_id, upload_id, final=False):
+    """Chunk and embed the bytes received since the last call
     
-    if doc_context:
-        prompt_parts.append(f"\nRelevant Information:\n{doc_context}")
+    Returns False without doing anything if another worker is already processing this upload,
+    unless ``final`` is set, in which case it waits and also flushes the trailing chunk.
+    """
+    upload = load_upload(session_id, upload_id)
+    upload_path = get_upload_path(session_id, upload_id)
+    if not upload or Path(upload["filename"]).suffix.lower() not in STREAMING_EXTENSIONS:
+        return False
     
-    if conv_context:
-        prompt_parts.append(f"\nConversation History:\n{conv_context}")
+    source = os.path.join(get_documents_path(session_id), upload["filename"])
+    with file_lock(os.path.join(upload_path, "index.lock"), blocking=final) as acquired:
+        if not acquired:
+            return False
+        progress = _read_upload_progress(upload_path)
+        _truncate_upload_chunk_files(upload_path, progress)
+        # Uploads started before the chunker state was persisted whole only have buffer and section
+        chunker = StreamingTextChunker(state=progress.get("chunker") or {"buffer": progress.get("buffer", ""),
+                                                                         "section": progress.get("section", "")})
+        
+        with open(os.path.join(upload_path, "data.part"), "rb") as f:
+            f.seek(progress["consumed"])
+            while True:
+                block = f.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                text, consumed = _decode_complete_utf8(block, final)
+                if not consumed:
+                    # Only part of a character has arrived so far
+                    break
+                chunks = chunker.feed(text)
+                _append_upload_chunks(upload_path, chunks, source)
+                progress = {"consumed": progress["consumed"] + consumed, "chunker": chunker.state(),
+                            "chunks": progress["chunks"] + len(chunks), **_upload_chunk_file_sizes(upload_path)}
+                _write_upload_progress(upload_path, progress)
+                if consumed < len(block):
+                    # Re-read the character split across blocks together with the next block
+                    f.seek(progress["consumed"])
+        
+        if final:
+            chunks = chunker.flush()
+            _append_upload_chunks(upload_path, chunks, source)
+            progress = {"consumed": progress["consumed"], "chunks": progress["chunks"] + len(chunks),
+                        **_upload_chunk_file_sizes(upload_path)}
+            _write_upload_progress(upload_path, progress)
+    return True
+
+def _decode_complete_utf8(block, final=False):
+    """Decode the longest prefix of ``block`` made of complete UTF-8 characters
     
-    prompt_parts.append(f"\nUser Question: {query}\n\nAssistant:")
+    Returns (text, bytes consumed). An incomplete character at the end is left for the next
+    block unless ``final`` is set; bytes that are not UTF-8 at all are replaced rather than stalling.
+    """
+    for cut in range(len(block), max(len(block) - 4, 0), -1):
+        try:
+            return block[:cut].decode("utf-8"), cut
+        except UnicodeDecodeError:
+            continue
+    if final or len(block) >= 4:
+        return block.decode("utf-8", errors="replace"), len(block)
+    return "", 0
+
+def schedule_upload_processing(session_id, upload_id):
+    def run():
+        try:
+            process_upload_increment(session_id, upload_id)
+        except OSError:
+            # The upload was finalized or aborted meanwhile; finalize does its own processing
+            pass
     
-    full_prompt = "\n".join(prompt_parts)
+    threading.Thread(target=run, daemon=True).start()
+
+def remove_expired_uploads(session_id):
+    uploads_path = get_uploads_path(session_id)
+    if not os.path.isdir(uploads_path):
+        return
+    cutoff = time.time() - UPLOAD_EXPIRY_HOURS * 3600
+    for upload_id in os.listdir(uploads_path):
+        upload_path = os.path.join(uploads_path, upload_id)
+        try:
+            if os.path.getmtime(os.path.join(upload_path, "upload.json")) < cutoff:
+                shutil.rmtree(upload_path, ignore_errors=True)
+        except OSError:
+            continue
+
+def finalize_upload(session_id, upload_id):
+    """Move a completed upload into the documents folder along with any chunks embedded on the way"""
+    upload = load_upload(session_id, upload_id)
+    upload_path = get_upload_path(session_id, upload_id)
     
-    # Query Ollama with extended timeout
-    try:
-        response = requests.post(OLLAMA_URL, json={
-            "model": MODEL_NAME,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,  # Very focused/deterministic responses
-                "top_k": 40,
-                "top_p": 0.8,  # More conservative word selection
-                "num_ctx": 32768  # Large context window for llama3.2
-            }
-        }, timeout=120)  # Increased timeout for larger contexts
+    with file_lock(os.path.join(upload_path, "write.lock")):
+        process_upload_increment(session_id, upload_id, final=True)
         
-        if response.status_code == 200:
-            return response.json().get("response", "No response received.")
-        else:
-            return f"**Ollama Error ({response.status_code})**: The local AI server returned an error. Please ensure Ollama is running with the `{MODEL_NAME}` model installed."
-    except requests.exceptions.Timeout:
-        return "**Timeout Error**: The AI model is taking longer than expected. This often happens on the first request when the model needs to load into memory. Please try again - subsequent requests should be faster."
-    except requests.exceptions.ConnectionError:
-        return f"**Connection Error**: Cannot connect to Ollama server at {OLLAMA_URL}. Please start Ollama by running `ollama serve` in your terminal, then ensure the `{MODEL_NAME}` model is installed with `ollama pull {MODEL_NAME}`."
-    except Exception as e:
-        return f"**AI Service Error**: {str(e)}"
+        document_path = os.path.join(get_documents_path(session_id), upload["filename"])
+        os.replace(os.path.join(upload_path, "data.part"), document_path)
+        
+        progress = _read_upload_progress(upload_path)
+        remove_chunk_cache(session_id, upload["filename"])
+        if progress["chunks"]:
+            cache_path = get_chunk_cache_path(session_id)
+            os.makedirs(cache_path, exist_ok=True)
+            cache_base = os.path.join(cache_path, upload["filename"])
+            os.replace(os.path.join(upload_path, "chunks.jsonl"), f"{cache_base}.chunks.jsonl")
+            os.replace(os.path.join(upload_path, "vectors.f32"), f"{cache_base}.f32")
+            write_chunk_cache_meta(cache_base, document_path, progress["chunks"])
+    
+    shutil.rmtree(upload_path, ignore_errors=True)
+    return upload["filename"]
 
 # API Routes
 
@@ -403,18 +3879,27 @@ def health_check():
     """Check if Ollama is running and model is available"""
     try:
         # Test connection to Ollama
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = requests.get(OLLAMA_TAGS_URL, timeout=5)
         if response.status_code == 200:
             models = response.json().get("models", [])
             model_names = [model.get("name", "") for model in models]
             
             llama3_available = any(MODEL_NAME in name for name in model_names)
+            routing = {"enabled": MODEL_ROUTER_ENABLED}
+            if MODEL_ROUTER_ENABLED:
+                routing.update({
+                    "small_model": MODEL_SMALL,
+                    "small_model_available": is_model_available(MODEL_SMALL, model_names),
+                    "large_model": MODEL_LARGE,
+                    "large_model_available": is_model_available(MODEL_LARGE, model_names)
+                })
             
             return jsonify({
                 "ollama_running": True,
                 "model_available": llama3_available,
                 "available_models": model_names,
                 "target_model": MODEL_NAME,
+                "routing": routing,
                 "message": "Ollama is running!" if llama3_available else f"Ollama is running but {MODEL_NAME} model not found. Run: ollama pull {MODEL_NAME}"
             })
         else:
@@ -436,14 +3921,189 @@ def health_check():
             "message": f"Health check failed: {str(e)}"
         }), 503
 
-@app.route("/api/sessions/create", methods=["POST"])
-def create_session():
-    """Create a new user session"""
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics, summed over all gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route("/api/admin/profiles", methods=["POST"])
+@require_admin
+def admin_arm_profile():
+    """Profile the next N requests matching a session and/or endpoint"""
     data = request.get_json() or {}
+    session_id = data.get("session_id")
+    endpoint = data.get("endpoint")
+    if session_id and not get_session(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    if endpoint and endpoint not in app.view_functions:
+        return jsonify({"error": f"Unknown endpoint: {endpoint}"}), 400
+    try:
+        count = int(data.get("count", 1))
+        ttl_minutes = float(data.get("ttl_minutes", 60))
+    except (TypeError, ValueError):
+        return jsonify({"error": "count and ttl_minutes must be numbers"}), 400
+    if not 1 <= count <= PROFILE_MAX_REQUESTS:
+        return jsonify({"error": f"count must be between 1 and {PROFILE_MAX_REQUESTS}"}), 400
+    
+    rule = {
+        "id": uuid.uuid4().hex[:12],
+        "session_id": session_id,
+        "endpoint": endpoint,
+        "remaining": count,
+        "tracemalloc": bool(data.get("tracemalloc", False)),
+        "created_at": time.time(),
+        "expires_at": time.time() + ttl_minutes * 60
+    }
+    os.makedirs(get_profiles_path(), exist_ok=True)
+    with file_lock(os.path.join(get_profiles_path(), "rules.lock")):
+        write_profile_rules(read_profile_rules() + [rule])
+    return jsonify(rule), 201
+
+@app.route("/api/admin/profiles", methods=["GET"])
+@require_admin
+def admin_list_profiles():
+    """Armed rules and the reports captured so far, newest first"""
+    profiles_path = Path(get_profiles_path())
+    reports = []
+    if profiles_path.exists():
+        for prof_file in sorted(profiles_path.glob("*.prof"), reverse=True):
+            reports.append({
+                "name": prof_file.stem,
+                "stats_file": prof_file.name,
+                "report_file": prof_file.with_suffix(".txt").name,
+                "size": prof_file.stat().st_size,
+                "created_at": datetime.utcfromtimestamp(prof_file.stat().st_mtime).isoformat()
+            })
+    rules = [rule for rule in read_profile_rules() if time.time() < rule["expires_at"]]
+    return jsonify({"rules": rules, "reports": reports})
+
+@app.route("/api/admin/profiles/<rule_id>", methods=["DELETE"])
+@require_admin
+def admin_disarm_profile(rule_id):
+    """Cancel an armed rule"""
+    os.makedirs(get_profiles_path(), exist_ok=True)
+    with file_lock(os.path.join(get_profiles_path(), "rules.lock")):
+        rules = read_profile_rules()
+        remaining = [rule for rule in rules if rule["id"] != rule_id]
+        if len(remaining) == len(rules):
+            return jsonify({"error": "Rule not found"}), 404
+        write_profile_rules(remaining)
+    return jsonify({"message": "Profiling rule removed"})
+
+@app.route("/api/admin/profiles/files/<filename>", methods=["GET"])
+@require_admin
+def admin_download_profile(filename):
+    """Download a .prof (load with pstats or snakeviz) or .txt report"""
+    if not filename.endswith((".prof", ".txt")):
+        return jsonify({"error": "Unknown report file"}), 404
+    return send_from_directory(os.path.abspath(get_profiles_path()), secure_filename(filename), as_attachment=True)
+
+@app.route("/api/admin/tiering/run", methods=["POST"])
+@require_admin
+def admin_run_tiering():
+    """Archive idle sessions now instead of waiting for the background pass"""
+    data = request.get_json(silent=True) or {}
+    try:
+        idle_days = float(data["idle_days"]) if data.get("idle_days") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "idle_days must be a number"}), 400
+    
+    archived = run_tiering_pass(idle_days, dry_run=bool(data.get("dry_run", False)))
+    if archived is None:
+        return jsonify({"error": "A tiering pass is already running"}), 409
+    return jsonify({
+        "dry_run": bool(data.get("dry_run", False)),
+        "idle_days": TIERING_IDLE_DAYS if idle_days is None else idle_days,
+        "archived": archived,
+        "bytes_saved": sum(entry.get("original_bytes", 0) - entry.get("archive_bytes", 0) for entry in archived)
+    })
+
+@app.route("/api/admin/sessions/<session_id>/archive", methods=["POST"])
+@require_admin
+def admin_archive_session(session_id):
+    """Archive one session regardless of its idle time"""
+    if not get_session(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    archive_info = archive_session(session_id)
+    if archive_info is None:
+        return jsonify({"error": "Session is already archived or has an upload in progress"}), 409
+    return jsonify({"session_id": session_id, "archived": archive_info})
+
+@app.route("/api/cluster", methods=["GET"])
+def cluster_status():
+    """Node list, this node's place in it and, with ?session_id=, the node that owns a session"""
+    if not CLUSTER_ENABLED:
+        return jsonify({"enabled": False})
+    cluster = get_cluster()
+    state = cluster["state"]
+    local_sessions = [name for name in os.listdir(UPLOAD_FOLDER)
+                      if SESSION_ID_PATTERN.fullmatch(name) and os.path.isdir(get_session_path(name))]
+    result = {
+        "enabled": True,
+        "self": CLUSTER_SELF,
+        "member": is_cluster_member(),
+        "epoch": state.get("epoch", 0),
+        "nodes": state["nodes"],
+        "previous_nodes": state.get("previous_nodes", []),
+        "vnodes": CLUSTER_VNODES,
+        "local_sessions": len(local_sessions),
+        # Stored here but owned elsewhere: waiting for the next rebalance pass
+        "misplaced_sessions": sum(1 for session_id in local_sessions if not owns_session(session_id))
+    }
+    if request.args.get("session_id"):
+        result["owner"] = get_session_owner(request.args["session_id"])
+    return jsonify(result)
+
+@app.route("/api/admin/cluster/nodes", methods=["PUT"])
+@require_admin
+def admin_set_cluster_nodes():
+    """Change the node list on every node (old and new) and start moving sessions to their new owners"""
+    if not CLUSTER_ENABLED:
+        return jsonify({"error": "Multi-node mode is off; set CLUSTER_NODES and CLUSTER_SELF"}), 400
+    data = request.get_json(silent=True) or {}
+    nodes = data.get("nodes")
+    if not isinstance(nodes, list) or not nodes or not all(isinstance(node, str) and node.strip() for node in nodes):
+        return jsonify({"error": "nodes must be a non-empty list of base URLs"}), 400
+    nodes = list(dict.fromkeys(node.strip().rstrip("/") for node in nodes))
+    
+    previous_nodes = get_cluster()["state"]["nodes"]
+    state = write_cluster_nodes(nodes)
+    propagated = {}
+    if not request.headers.get(CLUSTER_HOP_HEADER):
+        for node in dict.fromkeys(previous_nodes + nodes):
+            if node == CLUSTER_SELF:
+                continue
+            try:
+                response = cluster_http.put(f"{node}/api/admin/cluster/nodes", json={"nodes": nodes}, timeout=30,
+                                            headers={"X-Admin-Token": ADMIN_TOKEN, CLUSTER_HOP_HEADER: CLUSTER_SELF})
+                propagated[node] = response.status_code
+            except requests.exceptions.RequestException as e:
+                print(f"Error sending the node list to {node}: {e}")
+                propagated[node] = "unreachable"
+    threading.Thread(target=run_rebalance_pass, daemon=True).start()
     
-    session_id = str(uuid.uuid4())
-    user_description = data.get("user_description", "")
-    use_case = data.get("use_case", "")
+    return jsonify({"epoch": state.get("epoch", 0), "nodes": state["nodes"],
+                    "previous_nodes": state.get("previous_nodes", []), "propagated": propagated})
+
+@app.route("/api/admin/cluster/rebalance", methods=["POST"])
+@require_admin
+def admin_rebalance_cluster():
+    """Move the sessions stored here that other nodes own now instead of waiting for the background pass"""
+    if not CLUSTER_ENABLED:
+        return jsonify({"error": "Multi-node mode is off; set CLUSTER_NODES and CLUSTER_SELF"}), 400
+    moved = run_rebalance_pass()
+    if moved is None:
+        return jsonify({"error": "A rebalance pass is already running"}), 409
+    return jsonify({"sessions": moved, "errors": sum(1 for entry in moved if entry["outcome"] == "error")})
+
+def create_session_record(user_description="", use_case="", rolling_memory=ROLLING_MEMORY_ENABLED):
+    """Create a session's directories and database document; returns the document"""
+    session_id = new_session_id()
     
     # Create session directories
     create_session_directories(session_id)
@@ -455,19 +4115,71 @@ def create_session():
         "use_case": use_case,
         "created_at": datetime.utcnow(),
         "custom_prompt": "",
-        "documents_count": 0
+        "documents_count": 0,
+        "rolling_memory": rolling_memory
     }
     
     sessions_collection.insert_one(session_doc)
+    bump_versions(session_id, "session")
+    return session_doc
+
+@app.route("/api/sessions/create", methods=["POST"])
+def create_session():
+    """Create a new user session"""
+    if not is_cluster_member():
+        # A node that has left the cluster creates no sessions of its own
+        return forward_request(get_session_owner(str(uuid.uuid4())))
+    data = request.get_json() or {}
+    
+    session_doc = create_session_record(data.get("user_description", ""), data.get("use_case", ""),
+                                        bool(data.get("rolling_memory", ROLLING_MEMORY_ENABLED)))
     
     return jsonify({
-        "session_id": session_id,
+        "session_id": session_doc["session_id"],
         "created_at": session_doc["created_at"].isoformat()
     })
 
+@app.route("/api/sessions/import", methods=["POST"])
+@require_admin
+def import_session():
+    """Create a session from a snapshot made by GET /api/sessions/<id>/export, without re-embedding"""
+    # Snapshots are read as a stream, so they may be larger than regular uploads
+    request.max_content_length = SNAPSHOT_MAX_SIZE
+    keep_id = request.args.get("keep_id", "false").lower() == "true"
+    rebuild = request.args.get("rebuild", "false").lower() == "true"
+    # Use the snapshot's FAISS files instead of building the index from its chunks; only for snapshots from a trusted server
+    trust_index = request.args.get("trust_index", "false").lower() == "true"
+    # Nodes moving a session here authenticate with the shared ADMIN_TOKEN like any admin
+    move = request.args.get("move", "false").lower() == "true"
+    if not is_cluster_member() and not keep_id:
+        return forward_request(get_session_owner(str(uuid.uuid4())))
+    stream = request.files["snapshot"].stream if request.mimetype == "multipart/form-data" else request.stream
+    
+    try:
+        result = import_session_snapshot(stream, keep_id=keep_id, rebuild=rebuild, move=move, trust_index=trust_index)
+    except FileExistsError as e:
+        return jsonify({"error": str(e)}), 409
+    except WrongNodeError as e:
+        return jsonify({"error": str(e), "owner": e.owner}), 421
+    except (ValueError, KeyError, tarfile.TarError, EOFError, zlib.error) as e:
+        return jsonify({"error": f"Invalid snapshot: {str(e)}"}), 400
+    
+    return jsonify(result), 201
+
 @app.route("/api/sessions/list", methods=["GET"])
 def list_all_sessions():
     """List all sessions with user-friendly details for dropdown selection"""
+    if CLUSTER_ENABLED:
+        # Other nodes change sessions too, which only the shared counter sees; the node list decides
+        # which node serves each session
+        shared_version = read_shared_sessions_version()
+        etag = make_etag("sessions", shared_version, get_cluster()["state"].get("epoch")) if shared_version else None
+    else:
+        etag = make_etag("sessions", read_versions())
+    cached = not_modified(etag) if etag else None
+    if cached:
+        return cached
+    
     try:
         # Get all sessions sorted by creation date (newest first)
         try:
@@ -479,20 +4191,29 @@ def list_all_sessions():
             # Sort by created_at if it exists, handling both datetime and string formats
             sessions.sort(key=lambda x: x.get("created_at", ""), reverse=True)
         
+        # One query for every session's partition instead of one per session
+        shared_sessions = get_shared_index().session_chunk_counts() if SHARED_INDEX_ENABLED else {}
+        
         session_list = []
         for session in sessions:
             session_id = session["session_id"]
             
-            # Count documents for this session
+            # Count documents for this session (archived sessions recorded the count when packed)
             documents_path = get_documents_path(session_id)
             documents_count = 0
-            if os.path.exists(documents_path):
+            owned = owns_session(session_id)
+            if session.get("archived"):
+                documents_count = session["archived"].get("documents_count", 0)
+            elif not owned:
+                # Stored on another node: the count recorded by its last build
+                documents_count = session.get("documents_count", 0)
+            elif os.path.exists(documents_path):
                 documents_count = len([f for f in os.listdir(documents_path) 
                                      if os.path.isfile(os.path.join(documents_path, f))])
             
-            # Check vector store status
-            vector_store_path = get_vector_store_path(session_id)
-            vector_store_ready = os.path.exists(vector_store_path) and len(os.listdir(vector_store_path)) > 0
+            # Check vector store status; an archived index is restored with the session on first use
+            vector_store_ready = bool(session.get("archived")) or (
+                is_vector_store_ready(session_id, shared_sessions) if owned else documents_count > 0)
             
             # Get recent activity (last message timestamp)
             try:
@@ -540,14 +4261,18 @@ def list_all_sessions():
                 "has_custom_prompt": bool(session.get("custom_prompt", "").strip()),
                 "created_at": created_at_str,
                 "last_activity": last_activity_str,
+                "archived": bool(session.get("archived")),
                 "short_id": session_id[:8]  # First 8 characters for easy reference
             }
+            if CLUSTER_ENABLED:
+                session_info["node"] = get_session_owner(session_id)
             session_list.append(session_info)
         
-        return jsonify({
+        response = jsonify({
             "sessions": session_list,
             "total_count": len(session_list)
         })
+        return with_etag(response, etag) if etag else response
     
     except Exception as e:
         print(f"Error in list_all_sessions: {e}")  # Debug print
@@ -556,14 +4281,23 @@ def list_all_sessions():
 @app.route("/api/sessions/<session_id>/status", methods=["GET"])
 def get_session_status(session_id):
     """Get session status and configuration"""
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
+    # Build counters change without a rebuild when requests are coalesced, so they are part of the tag
+    build_state = read_build_state(session_id)
+    versions = read_versions(session_id)
+    etag = make_etag("status", [versions.get(key) for key in ("epoch", "session", "documents", "index")],
+                     [build_state[key] for key in ("builds", "coalesced")])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     # Check if vector store exists
-    vector_store_path = get_vector_store_path(session_id)
-    vector_store_ready = os.path.exists(vector_store_path) and os.listdir(vector_store_path)
+    vector_store_ready = is_vector_store_ready(session_id)
+    index_info = get_index_info(session_id)
     
     # Count documents
     documents_path = get_documents_path(session_id)
@@ -581,21 +4315,70 @@ def get_session_status(session_id):
             # It's already a string (local storage)
             created_at_str = str(created_at)
     
-    return jsonify({
+    return with_etag(jsonify({
         "session_id": session_id,
         "user_description": session_data.get("user_description", ""),
         "use_case": session_data.get("use_case", ""),
         "documents_count": documents_count,
         "custom_prompt": session_data.get("custom_prompt", ""),
         "vector_store_ready": vector_store_ready,
+        "index": index_info,
+        "index_version": index_info.get("version"),
+        "retrieval": get_retrieval_settings(session_data),
+        "model": get_model_settings(session_data),
+        "duplicate_chunks_skipped": session_data.get("duplicate_chunks_skipped", 0),
+        "builds": {key: build_state[key] for key in ("builds", "coalesced")},
+        "last_restore": session_data.get("last_restore"),
         "created_at": created_at_str
+    }), etag)
+
+@app.route("/api/sessions/<session_id>", methods=["DELETE"])
+def delete_session(session_id):
+    """Delete a session with its documents, index, archive, conversations and summaries"""
+    # Verify session exists; a session directory left without its session document can be deleted too
+    session_data = get_session(session_id)
+    session_path = get_session_path(session_id)
+    if not session_data and not (SESSION_ID_PATTERN.fullmatch(session_id) and os.path.isdir(session_path)):
+        return jsonify({"error": "Session not found"}), 404
+    
+    # The document goes first so that other workers stop serving the session
+    sessions_collection.delete_many({"session_id": session_id})
+    messages = conversations_collection.delete_many({"session_id": session_id})
+    summaries_collection.delete_many({"session_id": session_id})
+    invalidate_session_cache(session_id)
+    
+    # A node that held the session before a rebalance drops its copy on its next rebalance pass
+    bytes_freed = remove_session_files(session_id)
+    bump_versions(session_id)  # Only the global counter is left to advance; refreshes the session list
+    
+    return jsonify({
+        "session_deleted": True,
+        "messages_deleted": messages.deleted_count,
+        "bytes_freed": bytes_freed
+    })
+
+@app.route("/api/sessions/<session_id>/export", methods=["GET"])
+def export_session(session_id):
+    """Stream the session, its documents and its built index as one .tar.gz snapshot"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    if CLUSTER_ENABLED and not os.path.isdir(get_session_path(session_id)):
+        # Another node asking for a session that is not stored here must not receive an empty snapshot
+        return jsonify({"error": "Session files are not stored on this node"}), 404
+    
+    include_conversations = request.args.get("conversations", "false").lower() == "true"
+    entries = iter_session_snapshot(session_id, session_data, include_conversations)
+    return Response(stream_with_context(iter_tar_gz(entries)), mimetype="application/gzip", headers={
+        "Content-Disposition": f"attachment; filename=session-{session_id[:8]}.tar.gz"
     })
 
 @app.route("/api/sessions/<session_id>/documents/upload", methods=["POST"])
 def upload_documents(session_id):
     """Upload and process training documents"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
@@ -604,9 +4387,12 @@ def upload_documents(session_id):
     
     files = request.files.getlist('files')
     uploaded_files = []
+    duplicates = []
     errors = []
     
     documents_path = get_documents_path(session_id)
+    # Content hash -> filename of every document already stored, to skip byte-identical re-uploads
+    known_hashes = {digest: filename for filename, digest in get_document_hashes(session_id).items()}
     
     for file in files:
         if file.filename == '':
@@ -617,7 +4403,14 @@ def upload_documents(session_id):
             file_path = os.path.join(documents_path, filename)
             
             try:
+                digest = file_sha256(file.stream)
+                if digest in known_hashes:
+                    duplicates.append({"filename": filename, "duplicate_of": known_hashes[digest]})
+                    continue
                 file.save(file_path)
+                remove_chunk_cache(session_id, filename)
+                known_hashes = {d: name for d, name in known_hashes.items() if name != filename}
+                known_hashes[digest] = filename
                 uploaded_files.append(filename)
             except Exception as e:
                 errors.append(f"Error saving {filename}: {str(e)}")
@@ -626,32 +4419,203 @@ def upload_documents(session_id):
     
     # Rebuild vector store
     vector_store_updated = False
+    build_stats = {}
     if uploaded_files:
-        vector_store_updated = build_vector_store_for_session(session_id)
+        bump_versions(session_id, "documents")
+        vector_store_updated = request_vector_store_build(session_id, stats=build_stats)
         
         # Update documents count in database
         documents_count = len([f for f in os.listdir(documents_path) 
                               if os.path.isfile(os.path.join(documents_path, f))])
-        sessions_collection.update_one(
-            {"session_id": session_id},
-            {"$set": {"documents_count": documents_count}}
-        )
+        update_session(session_id, {"documents_count": documents_count, **build_stats})
+        processing_status = "completed" if vector_store_updated else "failed"
+    else:
+        processing_status = "skipped" if duplicates else "failed"
     
     return jsonify({
         "uploaded_files": uploaded_files,
+        "duplicates": duplicates,
         "errors": errors,
         "vector_store_updated": vector_store_updated,
+        "duplicate_chunks_skipped": build_stats.get("duplicate_chunks_skipped", 0),
+        "processing_status": processing_status
+    })
+
+@app.route("/api/sessions/<session_id>/uploads", methods=["POST"])
+def create_upload(session_id):
+    """Start a resumable upload; parts are then sent with PUT and a Content-Range header"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = request.get_json() or {}
+    filename = secure_filename(data.get("filename", ""))
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": f"File type not allowed: {data.get('filename', '')}"}), 400
+    
+    size = data.get("size")
+    if not isinstance(size, int) or size < 0:
+        return jsonify({"error": "size (in bytes) is required"}), 400
+    if size > UPLOAD_MAX_FILE_SIZE:
+        return jsonify({"error": f"File too large (limit {UPLOAD_MAX_FILE_SIZE} bytes)"}), 413
+    
+    remove_expired_uploads(session_id)
+    
+    upload_id = uuid.uuid4().hex
+    upload_path = get_upload_path(session_id, upload_id)
+    os.makedirs(upload_path)
+    open(os.path.join(upload_path, "data.part"), "wb").close()
+    with open(os.path.join(upload_path, "upload.json"), "w") as f:
+        json.dump({"filename": filename, "size": size, "created_at": datetime.utcnow().isoformat()}, f)
+    
+    return jsonify({
+        "upload_id": upload_id,
+        "filename": filename,
+        "size": size,
+        "received": 0,
+        "part_size": UPLOAD_PART_SIZE
+    }), 201
+
+@app.route("/api/sessions/<session_id>/uploads/<upload_id>", methods=["GET"])
+def get_upload_status(session_id, upload_id):
+    """Report how many bytes have arrived, so a client can resume after a dropped connection"""
+    upload = load_upload(session_id, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    upload_path = get_upload_path(session_id, upload_id)
+    return jsonify({
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "received": upload_received_bytes(upload_path),
+        "chunks_indexed": _read_upload_progress(upload_path)["chunks"]
+    })
+
+@app.route("/api/sessions/<session_id>/uploads/<upload_id>", methods=["PUT"])
+def upload_part(session_id, upload_id):
+    """Append one byte range of an upload, streaming the request body straight to disk"""
+    upload = load_upload(session_id, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    # Content-Range: bytes <start>-<end>/<total>
+    content_range = request.headers.get("Content-Range", "")
+    try:
+        unit, _, byte_range = content_range.partition(" ")
+        span, _, total = byte_range.partition("/")
+        start, end = (int(value) for value in span.split("-"))
+        if unit != "bytes" or end < start or (total != "*" and int(total) != upload["size"]):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "Content-Range header of the form 'bytes start-end/total' is required"}), 400
+    if end >= upload["size"]:
+        return jsonify({"error": "Range extends past the declared file size"}), 416
+    
+    upload_path = get_upload_path(session_id, upload_id)
+    with file_lock(os.path.join(upload_path, "write.lock")):
+        received = upload_received_bytes(upload_path)
+        if end < received:
+            # A retry of a part we already have
+            return jsonify({"received": received})
+        if start != received:
+            return jsonify({"error": "Parts must be sent in order", "received": received}), 409
+        
+        expected = end - start + 1
+        written = 0
+        with open(os.path.join(upload_path, "data.part"), "ab") as f:
+            while written < expected:
+                block = request.stream.read(min(STREAM_BLOCK_SIZE, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        received += written
+    
+    # Chunk and embed what has arrived while the client sends the next part
+    schedule_upload_processing(session_id, upload_id)
+    
+    if written < expected:
+        return jsonify({"error": "Connection closed before the part was complete", "received": received}), 400
+    return jsonify({"received": received})
+
+@app.route("/api/sessions/<session_id>/uploads/<upload_id>/finalize", methods=["POST"])
+def complete_upload(session_id, upload_id):
+    """Finish an upload: move it into the documents folder and rebuild the vector store"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    upload = load_upload(session_id, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    
+    received = upload_received_bytes(get_upload_path(session_id, upload_id))
+    if received != upload["size"]:
+        return jsonify({"error": "Upload is incomplete", "received": received, "size": upload["size"]}), 409
+    
+    # A byte-identical document is already stored: drop the upload instead of indexing it twice
+    with open(os.path.join(get_upload_path(session_id, upload_id), "data.part"), "rb") as f:
+        digest = file_sha256(f)
+    for existing, existing_digest in get_document_hashes(session_id).items():
+        if existing_digest == digest:
+            shutil.rmtree(get_upload_path(session_id, upload_id), ignore_errors=True)
+            return jsonify({
+                "uploaded_files": [],
+                "duplicates": [{"filename": upload["filename"], "duplicate_of": existing}],
+                "errors": [],
+                "vector_store_updated": False,
+                "duplicate_chunks_skipped": 0,
+                "processing_status": "skipped"
+            })
+    
+    filename = finalize_upload(session_id, upload_id)
+    bump_versions(session_id, "documents")
+    
+    # Rebuild vector store
+    build_stats = {}
+    vector_store_updated = request_vector_store_build(session_id, stats=build_stats)
+    
+    # Update documents count in database
+    documents_path = get_documents_path(session_id)
+    documents_count = len([f for f in os.listdir(documents_path)
+                          if os.path.isfile(os.path.join(documents_path, f))])
+    update_session(session_id, {"documents_count": documents_count, **build_stats})
+    
+    return jsonify({
+        "uploaded_files": [filename],
+        "duplicates": [],
+        "errors": [],
+        "vector_store_updated": vector_store_updated,
+        "duplicate_chunks_skipped": build_stats.get("duplicate_chunks_skipped", 0),
         "processing_status": "completed" if vector_store_updated else "failed"
     })
 
+@app.route("/api/sessions/<session_id>/uploads/<upload_id>", methods=["DELETE"])
+def abort_upload(session_id, upload_id):
+    """Discard an unfinished upload"""
+    if not load_upload(session_id, upload_id):
+        return jsonify({"error": "Upload not found"}), 404
+    
+    shutil.rmtree(get_upload_path(session_id, upload_id), ignore_errors=True)
+    return jsonify({"upload_aborted": True, "upload_id": upload_id})
+
 @app.route("/api/sessions/<session_id>/documents", methods=["GET"])
 def list_documents(session_id):
     """List all uploaded documents for a session"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
+    versions = read_versions(session_id)
+    etag = make_etag("documents", versions.get("epoch"), versions.get("documents"))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     documents_path = get_documents_path(session_id)
     documents = []
     
@@ -667,13 +4631,13 @@ def list_documents(session_id):
                     "status": "processed"
                 })
     
-    return jsonify({"documents": documents})
+    return with_etag(jsonify({"documents": documents}), etag)
 
 @app.route("/api/sessions/<session_id>/documents/<filename>", methods=["DELETE"])
 def delete_document(session_id, filename):
     """Remove a specific document and rebuild vector store"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
@@ -685,17 +4649,17 @@ def delete_document(session_id, filename):
     
     try:
         os.remove(file_path)
+        remove_chunk_cache(session_id, os.path.basename(file_path))
+        bump_versions(session_id, "documents")
         
         # Rebuild vector store
-        vector_store_updated = build_vector_store_for_session(session_id)
+        build_stats = {}
+        vector_store_updated = request_vector_store_build(session_id, stats=build_stats)
         
         # Update documents count
         documents_count = len([f for f in os.listdir(documents_path) 
                               if os.path.isfile(os.path.join(documents_path, f))])
-        sessions_collection.update_one(
-            {"session_id": session_id},
-            {"$set": {"documents_count": documents_count}}
-        )
+        update_session(session_id, {"documents_count": documents_count, **build_stats})
         
         return jsonify({
             "deleted": filename,
@@ -708,7 +4672,7 @@ def delete_document(session_id, filename):
 def update_prompt(session_id):
     """Set or update custom instruction prompt"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
@@ -719,10 +4683,7 @@ def update_prompt(session_id):
     custom_prompt = data["custom_prompt"]
     
     # Update session in database
-    sessions_collection.update_one(
-        {"session_id": session_id},
-        {"$set": {"custom_prompt": custom_prompt}}
-    )
+    update_session(session_id, {"custom_prompt": custom_prompt})
     
     return jsonify({
         "prompt_updated": True,
@@ -732,20 +4693,162 @@ def update_prompt(session_id):
 @app.route("/api/sessions/<session_id>/prompt", methods=["GET"])
 def get_prompt(session_id):
     """Retrieve current custom prompt"""
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
-    return jsonify({
+    versions = read_versions(session_id)
+    etag = make_etag("prompt", versions.get("epoch"), versions.get("session"))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    return with_etag(jsonify({
         "custom_prompt": session_data.get("custom_prompt", ""),
         "default_prompt": "You are a helpful AI assistant."
+    }), etag)
+
+@app.route("/api/sessions/<session_id>/index/settings", methods=["PUT"])
+def update_index_settings(session_id):
+    """Override the vector index type, compression and parameters, then rebuild the index"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = request.get_json() or {}
+    index_type = data.get("index_type", "auto")
+    if index_type not in INDEX_TYPES:
+        return jsonify({"error": f"index_type must be one of: {', '.join(sorted(INDEX_TYPES))}"}), 400
+    
+    compression = data.get("compression", "none")
+    if compression not in INDEX_COMPRESSIONS:
+        return jsonify({"error": f"compression must be one of: {', '.join(sorted(INDEX_COMPRESSIONS))}"}), 400
+    
+    index_settings = {"index_type": index_type, "compression": compression}
+    for key in ("nlist", "nprobe", "hnsw_m", "ef_construction", "ef_search", "pq_m", "rerank_factor"):
+        if data.get(key) is not None:
+            try:
+                index_settings[key] = int(data[key])
+            except (TypeError, ValueError):
+                return jsonify({"error": f"{key} must be an integer"}), 400
+            if index_settings[key] < (0 if key == "rerank_factor" else 1):
+                return jsonify({"error": f"{key} must be positive"}), 400
+    
+    update_session(session_id, {"index_settings": index_settings})
+    vector_store_updated = request_vector_store_build(session_id)
+    
+    return jsonify({
+        "index_settings": index_settings,
+        "vector_store_updated": vector_store_updated,
+        "index": get_index_info(session_id)
+    })
+
+@app.route("/api/sessions/<session_id>/retrieval/settings", methods=["PUT"])
+def update_retrieval_settings(session_id):
+    """Override how many chunks retrieval puts into prompts; send {} to return to the defaults"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = request.get_json() or {}
+    retrieval_settings = {}
+    for key in ("min_k", "max_k", "fetch_k"):
+        if data.get(key) is not None:
+            try:
+                retrieval_settings[key] = int(data[key])
+            except (TypeError, ValueError):
+                return jsonify({"error": f"{key} must be an integer"}), 400
+            if not 1 <= retrieval_settings[key] <= RETRIEVAL_MAX_FETCH_K:
+                return jsonify({"error": f"{key} must be between 1 and {RETRIEVAL_MAX_FETCH_K}"}), 400
+    for key, low in (("score_threshold", -1.0), ("mmr_lambda", 0.0)):
+        if data.get(key) is not None:
+            try:
+                retrieval_settings[key] = float(data[key])
+            except (TypeError, ValueError):
+                return jsonify({"error": f"{key} must be a number"}), 400
+            if not low <= retrieval_settings[key] <= 1:
+                return jsonify({"error": f"{key} must be between {low:g} and 1"}), 400
+    if data.get("mmr") is not None:
+        retrieval_settings["mmr"] = bool(data["mmr"])
+    
+    effective = get_retrieval_settings({"retrieval_settings": retrieval_settings})
+    if effective["min_k"] > effective["max_k"]:
+        return jsonify({"error": "min_k must not be larger than max_k"}), 400
+    
+    update_session(session_id, {"retrieval_settings": retrieval_settings})
+    
+    return jsonify({
+        "retrieval_settings": retrieval_settings,
+        "effective": effective
+    })
+
+@app.route("/api/sessions/<session_id>/model/settings", methods=["PUT"])
+def update_model_settings(session_id):
+    """Pin a model or configure the small/large router for a session; send {} to return to the defaults"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = request.get_json() or {}
+    model_settings = {}
+    for key in ("model", "small_model", "large_model"):
+        if data.get(key) is not None:
+            if not isinstance(data[key], str) or not data[key].strip():
+                return jsonify({"error": f"{key} must be a model name"}), 400
+            model_settings[key] = data[key].strip()
+    for key in ("long_query_words", "deep_conversation_messages"):
+        if data.get(key) is not None:
+            try:
+                model_settings[key] = int(data[key])
+            except (TypeError, ValueError):
+                return jsonify({"error": f"{key} must be an integer"}), 400
+            if model_settings[key] < 1:
+                return jsonify({"error": f"{key} must be positive"}), 400
+    if data.get("min_score_spread") is not None:
+        try:
+            model_settings["min_score_spread"] = float(data["min_score_spread"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "min_score_spread must be a number"}), 400
+        if not 0 <= model_settings["min_score_spread"] <= 2:
+            return jsonify({"error": "min_score_spread must be between 0 and 2"}), 400
+    if data.get("router") is not None:
+        model_settings["router"] = bool(data["router"])
+    
+    update_session(session_id, {"model_settings": model_settings})
+    
+    # Missing models are accepted (they may be pulled later) but reported; prompts fall back meanwhile
+    effective = get_model_settings({"model_settings": model_settings})
+    available = get_available_models(refresh=True)
+    configured = {effective[key] for key in ("model", "small_model", "large_model") if effective[key]}
+    return jsonify({
+        "model_settings": model_settings,
+        "effective": effective,
+        "missing_models": sorted(m for m in configured if not is_model_available(m, available))
+                          if available is not None else None
     })
 
+def save_bot_message(session_id, conversation_id, bot_response, cancelled=None):
+    """Store an answer; one that was cut off is marked with why ("deadline" or "disconnect")"""
+    message = {
+        "session_id": session_id,
+        "conversation_id": conversation_id,
+        "message": bot_response,
+        "message_type": "bot",
+        "timestamp": datetime.utcnow()
+    }
+    if cancelled:
+        message["cancelled"] = cancelled
+    conversations_collection.insert_one(message)
+
 @app.route("/api/sessions/<session_id>/chat", methods=["POST"])
 def chat_with_session(session_id):
     """Send a message and receive a response"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    with CHAT_STAGE_SECONDS.labels("session_lookup").time():
+        session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
@@ -756,7 +4859,7 @@ def chat_with_session(session_id):
     user_message = data["message"]
     conversation_id = data.get("conversation_id", str(uuid.uuid4()))
     
-    # Save user message
+    # Save user message; it is kept even if the answer is discarded
     conversations_collection.insert_one({
         "session_id": session_id,
         "conversation_id": conversation_id,
@@ -764,36 +4867,157 @@ def chat_with_session(session_id):
         "message_type": "user",
         "timestamp": datetime.utcnow()
     })
+    bump_versions(session_id, "conversations")
     
     # Get bot response
-    bot_response = query_llm_with_session(session_id, user_message, conversation_id)
+    generation_stats = {}
+    deadline = get_request_deadline()
+    bot_response = query_llm_with_session(session_id, user_message, conversation_id, stats=generation_stats,
+                                          session_data=session_data, deadline=deadline)
     
-    # Save bot response
-    conversations_collection.insert_one({
-        "session_id": session_id,
-        "conversation_id": conversation_id,
-        "message": bot_response,
-        "message_type": "bot",
-        "timestamp": datetime.utcnow()
-    })
+    # Save bot response; an answer cut off by the deadline or a disconnect is kept only if the policy says so
+    cancelled = generation_stats.get("cancelled")
+    if not cancelled or (PARTIAL_ANSWER_POLICY == "save" and generation_stats.get("completion_tokens")):
+        save_bot_message(session_id, conversation_id, bot_response, cancelled)
+        bump_versions(session_id, "conversations")
+        
+        # Compact older turns into the running summary once the response is out
+        if session_data.get("rolling_memory", ROLLING_MEMORY_ENABLED):
+            schedule_conversation_summary(session_id, conversation_id)
     
-    # Check if context was used
-    context_used = bool(retrieve_context_for_session(session_id, user_message))
+    # Retrieval already ran for the prompt; report whether it found anything
+    context_used = generation_stats.pop("context_used", False)
     
     return jsonify({
         "response": bot_response,
         "conversation_id": conversation_id,
-        "context_used": context_used
+        "context_used": context_used,
+        "usage": generation_stats
     })
 
+@app.route("/api/sessions/<session_id>/chat/batch", methods=["POST"])
+def batch_chat_with_session(session_id):
+    """Answer a list of independent questions and stream the results back as JSON lines"""
+    # Verify session exists
+    session_data = get_session(session_id)
+    if not session_data:
+        return jsonify({"error": "Session not found"}), 404
+    
+    data = request.get_json()
+    if not data or not isinstance(data.get("questions"), list) or not data["questions"]:
+        return jsonify({"error": "questions must be a non-empty list"}), 400
+    
+    questions = [str(q) for q in data["questions"]]
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"}), 400
+    
+    parallelism = BATCH_MAX_PARALLELISM
+    if data.get("parallelism") is not None:
+        try:
+            parallelism = int(data["parallelism"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "parallelism must be an integer"}), 400
+        if parallelism < 1:
+            return jsonify({"error": "parallelism must be positive"}), 400
+        parallelism = min(parallelism, BATCH_MAX_PARALLELISM)
+    persist = data.get("persist", False)
+    if persist is None:
+        persist = False
+    if not isinstance(persist, bool):
+        return jsonify({"error": "persist must be a boolean"}), 400
+    conversation_id = data.get("conversation_id", str(uuid.uuid4()))
+    system_prompt = build_system_prompt(session_data)
+    # Batches may legitimately run for long, so only a deadline the client asks for applies
+    deadline = get_request_deadline(default_seconds=None)
+    
+    def generate():
+        started = time.perf_counter()
+        signals = []
+        contexts = retrieve_contexts_for_session(session_id, questions, signals=signals)
+        retrieval_s = time.perf_counter() - started
+        
+        def answer(index):
+            stats = {}
+            prompt = build_prompt(system_prompt, questions[index], contexts[index])
+            model, route = choose_model(session_data, questions[index], signals[index] if signals else None)
+            MODEL_ROUTES.labels(model, route).inc()
+            bot_response = generate_response(prompt, stats=stats, http=http, model=model, deadline=deadline)
+            if stats:
+                stats.update(model=model, route=route)
+            return index, bot_response, stats
+        
+        errors = 0
+        cancelled = 0
+        persisted = 0
+        with requests.Session() as http, ThreadPoolExecutor(max_workers=parallelism) as pool:
+            futures = [pool.submit(answer, i) for i in range(len(questions))]
+            try:
+                for future in as_completed(futures):
+                    index, bot_response, stats = future.result()
+                    if not stats:
+                        errors += 1
+                    elif stats.get("cancelled"):
+                        cancelled += 1
+                    
+                    if persist and (not stats.get("cancelled") or
+                                    (PARTIAL_ANSWER_POLICY == "save" and stats.get("completion_tokens"))):
+                        conversations_collection.insert_one({
+                            "session_id": session_id,
+                            "conversation_id": conversation_id,
+                            "message": questions[index],
+                            "message_type": "user",
+                            "timestamp": datetime.utcnow()
+                        })
+                        save_bot_message(session_id, conversation_id, bot_response, stats.get("cancelled"))
+                        persisted += 1
+                    
+                    yield json.dumps({
+                        "index": index,
+                        "question": questions[index],
+                        "response": bot_response,
+                        "context_used": bool(contexts[index]),
+                        "usage": stats
+                    }) + "\n"
+            except GeneratorExit:
+                # The client went away: drop queued questions and stop the generations in flight
+                deadline.cancel("disconnect")
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                # Also when the client went away: the answers stored so far change the conversations
+                if persisted:
+                    bump_versions(session_id, "conversations")
+        
+        elapsed_s = time.perf_counter() - started
+        yield json.dumps({"summary": {
+            "questions": len(questions),
+            "errors": errors,
+            "cancelled": cancelled,
+            "parallelism": parallelism,
+            "persisted": persist,
+            "conversation_id": conversation_id if persist else None,
+            "retrieval_seconds": round(retrieval_s, 3),
+            "elapsed_seconds": round(elapsed_s, 3),
+            "questions_per_minute": round(len(questions) / elapsed_s * 60, 1) if elapsed_s else None
+        }}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @app.route("/api/sessions/<session_id>/conversations", methods=["GET"])
 def get_conversations(session_id):
     """Retrieve conversation history"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
+    versions = read_versions(session_id)
+    etag = make_etag("conversations", versions.get("epoch"), versions.get("conversations"))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     # Get all conversations for this session
     messages = list(conversations_collection.find(
         {"session_id": session_id},
@@ -820,13 +5044,13 @@ def get_conversations(session_id):
             "messages": msgs
         })
     
-    return jsonify({"conversations": conversation_list})
+    return with_etag(jsonify({"conversations": conversation_list}), etag)
 
 @app.route("/api/sessions/<session_id>/conversations/<conversation_id>", methods=["DELETE"])
 def clear_conversation(session_id, conversation_id):
     """Clear specific conversation history"""
     # Verify session exists
-    session_data = sessions_collection.find_one({"session_id": session_id})
+    session_data = get_session(session_id)
     if not session_data:
         return jsonify({"error": "Session not found"}), 404
     
@@ -835,12 +5059,24 @@ def clear_conversation(session_id, conversation_id):
         "session_id": session_id,
         "conversation_id": conversation_id
     })
+    summaries_collection.delete_many({
+        "session_id": session_id,
+        "conversation_id": conversation_id
+    })
+    bump_versions(session_id, "conversations")
     
     return jsonify({
         "conversation_cleared": True,
         "messages_deleted": result.deleted_count
     })
 
+if TIERING_ENABLED:
+    start_tiering_worker()
+
+if CLUSTER_ENABLED:
+    sync_cluster_config()
+    start_rebalance_worker()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5002, debug=True)
 
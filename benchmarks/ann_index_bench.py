@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Vector index benchmark for the Enhanced AI Chatbot Platform
+Builds flat, IVF and HNSW indexes with the same code path as build_vector_store_for_session and
+reports build time, recall@10 against the exact flat index and single-query p50/p99 latency.
+
+Vectors are synthetic (clustered, unit length, 384 dimensions like all-MiniLM-L6-v2), so no
+documents or Ollama are needed:
+    python benchmarks/ann_index_bench.py --sizes 10000 50000 200000
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import choose_index_settings, create_faiss_index  # noqa: E402
+
+
+def synthetic_vectors(count, dimension, rng, clusters=256):
+    """Clustered unit vectors, which resemble sentence embeddings better than uniform noise"""
+    centers = rng.standard_normal((clusters, dimension)).astype("float32")
+    assignments = rng.integers(0, clusters, size=count)
+    vectors = centers[assignments] + 0.35 * rng.standard_normal((count, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def measure(index, queries, truth, k):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(found[0]) & set(expected))
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare flat, IVF and HNSW vector indexes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, help="Override IVF nprobe")
+    parser.add_argument("--nlist", type=int, help="Override IVF nlist")
+    parser.add_argument("--ef-search", type=int, help="Override HNSW efSearch")
+    parser.add_argument("--hnsw-m", type=int, help="Override HNSW M")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    overrides = {"nprobe": args.nprobe, "nlist": args.nlist, "ef_search": args.ef_search, "hnsw_m": args.hnsw_m}
+
+    print(f"{'chunks':>8} | {'index':<5} | {'params':<44} | {'build s':>8} | {'recall@' + str(args.k):>9} | "
+          f"{'p50 ms':>7} | {'p99 ms':>7}")
+    print("-" * 106)
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dimension, rng)
+        queries = synthetic_vectors(args.queries, args.dimension, rng)
+
+        truth = None
+        for index_type in ("flat", "ivf", "hnsw"):
+            settings = choose_index_settings(size, dict(overrides, index_type=index_type))
+            started = time.perf_counter()
+            index = create_faiss_index(vectors, settings)
+            build_s = time.perf_counter() - started
+
+            if truth is None:
+                _, truth = index.search(queries, args.k)
+            result = measure(index, queries, truth, args.k)
+            params = ", ".join(f"{key}={value}" for key, value in settings.items() if key != "index_type")
+            print(f"{size:>8} | {index_type:<5} | {params:<44} | {build_s:>8.2f} | {result['recall']:>9.3f} | "
+                  f"{result['p50_ms']:>7.3f} | {result['p99_ms']:>7.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Chunking benchmark for the Enhanced AI Chatbot Platform
+Splits large TXT and DOCX documents with the recursive character splitter the app used before
+and with the app's StructuredChunker, and reports seconds, chunks/sec, chunk count and how
+many chunks end cleanly at a sentence, line or paragraph end.
+
+Pass your own files to measure on real content:
+    python benchmarks/chunking_bench.py --documents manual.docx export.txt
+Without --documents a synthetic TXT and DOCX of --paragraphs paragraphs each are generated.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter  # noqa: E402
+
+import app  # noqa: E402
+
+WORDS = ("account billing invoice refund shipping order delivery warranty password login device battery "
+         "screen network router firmware update install configure error timeout backup restore storage "
+         "plan upgrade cancel subscription support contact hours policy return exchange price discount").split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+
+
+def generate_documents(work_dir, paragraphs, rng):
+    """A TXT file and a DOCX file with headings every ~20 paragraphs and a few tables"""
+    from docx import Document as DocxDocument
+
+    txt_lines = []
+    docx_file = DocxDocument()
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            title = f"Section {i // 20 + 1}: {rng.choice(WORDS)} {rng.choice(WORDS)}"
+            txt_lines.append(f"# {title}")
+            docx_file.add_heading(title, 1)
+        text = " ".join(sentence(rng) for _ in range(rng.choice([1, 2, 4, 8, 16])))
+        txt_lines.append(text)
+        docx_file.add_paragraph(text)
+        if i % 100 == 50:
+            table = docx_file.add_table(rows=11, cols=3)
+            for row, cells in enumerate(table.rows):
+                for column, cell in enumerate(cells.cells):
+                    cell.text = ["Plan", "Price", "Notes"][column] if row == 0 else rng.choice(WORDS)
+    txt_path = os.path.join(work_dir, "synthetic.txt")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(txt_lines))
+    docx_path = os.path.join(work_dir, "synthetic.docx")
+    docx_file.save(docx_path)
+    return [txt_path, docx_path]
+
+
+def clean_ends(chunks, text):
+    """Chunks that end at a sentence, line or paragraph end rather than mid-sentence"""
+    clean = 0
+    position = 0
+    for chunk in chunks:
+        tail = chunk[-40:]
+        found = text.find(tail, position)
+        if found == -1:
+            continue
+        position = found + 1
+        end = found + len(tail)
+        clean += end == len(text) or text[end] == "\n" or tail.rstrip()[-1:] in (".", "!", "?")
+    return clean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the recursive splitter with the structure-aware chunker")
+    parser.add_argument("--documents", nargs="*", default=[])
+    parser.add_argument("--paragraphs", type=int, default=20000, help="Synthetic paragraphs per generated file")
+    parser.add_argument("--chunk-size", type=int, default=app.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=app.CHUNK_OVERLAP)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chunking_bench_")
+    try:
+        paths = args.documents or generate_documents(work_dir, args.paragraphs, random.Random(args.seed))
+        splitters = [
+            ("recursive", RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)),
+            ("structured", app.StructuredChunker(args.chunk_size, args.chunk_overlap, "chars")),
+            ("structured/tok", app.StructuredChunker(args.chunk_size // 4, args.chunk_overlap // 4, "tokens")),
+        ]
+
+        print(f"{'document':<24} | {'splitter':<14} | {'seconds':>8} | {'chunks/s':>9} | {'chunks':>7} | "
+              f"{'avg len':>7} | {'clean ends':>10}")
+        print("-" * 97)
+        for path in paths:
+            started = time.perf_counter()
+            docs = app.process_document(path)
+            load_s = time.perf_counter() - started
+            text = "\n\n".join(doc.page_content for doc in docs)
+            name = f"{os.path.basename(path)} ({len(text) / 1e6:.1f}MB)"
+            for label, splitter in splitters:
+                started = time.perf_counter()
+                chunks = [chunk.page_content for chunk in splitter.split_documents(docs)]
+                elapsed = time.perf_counter() - started
+                average = sum(map(len, chunks)) / max(len(chunks), 1)
+                ends = clean_ends(chunks, text) / max(len(chunks), 1)
+                print(f"{name:<24} | {label:<14} | {elapsed:>8.2f} | {len(chunks) / elapsed:>9.0f} | "
+                      f"{len(chunks):>7} | {average:>7.0f} | {ends:>10.0%}")
+            print(f"{'':<24} | {'(load)':<14} | {load_s:>8.2f} |")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
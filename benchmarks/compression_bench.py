@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Vector compression benchmark for the Enhanced AI Chatbot Platform
+Embeds a corpus with the app's all-MiniLM-L6-v2 model, builds the index uncompressed, with
+float16 scalar quantization and with product quantization (with and without re-ranking), and
+reports index bytes per chunk, p50/p99 search latency and recall@10 against the uncompressed index.
+
+Pass your own files to measure on real content:
+    python benchmarks/compression_bench.py --documents manual.pdf faq.docx --index-type flat
+Without --documents a synthetic corpus of --chunks sentences is generated.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+WORDS = ("account billing invoice refund shipping order delivery warranty password login device battery "
+         "screen network router firmware update install configure error timeout backup restore storage "
+         "plan upgrade cancel subscription support contact hours policy return exchange price discount").split()
+
+
+def load_corpus(documents, chunk_count, rng):
+    if documents:
+        docs = []
+        for path in documents:
+            docs.extend(app.process_document(path))
+        return [chunk.page_content for chunk in app.StructuredChunker().split_documents(docs)]
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 80))) for _ in range(chunk_count)]
+
+
+def measure(store, query_vectors, k):
+    latencies = []
+    results = []
+    for vector in query_vectors:
+        started = time.perf_counter()
+        _, ids = store.index.search(vector.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(ids[0])
+    return results, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare uncompressed, float16 and PQ vector indexes")
+    parser.add_argument("--documents", nargs="*", default=[])
+    parser.add_argument("--chunks", type=int, default=20000, help="Synthetic corpus size when no documents are given")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (must divide 384)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = load_corpus(args.documents, args.chunks, rng)
+    chunks = [app.Document(page_content=text, metadata={}) for text in texts]
+    print(f"Embedding {len(texts)} chunks with {app.EMBEDDING_MODEL_NAME}...")
+    started = time.perf_counter()
+    vectors = np.asarray(app.embeddings.embed_documents(texts), dtype="float32")
+    print(f"Embedded in {time.perf_counter() - started:.1f}s")
+
+    # Queries are the opening words of random chunks, like a user asking about that passage
+    query_texts = [" ".join(text.split()[:12]) for text in rng.sample(texts, min(args.queries, len(texts)))]
+    query_vectors = np.asarray(app.embeddings.embed_documents(query_texts), dtype="float32")
+
+    configs = [
+        ("none", {}),
+        ("fp16", {}),
+        ("pq", {"rerank_factor": 4}),
+        ("pq", {"rerank_factor": 0}),
+    ]
+    work_dir = tempfile.mkdtemp(prefix="compression_bench_")
+    baseline = None
+    print(f"\n{'compression':<18} | {'bytes/chunk':>11} | {'build s':>8} | {'recall@' + str(args.k):>9} | "
+          f"{'p50 ms':>7} | {'p99 ms':>7}")
+    print("-" * 76)
+    try:
+        for compression, extra in configs:
+            overrides = dict(extra, index_type=args.index_type, compression=compression, pq_m=args.pq_m)
+            settings = app.choose_index_settings(len(chunks), overrides, vectors.shape[1])
+            path = os.path.join(work_dir, f"{compression}_{extra.get('rerank_factor', '')}")
+
+            started = time.perf_counter()
+            app.save_vector_store(path, app.create_faiss_index(vectors, settings), chunks, settings)
+            build_s = time.perf_counter() - started
+
+            store = app.SessionVectorStore(app.get_published_index_path(path))
+            results, p50, p99 = measure(store, query_vectors, args.k)
+            if baseline is None:
+                baseline = results
+            recall = np.mean([len(set(found) & set(expected)) / args.k for found, expected in zip(results, baseline)])
+
+            bytes_per_chunk = os.path.getsize(os.path.join(store.path, app.INDEX_FILE)) / len(chunks)
+            label = settings["compression"]
+            if settings["compression"] == "pq":
+                label += f" m={settings['pq_m']} rerank={settings['rerank_factor']}"
+            print(f"{label:<18} | {bytes_per_chunk:>11.0f} | {build_s:>8.2f} | {recall:>9.3f} | {p50:>7.3f} | {p99:>7.3f}")
+            store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
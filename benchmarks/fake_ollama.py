@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Fake Ollama server for load-testing the Enhanced AI Chatbot Platform
+Implements /api/generate (streaming and non-streaming), /api/chat and /api/tags with the same
+response shapes as Ollama, but generates filler text at a configurable speed instead of running
+a model. Latency is modelled as time-to-first-token (fixed part plus prompt prefill) followed by
+tokens at --tokens-per-sec, with at most --parallel requests generating at once like
+OLLAMA_NUM_PARALLEL; the rest queue.
+
+    python benchmarks/fake_ollama.py --port 11435 --ttft-ms 300 --tokens-per-sec 25
+    OLLAMA_URL=http://localhost:11435/api/generate python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = ("Based on the provided documents the answer depends on the account settings and the "
+          "current plan so please check the configuration page before contacting support again").split()
+
+
+class FakeOllama:
+    """Latency model and request counters shared by all handler threads"""
+
+    def __init__(self, args):
+        self.args = args
+        self.models = args.models
+        self.slots = threading.Semaphore(args.parallel)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "errors_injected": 0, "active": 0, "tokens": 0, "cancelled": 0}
+        self.random = random.Random(args.seed)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.args.error_rate
+
+    def response_tokens(self, options):
+        limit = options.get("num_predict")
+        tokens = self.args.response_tokens
+        if self.args.jitter:
+            with self.lock:
+                tokens = max(1, int(tokens * self.random.uniform(1 - self.args.jitter, 1 + self.args.jitter)))
+        return min(tokens, limit) if limit and limit > 0 else tokens
+
+    def generate(self, prompt, options):
+        """Yield (token, stats) pairs; stats is None until the final item"""
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = self.response_tokens(options)
+        queued_at = time.perf_counter()
+        with self.slots:
+            self.count("active")
+            try:
+                started = time.perf_counter()
+                prefill = self.args.ttft_ms / 1000 + prompt_tokens / self.args.prefill_tokens_per_sec
+                time.sleep(prefill)
+                prefilled = time.perf_counter()
+                interval = 1 / self.args.tokens_per_sec
+                for i in range(completion_tokens):
+                    # Sleep to the token's due time so that slow writes do not add up
+                    delay = prefilled + (i + 1) * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    token = FILLER[i % len(FILLER)]
+                    yield (token if i == 0 else " " + token), None
+                finished = time.perf_counter()
+            finally:
+                self.count("active", -1)
+        self.count("tokens", completion_tokens)
+        yield "", {
+            "total_duration": int((finished - queued_at) * 1e9),
+            "load_duration": int((started - queued_at) * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int((prefilled - started) * 1e9),
+            "eval_count": completion_tokens,
+            "eval_duration": int((finished - prefilled) * 1e9)
+        }
+
+
+def chat_prompt(messages):
+    return "\n".join(f"{message.get('role', 'user')}: {message.get('content', '')}" for message in messages)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOllama/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.fake.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path == "/api/tags":
+            now = datetime.now(timezone.utc).isoformat()
+            self.send_json(200, {"models": [{
+                "name": name, "model": name, "modified_at": now, "size": 2_000_000_000,
+                "digest": hashlib.sha256(name.encode()).hexdigest(),
+                "details": {"format": "gguf", "family": "fake", "parameter_size": "3B",
+                            "quantization_level": "Q4_K_M"}
+            } for name in fake.models]})
+        elif self.path == "/api/ps":
+            self.send_json(200, {"models": [], "fake": dict(fake.counters)})
+        elif self.path in ("/", ""):
+            payload = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        fake = self.server.fake
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "invalid JSON body"})
+            return
+
+        fake.count("requests")
+        model = body.get("model") or fake.models[0]
+        if model not in fake.models:
+            self.send_json(404, {"error": f"model '{model}' not found, try pulling it first"})
+            return
+        if fake.should_fail():
+            fake.count("errors_injected")
+            self.send_json(500, {"error": "fake ollama: injected failure"})
+            return
+
+        is_chat = self.path == "/api/chat"
+        prompt = chat_prompt(body.get("messages", [])) if is_chat else body.get("prompt", "")
+        options = body.get("options") or {}
+        # Ollama streams unless told otherwise
+        if body.get("stream", True):
+            self.stream(model, prompt, options, is_chat)
+        else:
+            text = []
+            for token, stats in fake.generate(prompt, options):
+                text.append(token)
+            self.send_json(200, self.message(model, "".join(text), is_chat, stats))
+
+    def message(self, model, text, is_chat, stats=None):
+        body = {"model": model, "created_at": datetime.now(timezone.utc).isoformat()}
+        if is_chat:
+            body["message"] = {"role": "assistant", "content": text}
+        else:
+            body["response"] = text
+        body["done"] = stats is not None
+        if stats is not None:
+            body["done_reason"] = "stop"
+            body.update(stats)
+        return body
+
+    def stream(self, model, prompt, options, is_chat):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token, stats in self.server.fake.generate(prompt, options):
+                line = (json.dumps(self.message(model, token, is_chat, stats)) + "\n").encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream; stop generating like Ollama does
+            self.server.fake.count("cancelled")
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama API with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", nargs="+", default=["llama3.2:3b"], help="Models listed by /api/tags")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Fixed time to first token")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=2000,
+                        help="Prompt processing speed; longer prompts wait longer for the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=30, help="Generation speed per request")
+    parser.add_argument("--response-tokens", type=int, default=150, help="Tokens per response")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative random spread of response length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--parallel", type=int, default=4, help="Requests generated at once; others queue")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.fake = FakeOllama(args)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port} "
+          f"(ttft {args.ttft_ms:.0f} ms, {args.tokens_per_sec:g} tokens/s, {args.response_tokens} tokens, "
+          f"parallel {args.parallel}, error rate {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {server.fake.counters['requests']} requests, "
+              f"{server.fake.counters['errors_injected']} injected errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for the Enhanced AI Chatbot Platform
+Drives /api/sessions/<id>/chat and the document upload endpoint from --concurrency client
+threads and reports throughput and latency percentiles per endpoint. Pair it with
+benchmarks/fake_ollama.py to size gunicorn workers without a real model:
+
+    python benchmarks/fake_ollama.py --port 11435 &
+    OLLAMA_URL=http://localhost:11435/api/generate gunicorn -c gunicorn_config.py app:app
+    python benchmarks/load_test.py --base-url http://localhost:5002 --concurrency 16 --duration 60
+
+Each client keeps its own conversation for --turns messages before starting a new one, so
+conversation history grows as it would for real users. --upload-ratio mixes in uploads of
+unique generated text files (identical files would be skipped as duplicates). When sessions route
+questions between models, chat latency is also reported per model as chat:<model>.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+QUESTIONS = [
+    "What does the documentation say about resetting a password?",
+    "How long does delivery usually take?",
+    "Summarize the refund policy in two sentences.",
+    "Which plans include priority support?",
+    "What should I do if the device does not turn on?",
+    "Can you explain that in more detail?",
+    "What are the steps to configure the router?",
+    "Is there a discount for annual subscriptions?",
+]
+
+WORDS = ("account billing invoice refund shipping order delivery warranty password login device battery "
+         "screen network router firmware update install configure backup restore plan upgrade").split()
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Thread-safe latency and error collection per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, endpoint, seconds, ok, error=None):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(seconds * 1000)
+            else:
+                self.errors.setdefault(endpoint, {})
+                self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+    def summary(self, elapsed):
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies.get(endpoint, [])
+            errors = self.errors.get(endpoint, {})
+            report[endpoint] = {
+                "ok": len(samples),
+                "errors": sum(errors.values()),
+                "error_kinds": errors,
+                "throughput_rps": round(len(samples) / elapsed, 3),
+                "p50_ms": round(percentile(samples, 0.50), 1),
+                "p90_ms": round(percentile(samples, 0.90), 1),
+                "p99_ms": round(percentile(samples, 0.99), 1),
+                "max_ms": round(max(samples), 1) if samples else 0.0
+            }
+        return report
+
+
+def create_session(base_url, name):
+    response = requests.post(f"{base_url}/api/sessions/create", json={
+        "user_description": name,
+        "use_case": "Created by benchmarks/load_test.py"
+    }, timeout=30)
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+def generated_document(rng, kilobytes):
+    lines = []
+    size = 0
+    while size < kilobytes * 1024:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+        lines.append(line)
+        size += len(line) + 1
+    # A unique first line keeps the content hash unique across uploads
+    return f"Load test document {uuid.uuid4()}\n" + "\n".join(lines)
+
+
+class Client:
+    """One simulated user: a pooled HTTP session and its current conversation"""
+
+    def __init__(self, args, session_id, recorder, seed):
+        self.args = args
+        self.base = f"{args.base_url}/api/sessions/{session_id}"
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.conversation_id = None
+        self.turns = 0
+
+    def request(self, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, url, timeout=self.args.timeout, **kwargs)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                self.recorder.add(endpoint, elapsed, False, f"HTTP {response.status_code}")
+                return None
+            self.recorder.add(endpoint, elapsed, True)
+            return response
+        except requests.exceptions.Timeout:
+            self.recorder.add(endpoint, time.perf_counter() - started, False, "timeout")
+        except requests.exceptions.RequestException as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, False, type(e).__name__)
+        return None
+
+    def chat(self):
+        if self.conversation_id is None or self.turns >= self.args.turns:
+            self.conversation_id = str(uuid.uuid4())
+            self.turns = 0
+        self.turns += 1
+        response = self.request("chat", "POST", f"{self.base}/chat", json={
+            "message": self.rng.choice(QUESTIONS),
+            "conversation_id": self.conversation_id
+        })
+        if response is None:
+            return
+        data = response.json()
+        if data.get("response", "").startswith("**"):
+            # The app turns Ollama failures into a 200 with an error message; count them as errors
+            self.recorder.add("chat_llm_error", 0, False, data["response"].split("**")[1])
+        elif data.get("usage", {}).get("model"):
+            # Per-model rows show the routing ratio and each model's latency
+            self.recorder.add(f"chat:{data['usage']['model']}", response.elapsed.total_seconds(), True)
+
+    def upload(self):
+        name = f"load_{uuid.uuid4().hex[:12]}.txt"
+        content = generated_document(self.rng, self.args.upload_kb)
+        self.request("upload", "POST", f"{self.base}/documents/upload",
+                     files={"files": (name, content.encode(), "text/plain")})
+
+    def step(self):
+        if self.rng.random() < self.args.upload_ratio:
+            self.upload()
+        else:
+            self.chat()
+
+
+def run_clients(args, session_id, recorder, stop_at, budget):
+    """Run --concurrency clients until the deadline or the shared request budget is used up"""
+    budget_lock = threading.Lock()
+
+    def take():
+        with budget_lock:
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+            return True
+
+    def worker(index):
+        client = Client(args, session_id, recorder, args.seed + index)
+        while time.time() < stop_at and take():
+            client.step()
+            if args.think_time:
+                time.sleep(client.rng.expovariate(1 / args.think_time))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+
+
+def print_report(report, elapsed, args):
+    print(f"\nConcurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"{'endpoint':<20} | {'ok':>6} | {'errors':>6} | {'req/s':>7} | {'p50 ms':>8} | "
+          f"{'p90 ms':>8} | {'p99 ms':>8} | {'max ms':>8}")
+    print("-" * 96)
+    for endpoint, stats in report.items():
+        print(f"{endpoint:<20} | {stats['ok']:>6} | {stats['errors']:>6} | {stats['throughput_rps']:>7.2f} | "
+              f"{stats['p50_ms']:>8.1f} | {stats['p90_ms']:>8.1f} | {stats['p99_ms']:>8.1f} | {stats['max_ms']:>8.1f}")
+        for kind, count in stats["error_kinds"].items():
+            print(f"    {count} x {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat and upload endpoints")
+    parser.add_argument("--base-url", default="http://localhost:5002")
+    parser.add_argument("--session-id", help="Existing session to use (default: create one)")
+    parser.add_argument("--documents", nargs="*", default=[], help="Documents uploaded to a new session first")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8],
+                        help="Concurrent clients; several values run one stage each, e.g. 1 4 16 32")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per stage")
+    parser.add_argument("--requests", type=int, default=0, help="Stop a stage after this many requests (0: no limit)")
+    parser.add_argument("--turns", type=int, default=6, help="Messages per conversation before starting a new one")
+    parser.add_argument("--upload-ratio", type=float, default=0.0, help="Fraction of requests that upload a document")
+    parser.add_argument("--upload-kb", type=int, default=64, help="Size of generated upload documents")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a client's requests (s)")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--output", help="Write the per-stage results to this JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        requests.get(f"{args.base_url}/api/health", timeout=10)
+    except requests.exceptions.RequestException as e:
+        print(f"Error: the app is not reachable at {args.base_url}: {e}")
+        return 1
+
+    session_id = args.session_id
+    if not session_id:
+        session_id = create_session(args.base_url, f"Load test {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Created session {session_id}")
+        for path in args.documents:
+            with open(path, "rb") as f:
+                response = requests.post(f"{args.base_url}/api/sessions/{session_id}/documents/upload",
+                                         files={"files": f}, timeout=600)
+            print(f"Uploaded {path}: HTTP {response.status_code}")
+
+    stages = []
+    concurrency_levels = args.concurrency
+    for concurrency in concurrency_levels:
+        args.concurrency = concurrency
+        recorder = Recorder()
+        budget = [args.requests or float("inf")]
+        started = time.time()
+        run_clients(args, session_id, recorder, started + args.duration, budget)
+        elapsed = time.time() - started
+        report = recorder.summary(elapsed)
+        print_report(report, elapsed, args)
+        stages.append({"concurrency": concurrency, "elapsed_s": round(elapsed, 2), "endpoints": report})
+    args.concurrency = concurrency_levels
+
+    if len(stages) > 1:
+        print(f"\n{'clients':>8} | {'chat req/s':>10} | {'chat p50 ms':>11} | {'chat p99 ms':>11}")
+        for stage in stages:
+            chat = stage["endpoints"].get("chat", {})
+            print(f"{stage['concurrency']:>8} | {chat.get('throughput_rps', 0):>10.2f} | "
+                  f"{chat.get('p50_ms', 0):>11.1f} | {chat.get('p99_ms', 0):>11.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"session_id": session_id, "parameters": vars(args), "stages": stages}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
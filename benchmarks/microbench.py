@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark suite for the Enhanced AI Chatbot Platform
+Times the ingest, retrieval and prompt-assembly code paths of app.py on a synthetic corpus:
+process_document per format, chunking, embedding, build_vector_store_for_session end to end,
+retrieve_context_for_session, get_conversation_context on the local store and prompt assembly.
+
+Runs offline: MongoDB is bypassed (local JSON store) and Ollama is not called. Results are
+written as JSON; pass a previous run as --baseline to flag regressions:
+    python benchmarks/microbench.py --output baseline.json
+    python benchmarks/microbench.py --output current.json --baseline baseline.json
+--hash-embeddings replaces the sentence-transformers model with a hashing embedder, for
+machines without the model cached or to time everything except the model itself.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("account billing invoice refund shipping order delivery warranty password login device battery "
+         "screen network router firmware update install configure error timeout backup restore storage "
+         "plan upgrade cancel subscription support contact hours policy return exchange price discount").split()
+
+# Metric name -> which direction is an improvement
+HIGHER_IS_BETTER = "higher"
+LOWER_IS_BETTER = "lower"
+
+
+class HashEmbeddings:
+    """Deterministic bag-of-words hashing embedder with the app model's dimension"""
+
+    def __init__(self, *args, dimension=384, **kwargs):
+        self.dimension = dimension
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype="float32")
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng) for _ in range(rng.choice([1, 2, 4, 8])))
+
+
+def generate_corpus(directory, paragraphs, rng):
+    """Write one synthetic document per supported format; returns {extension: path}"""
+    texts = [paragraph(rng) for _ in range(paragraphs)]
+    paths = {}
+
+    paths["txt"] = os.path.join(directory, "corpus.txt")
+    with open(paths["txt"], "w", encoding="utf-8") as f:
+        f.write("\n\n".join(f"# Section {i // 20 + 1}\n\n{text}" if i % 20 == 0 else text
+                            for i, text in enumerate(texts)))
+
+    from docx import Document as DocxDocument
+    docx_file = DocxDocument()
+    for i, text in enumerate(texts):
+        if i % 20 == 0:
+            docx_file.add_heading(f"Section {i // 20 + 1}", 1)
+        docx_file.add_paragraph(text)
+    paths["docx"] = os.path.join(directory, "corpus.docx")
+    docx_file.save(paths["docx"])
+
+    try:
+        import fitz
+        pdf_file = fitz.open()
+        for start in range(0, len(texts), 6):
+            page = pdf_file.new_page()
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), "\n\n".join(texts[start:start + 6]), fontsize=8)
+        paths["pdf"] = os.path.join(directory, "corpus.pdf")
+        pdf_file.save(paths["pdf"])
+    except ImportError:
+        print("PyMuPDF is not installed; skipping the PDF benchmark")
+
+    records = [{"id": i, "title": f"Item {i}", "body": text, "tags": rng.sample(WORDS, 3),
+                "details": {"price": rng.randint(1, 500), "stock": rng.randint(0, 99)}}
+               for i, text in enumerate(texts)]
+    paths["json"] = os.path.join(directory, "corpus.json")
+    with open(paths["json"], "w", encoding="utf-8") as f:
+        json.dump({"exported_at": "2024-01-01", "items": records}, f)
+    paths["jsonl"] = os.path.join(directory, "corpus.jsonl")
+    with open(paths["jsonl"], "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+    return paths
+
+
+def percentiles(samples_ms):
+    return float(np.percentile(samples_ms, 50)), float(np.percentile(samples_ms, 99))
+
+
+def timed(function, repeat):
+    """Best wall time of ``repeat`` runs (seconds) and the last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def latencies(function, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def run_suite(app, args, work_dir):
+    rng = random.Random(args.seed)
+    results = {}
+
+    def record(name, value, unit, better, **extra):
+        results[name] = dict(value=round(value, 4), unit=unit, better=better, **extra)
+        print(f"  {name:<40} {value:>12.3f} {unit}")
+
+    corpus_dir = os.path.join(work_dir, "corpus")
+    os.makedirs(corpus_dir)
+    print(f"Generating a corpus of {args.paragraphs} paragraphs per format...")
+    paths = generate_corpus(corpus_dir, args.paragraphs, rng)
+
+    print("process_document")
+    loaded = {}
+    for extension, path in paths.items():
+        seconds, docs = timed(lambda: app.process_document(path), args.repeat)
+        loaded[extension] = docs
+        megabytes = os.path.getsize(path) / 1e6
+        record(f"process_document.{extension}", megabytes / seconds, "MB/s", HIGHER_IS_BETTER,
+               seconds=round(seconds, 4), megabytes=round(megabytes, 2))
+
+    print("chunking")
+    chunker = app.StructuredChunker()
+    seconds, chunks = timed(lambda: chunker.split_documents(loaded["txt"]), args.repeat)
+    record("chunking.txt", len(chunks) / seconds, "chunks/s", HIGHER_IS_BETTER, chunks=len(chunks))
+    seconds, docx_chunks = timed(lambda: chunker.split_documents(loaded["docx"]), args.repeat)
+    record("chunking.docx", len(docx_chunks) / seconds, "chunks/s", HIGHER_IS_BETTER, chunks=len(docx_chunks))
+
+    print("embedding")
+    texts = [chunk.page_content for chunk in chunks[:args.embed_chunks]]
+    app.embeddings.embed_documents(texts[:8])  # Load the model before timing
+    seconds, _ = timed(lambda: app.embeddings.embed_documents(texts), 1)
+    record("embedding.documents", len(texts) / seconds, "chunks/s", HIGHER_IS_BETTER, chunks=len(texts))
+    queries = [" ".join(rng.choice(WORDS) for _ in range(8)) for _ in range(args.queries)]
+    p50, p99 = latencies(app.embeddings.embed_query, queries)
+    record("embedding.query_p50", p50, "ms", LOWER_IS_BETTER)
+
+    print("build_vector_store_for_session")
+    session_id = str(uuid.uuid4())
+    app.create_session_directories(session_id)
+    app.sessions_collection.insert_one({"session_id": session_id, "created_at": datetime.utcnow()})
+    for path in paths.values():
+        shutil.copy(path, app.get_documents_path(session_id))
+
+    def build():
+        # Cold build: drop the per-file chunk cache that JSON builds and streamed uploads fill
+        shutil.rmtree(app.get_chunk_cache_path(session_id), ignore_errors=True)
+        return app.build_vector_store_for_session(session_id)
+    seconds, built = timed(build, args.repeat)
+    if not built:
+        raise RuntimeError("build_vector_store_for_session failed; see the output above")
+    index_info = app.get_index_info(session_id)
+    record("build.cold", seconds, "s", LOWER_IS_BETTER, chunks=index_info.get("chunks"))
+    seconds, _ = timed(lambda: app.build_vector_store_for_session(session_id), args.repeat)
+    record("build.cached_json", seconds, "s", LOWER_IS_BETTER)
+
+    print("retrieve_context_for_session")
+    app.retrieve_context_for_session(session_id, queries[0])  # Open the index before timing
+    p50, p99 = latencies(lambda query: app.retrieve_context_for_session(session_id, query), queries)
+    record("retrieve.p50", p50, "ms", LOWER_IS_BETTER)
+    record("retrieve.p99", p99, "ms", LOWER_IS_BETTER)
+
+    print("get_conversation_context (local store)")
+    conversation_ids = [str(uuid.uuid4()) for _ in range(args.conversations)]
+    started_at = datetime.utcnow() - timedelta(days=1)
+    messages = []
+    for i in range(args.messages):
+        messages.append({
+            "_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "conversation_id": conversation_ids[i % len(conversation_ids)],
+            "message": sentence(rng),
+            "message_type": "user" if i % 2 == 0 else "bot",
+            "timestamp": started_at + timedelta(seconds=i)
+        })
+    if hasattr(app.conversations_collection, "data"):
+        # Seed the local JSON store in one write instead of one file rewrite per message
+        app.conversations_collection.data.extend(messages)
+        app.conversations_collection._save_data()
+    else:
+        app.conversations_collection.insert_many(messages)
+    sample_ids = [rng.choice(conversation_ids) for _ in range(args.queries)]
+    p50, p99 = latencies(lambda cid: app.get_conversation_context(session_id, cid), sample_ids)
+    record("conversation_context.p50", p50, "ms", LOWER_IS_BETTER, messages=args.messages)
+    record("conversation_context.p99", p99, "ms", LOWER_IS_BETTER)
+    p50, p99 = latencies(lambda cid: app.get_conversation_context(session_id, cid, rolling_memory=True), sample_ids)
+    record("conversation_context.rolling_p50", p50, "ms", LOWER_IS_BETTER)
+
+    print("prompt assembly")
+    session_data = app.get_session(session_id)
+    doc_context = app.retrieve_context_for_session(session_id, queries[0])
+    conv_context = app.get_conversation_context(session_id, conversation_ids[0])
+
+    def assemble(query):
+        system_prompt = app.build_system_prompt(session_data)
+        return app.build_prompt(system_prompt, query, doc_context, conv_context)
+    p50, p99 = latencies(assemble, queries)
+    record("prompt_assembly.p50", p50 * 1000, "us", LOWER_IS_BETTER, prompt_chars=len(assemble(queries[0])))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change per metric and return the names of metrics that regressed past ``threshold``"""
+    regressions = []
+    print(f"\n{'metric':<40} | {'baseline':>12} | {'current':>12} | {'change':>8}")
+    print("-" * 82)
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous["value"]:
+            print(f"{name:<40} | {'-':>12} | {result['value']:>12.3f} | {'new':>8}")
+            continue
+        change = (result["value"] - previous["value"]) / previous["value"]
+        worse = -change if result["better"] == HIGHER_IS_BETTER else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} | {previous['value']:>12.3f} | {result['value']:>12.3f} | {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, retrieval and prompt assembly offline")
+    parser.add_argument("--paragraphs", type=int, default=2000, help="Paragraphs per generated document")
+    parser.add_argument("--embed-chunks", type=int, default=1000, help="Chunks embedded for the throughput test")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5000, help="Messages seeded into the local store")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per throughput measurement (best is kept)")
+    parser.add_argument("--hash-embeddings", action="store_true",
+                        help="Use a hashing embedder instead of all-MiniLM-L6-v2")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown that counts as a regression (default 20%%)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="microbench_")
+    # Isolate the run: session data under the temp dir, local JSON store instead of MongoDB
+    os.environ["UPLOAD_FOLDER"] = os.path.join(work_dir, "vector_stores")
+    os.environ["MONGO_URI"] = os.environ.get("MICROBENCH_MONGO_URI", "mongodb://127.0.0.1:1/")
+    os.chdir(work_dir)
+    if args.hash_embeddings:
+        import langchain_huggingface
+        langchain_huggingface.HuggingFaceEmbeddings = HashEmbeddings
+    sys.path.insert(0, ROOT)
+    import app
+
+    try:
+        results = run_suite(app, args, work_dir)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "embeddings": "hash" if args.hash_embeddings else app.EMBEDDING_MODEL_NAME,
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "threshold")}
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("parameters") != report["meta"]["parameters"]:
+            print("\nWarning: the baseline was run with different parameters; differences may not be regressions")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
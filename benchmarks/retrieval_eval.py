@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Adaptive retrieval evaluation for the Enhanced AI Chatbot Platform
+Asks every question of an evaluation set twice, once with fixed k=10 retrieval (the previous
+behaviour) and once with adaptive retrieval (score cutoff, min/max k and MMR), and reports the
+chunks per prompt, prompt tokens, time to first token and generation time of each.
+
+The evaluation set is a JSON Lines file with one {"question": ..., "expected": [...]} object per
+line; "expected" lists words or phrases a correct answer contains and is optional. Requires the
+app and Ollama (or benchmarks/fake_ollama.py) to be running, e.g.:
+    python benchmarks/retrieval_eval.py --session-id <id> --eval-set eval.jsonl
+    python benchmarks/retrieval_eval.py --documents manual.pdf --eval-set eval.jsonl --score-threshold 0.35
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+import requests
+
+FIXED_K = 10
+DEFAULT_QUESTIONS = [
+    {"question": "Give me a short overview of the main topics covered in the documents."},
+    {"question": "What are the most important numbers or figures mentioned?"},
+    {"question": "Summarize the steps someone should follow to get started."},
+    {"question": "What common mistakes should be avoided?"},
+    {"question": "Which key terms are defined, and what do they mean?"},
+]
+
+
+def load_eval_set(path):
+    if not path:
+        return DEFAULT_QUESTIONS
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                items.append(item if isinstance(item, dict) else {"question": str(item)})
+    return items
+
+
+def create_session(base_url, documents):
+    response = requests.post(f"{base_url}/api/sessions/create", json={
+        "user_description": "Retrieval evaluation",
+        "use_case": "benchmark"
+    }, timeout=30)
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+    files = [("files", open(path, "rb")) for path in documents]
+    try:
+        requests.post(f"{base_url}/api/sessions/{session_id}/documents/upload",
+                      files=files, timeout=600).raise_for_status()
+    finally:
+        for _, handle in files:
+            handle.close()
+    return session_id
+
+
+def set_retrieval(base_url, session_id, settings):
+    response = requests.put(f"{base_url}/api/sessions/{session_id}/retrieval/settings", json=settings, timeout=30)
+    response.raise_for_status()
+    return response.json()["effective"]
+
+
+def run_questions(base_url, session_id, items):
+    rows = []
+    for item in items:
+        started = time.perf_counter()
+        # A new conversation per question keeps history out of the prompt
+        response = requests.post(f"{base_url}/api/sessions/{session_id}/chat", json={
+            "message": item["question"],
+            "conversation_id": str(uuid.uuid4())
+        }, timeout=600)
+        response.raise_for_status()
+        wall_ms = (time.perf_counter() - started) * 1000
+        data = response.json()
+        usage = data.get("usage", {})
+        expected = item.get("expected") or []
+        answer = data.get("response", "").lower()
+        rows.append({
+            "question": item["question"],
+            "context_chunks": usage.get("context_chunks", 0),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "ttft_ms": usage.get("time_to_first_token_ms", 0.0),
+            "generation_ms": usage.get("total_duration_ms", 0.0),
+            "wall_ms": round(wall_ms, 1),
+            "answer_hit": all(phrase.lower() in answer for phrase in expected) if expected else None
+        })
+    return rows
+
+
+def summarize(rows):
+    hits = [row["answer_hit"] for row in rows if row["answer_hit"] is not None]
+    return {
+        "questions": len(rows),
+        "mean_context_chunks": round(statistics.mean(r["context_chunks"] for r in rows), 2),
+        "mean_prompt_tokens": round(statistics.mean(r["prompt_tokens"] for r in rows), 1),
+        "mean_ttft_ms": round(statistics.mean(r["ttft_ms"] for r in rows), 1),
+        "mean_generation_ms": round(statistics.mean(r["generation_ms"] for r in rows), 1),
+        "p50_generation_ms": round(statistics.median(r["generation_ms"] for r in rows), 1),
+        "mean_wall_ms": round(statistics.mean(r["wall_ms"] for r in rows), 1),
+        "answer_hit_rate": round(sum(hits) / len(hits), 3) if hits else None
+    }
+
+
+def print_report(summaries):
+    fixed, adaptive = summaries["fixed_k10"], summaries["adaptive"]
+    print(f"\n{'metric':<22} | {'fixed k=10':>12} | {'adaptive':>12} | {'change':>8}")
+    print("-" * 64)
+    for key in ("mean_context_chunks", "mean_prompt_tokens", "mean_ttft_ms", "mean_generation_ms",
+                "p50_generation_ms", "mean_wall_ms", "answer_hit_rate"):
+        before, after = fixed[key], adaptive[key]
+        if before is None:
+            continue
+        change = f"{(after - before) / before:+.1%}" if before else "-"
+        print(f"{key:<22} | {before:>12} | {after:>12} | {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare adaptive retrieval with fixed k=10 on an evaluation set")
+    parser.add_argument("--base-url", default="http://localhost:5002")
+    parser.add_argument("--session-id", help="Session to evaluate (default: create one from --documents)")
+    parser.add_argument("--documents", nargs="*", default=[], help="Files uploaded to a new session")
+    parser.add_argument("--eval-set", help="JSON Lines file of {\"question\", \"expected\"} objects")
+    parser.add_argument("--min-k", type=int)
+    parser.add_argument("--max-k", type=int)
+    parser.add_argument("--score-threshold", type=float)
+    parser.add_argument("--mmr-lambda", type=float)
+    parser.add_argument("--no-mmr", action="store_true")
+    parser.add_argument("--output", help="Write per-question rows and summaries to this JSON file")
+    args = parser.parse_args()
+
+    if not args.session_id and not args.documents:
+        parser.error("pass --session-id or --documents")
+    session_id = args.session_id or create_session(args.base_url, args.documents)
+    items = load_eval_set(args.eval_set)
+
+    status = requests.get(f"{args.base_url}/api/sessions/{session_id}/status", timeout=30)
+    status.raise_for_status()
+    original = status.json().get("retrieval", {})
+
+    adaptive = {"min_k": args.min_k, "max_k": args.max_k, "score_threshold": args.score_threshold,
+                "mmr_lambda": args.mmr_lambda, "mmr": False if args.no_mmr else None}
+    adaptive = {key: value for key, value in adaptive.items() if value is not None}
+    configurations = {
+        "fixed_k10": {"min_k": FIXED_K, "max_k": FIXED_K, "fetch_k": FIXED_K, "score_threshold": -1, "mmr": False},
+        "adaptive": adaptive
+    }
+
+    results, summaries, effective = {}, {}, {}
+    try:
+        for name, settings in configurations.items():
+            effective[name] = set_retrieval(args.base_url, session_id, settings)
+            print(f"Running {len(items)} questions with {name} retrieval {effective[name]}...")
+            results[name] = run_questions(args.base_url, session_id, items)
+            summaries[name] = summarize(results[name])
+    finally:
+        # Put back the settings the session had (as explicit values)
+        set_retrieval(args.base_url, session_id, original)
+
+    print_report(summaries)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"session_id": session_id, "settings": effective, "summaries": summaries,
+                       "questions": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
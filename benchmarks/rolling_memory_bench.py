@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Rolling memory benchmark for the Enhanced AI Chatbot Platform
+Runs the same long conversation against two sessions, one with rolling memory off and one
+with it on, and reports prompt tokens and time-to-first-token per turn.
+
+Requires the app and Ollama to be running, e.g.:
+    python benchmarks/rolling_memory_bench.py --base-url http://localhost:5002 --turns 20
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import requests
+
+DEFAULT_QUESTIONS = [
+    "Give me a detailed overview of the main topics covered in the documents.",
+    "Explain the first topic you mentioned in more depth, with examples.",
+    "What are the most important numbers or figures mentioned?",
+    "How does the second topic relate to the first one?",
+    "Summarize the steps someone should follow to get started.",
+    "What common mistakes should be avoided?",
+    "Can you list the key terms and define each of them?",
+    "Which parts of the documents would you read first and why?",
+]
+
+
+def create_session(base_url, rolling_memory, documents):
+    """Create a benchmark session and optionally upload documents to it"""
+    response = requests.post(f"{base_url}/api/sessions/create", json={
+        "user_description": f"Rolling memory benchmark ({'on' if rolling_memory else 'off'})",
+        "use_case": "benchmark",
+        "rolling_memory": rolling_memory
+    }, timeout=30)
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+
+    if documents:
+        files = [("files", open(path, "rb")) for path in documents]
+        try:
+            requests.post(f"{base_url}/api/sessions/{session_id}/documents/upload",
+                          files=files, timeout=600).raise_for_status()
+        finally:
+            for _, handle in files:
+                handle.close()
+    return session_id
+
+
+def run_conversation(base_url, session_id, turns, pause):
+    """Send ``turns`` messages in one conversation and collect per-turn usage"""
+    conversation_id = None
+    rows = []
+    for turn in range(turns):
+        payload = {"message": DEFAULT_QUESTIONS[turn % len(DEFAULT_QUESTIONS)]}
+        if conversation_id:
+            payload["conversation_id"] = conversation_id
+
+        started = time.perf_counter()
+        response = requests.post(f"{base_url}/api/sessions/{session_id}/chat", json=payload, timeout=600)
+        response.raise_for_status()
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        data = response.json()
+        conversation_id = data["conversation_id"]
+        usage = data.get("usage", {})
+        rows.append({
+            "turn": turn + 1,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "ttft_ms": usage.get("time_to_first_token_ms", 0.0),
+            "wall_ms": wall_ms
+        })
+        # Give the background summarizer time to finish so it does not compete with the next turn
+        time.sleep(pause)
+    return rows
+
+
+def print_report(results):
+    print(f"\n{'turn':>4} | {'tokens off':>10} {'ttft off':>10} | {'tokens on':>10} {'ttft on':>10}")
+    print("-" * 56)
+    for off, on in zip(results[False], results[True]):
+        print(f"{off['turn']:>4} | {off['prompt_tokens']:>10} {off['ttft_ms']:>8.0f}ms | "
+              f"{on['prompt_tokens']:>10} {on['ttft_ms']:>8.0f}ms")
+
+    print("\nSummary")
+    for mode in (False, True):
+        rows = results[mode]
+        print(f"  rolling memory {'on ' if mode else 'off'}: "
+              f"mean prompt tokens {statistics.mean(r['prompt_tokens'] for r in rows):.0f}, "
+              f"max prompt tokens {max(r['prompt_tokens'] for r in rows)}, "
+              f"mean TTFT {statistics.mean(r['ttft_ms'] for r in rows):.0f}ms, "
+              f"mean wall time {statistics.mean(r['wall_ms'] for r in rows):.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt size and TTFT with and without rolling memory")
+    parser.add_argument("--base-url", default="http://localhost:5002")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--pause", type=float, default=5.0, help="Seconds to wait between turns")
+    parser.add_argument("--documents", nargs="*", default=[], help="Files to upload to both sessions")
+    args = parser.parse_args()
+
+    results = {}
+    for rolling_memory in (False, True):
+        session_id = create_session(args.base_url, rolling_memory, args.documents)
+        print(f"Running {args.turns} turns with rolling memory {'on' if rolling_memory else 'off'} "
+              f"(session {session_id[:8]})...")
+        results[rolling_memory] = run_conversation(args.base_url, session_id, args.turns, args.pause)
+
+    print_report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Vector store memory benchmark for the Enhanced AI Chatbot Platform
+Measures per-worker memory with many sessions loaded, comparing the previous layout
+(FAISS.load_local with a pickled docstore) against the memory-mapped index and SQLite chunk store.
+
+Several worker processes load every session and run one search per session, like gunicorn
+workers that have each served every bot once. RSS counts shared mapped pages in full for every
+process; PSS splits them between the processes that share them, so it shows the real cost.
+    python benchmarks/vector_store_memory_bench.py --sessions 1000 --chunks 200 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import uuid
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_mb():
+    """Return (rss, pss) of the current process in MB (Linux only)"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1]) / 1024
+    return values["Rss:"], values["Pss:"]
+
+
+def worker(mode, work_dir, session_ids, dimension, barrier, results):
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    import app
+
+    base_rss, base_pss = memory_mb()
+    query = np.random.default_rng(0).standard_normal((1, dimension)).astype("float32")
+    stores = []
+    for session_id in session_ids:
+        if mode == "pickle":
+            path = os.path.join(work_dir, "legacy", session_id)
+            store = app.FAISS.load_local(path, app.embeddings, allow_dangerous_deserialization=True)
+            _, ids = store.index.search(query, 10)
+            [store.docstore.search(store.index_to_docstore_id[i]) for i in ids[0]]
+        else:
+            store = app.load_vector_store_for_session(session_id)
+            store.similarity_search_by_vectors(query, k=10)
+        stores.append(store)
+
+    # Measure while every worker still holds its stores so shared pages are split between them
+    barrier.wait()
+    rss, pss = memory_mb()
+    results.put((mode, rss - base_rss, pss - base_pss))
+    barrier.wait()
+
+
+def random_text(rng, length):
+    return "".join(rng.choice(string.ascii_lowercase + "     ") for _ in range(length))
+
+
+def create_sessions(work_dir, count, chunks, dimension):
+    sys.path.insert(0, ROOT)
+    import app
+
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    session_ids = []
+    for _ in range(count):
+        session_id = str(uuid.uuid4())
+        vectors = np_rng.standard_normal((chunks, dimension)).astype("float32")
+        documents = [app.Document(page_content=random_text(rng, 500), metadata={"source": "bench.txt"})
+                     for _ in range(chunks)]
+
+        index = app.create_faiss_index(vectors, {"index_type": "flat"})
+        app.save_vector_store(app.get_vector_store_path(session_id), index, documents, {"index_type": "flat"})
+
+        docstore_ids = [str(uuid.uuid4()) for _ in documents]
+        legacy = app.FAISS(
+            embedding_function=app.embeddings,
+            index=app.create_faiss_index(vectors, {"index_type": "flat"}),
+            docstore=InMemoryDocstore(dict(zip(docstore_ids, documents))),
+            index_to_docstore_id=dict(enumerate(docstore_ids))
+        )
+        legacy.save_local(os.path.join(work_dir, "legacy", session_id))
+        session_ids.append(session_id)
+    return session_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-worker memory of pickled and memory-mapped vector stores")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks per session")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dimension", type=int, default=384)
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("This benchmark reads /proc/self/smaps_rollup and needs Linux")
+        return 1
+
+    work_dir = tempfile.mkdtemp(prefix="vector_store_bench_")
+    os.environ["UPLOAD_FOLDER"] = os.path.join(work_dir, "vector_stores")
+    os.environ["VECTOR_STORE_CACHE_SIZE"] = str(args.sessions)
+    os.chdir(work_dir)
+
+    started = time.perf_counter()
+    print(f"Creating {args.sessions} sessions with {args.chunks} chunks each in {work_dir}...")
+    session_ids = create_sessions(work_dir, args.sessions, args.chunks, args.dimension)
+    print(f"Created in {time.perf_counter() - started:.1f}s")
+
+    context = multiprocessing.get_context("spawn")
+    for mode in ("pickle", "mmap"):
+        barrier = context.Barrier(args.workers)
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(mode, work_dir, session_ids, args.dimension, barrier, results))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        measurements = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        rss = [m[1] for m in measurements]
+        pss = [m[2] for m in measurements]
+        print(f"{mode:>6}: per-worker RSS +{np.mean(rss):.0f} MB, PSS +{np.mean(pss):.0f} MB "
+              f"({args.workers} workers, total PSS +{sum(pss):.0f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
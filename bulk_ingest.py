@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Offline bulk ingestion for the Enhanced AI Chatbot Platform
+Loads a large document set (a directory, or a .zip / .tar / .tar.gz / .tar.bz2 / .tar.xz archive)
+straight into a session on the server's disk, so the upload endpoint's request size limit and
+worker timeout don't apply, and the index is built only once:
+
+    python bulk_ingest.py ./docs --session-id <id>
+    python bulk_ingest.py manuals.tar.gz --create "Product manuals" --workers 16
+
+The files are copied into the session's documents folder, with byte-identical files skipped. A
+process pool parses and chunks them. The chunks are embedded in large batches, and each file's
+chunks and vectors go into the session's chunk cache as soon as they are ready. The index is then
+built once from that cache. The chunk cache is also the checkpoint: after an interruption, run the
+same command again and files that were already embedded are skipped.
+
+Run it with the app's environment (.env) on the node that stores the session. The app can keep
+serving meanwhile.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import numpy as np
+from werkzeug.utils import secure_filename
+
+import app
+
+PROGRESS_INTERVAL = 10  # Seconds between progress lines
+
+
+def iter_source_files(source):
+    """Yield (relative name, size, open function) for every file of a directory or archive
+
+    Tar members are read in order, so each file must be consumed before the next one is requested.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source), os.path.getsize(path), lambda path=path: open(path, "rb")
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: archive.open(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member)
+    else:
+        raise SystemExit(f"{source} is not a directory, zip or tar archive")
+
+
+def save_document_hashes(session_id, entries):
+    """Add the hashes computed while copying to the session's hash cache, so the app need not read the files again"""
+    hashes_path = os.path.join(app.get_session_path(session_id), app.DOCUMENT_HASHES_FILE)
+    try:
+        with open(hashes_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    cached.update(entries)
+    tmp_path = f"{hashes_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cached, f)
+    os.replace(tmp_path, hashes_path)
+
+
+def copy_documents(session_id, source, stats):
+    """Copy the source's supported files into the session; returns the document paths of this ingest
+
+    A file is only left as it is when the stored document's SHA-256 matches the source bytes, so a
+    document edited since an earlier run is replaced even if its size did not change.
+    """
+    documents_path = app.get_documents_path(session_id)
+    stored_hashes = app.get_document_hashes(session_id)
+    known_hashes = {digest: name for name, digest in stored_hashes.items()}
+    copied_names = set()
+    documents = []
+    new_hashes = {}
+    for relative_name, size, open_file in iter_source_files(source):
+        # Subdirectories become part of the name: a/readme.txt -> a_readme.txt
+        filename = secure_filename(relative_name)
+        if not filename or not app.allowed_file(filename):
+            stats["unsupported"] += 1
+            continue
+        if filename in copied_names:
+            # a/b.txt and a_b.txt flatten to the same name; the first one keeps it
+            print(f"Skipping {relative_name}: another file of the source is already stored as {filename}")
+            stats["name_collisions"] += 1
+            continue
+        copied_names.add(filename)
+        path = os.path.join(documents_path, filename)
+
+        # Copied under a name the app ignores, then renamed, so a build never reads a partial file.
+        # Archive members can only be read once, so the copy is made before its hash is known
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        with open_file() as source_file, open(tmp_path, "wb") as target:
+            for block in iter(lambda: source_file.read(app.STREAM_BLOCK_SIZE), b""):
+                digest.update(block)
+                target.write(block)
+        digest = digest.hexdigest()
+        if stored_hashes.get(filename) == digest:
+            os.remove(tmp_path)
+            stats["already_present"] += 1  # Copied by an earlier run
+            documents.append(path)
+            continue
+        if known_hashes.get(digest, filename) != filename:
+            os.remove(tmp_path)
+            stats["duplicates"] += 1
+            continue
+        os.replace(tmp_path, path)
+        app.remove_chunk_cache(session_id, filename)
+        stat = os.stat(path)
+        known_hashes[digest] = filename
+        new_hashes[filename] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        stats["copied"] += 1
+        stats["bytes_copied"] += size
+        documents.append(path)
+        if len(new_hashes) >= 100:
+            save_document_hashes(session_id, new_hashes)
+            new_hashes = {}
+    if new_hashes:
+        save_document_hashes(session_id, new_hashes)
+    return documents
+
+
+def parse_document(path):
+    """Parse and chunk one document (runs in a worker process); returns (path, chunks, error)"""
+    chunker = app.StructuredChunker()
+    try:
+        if Path(path).suffix.lower() in app.JSON_EXTENSIONS:
+            # Records are split on their own, as the app's streaming JSON ingest does
+            chunks = [chunk for doc in app.iter_json_documents(path) for chunk in chunker.split_documents([doc])]
+        else:
+            chunks = chunker.split_documents(app.process_document(path))
+    except Exception as e:
+        return path, [], str(e)
+    return path, chunks, None
+
+
+def embed_batch(session_id, batch):
+    """Embed the chunks of several documents in one call and store each document's share in the chunk cache"""
+    texts = [chunk.page_content for _, chunks in batch for chunk in chunks]
+    vectors = np.asarray(app.embeddings.embed_documents(texts), dtype="float32")
+    offset = 0
+    for path, chunks in batch:
+        app.save_chunk_cache(session_id, path, chunks, vectors[offset:offset + len(chunks)])
+        offset += len(chunks)
+
+
+def embed_documents(session_id, paths, args, stats):
+    """Parse in a process pool and embed in batches of at least --batch-size chunks as results arrive"""
+    started = time.perf_counter()
+    last_report = started
+    pending = iter(paths)
+    running = set()
+    batch = []
+    batch_chunks = 0
+
+    def report():
+        elapsed = time.perf_counter() - started
+        print(f"  {stats['embedded']}/{len(paths)} documents, {stats['chunks']} chunks, "
+              f"{stats['embedded'] / elapsed:.1f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s", flush=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            # Two documents per worker in flight keep the pool busy while the batch is embedded
+            while len(running) < 2 * args.workers:
+                path = next(pending, None)
+                if path is None:
+                    break
+                running.add(pool.submit(parse_document, path))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, chunks, error = future.result()
+                if error:
+                    print(f"Error parsing {os.path.basename(path)}: {error}")
+                    stats["failed"] += 1
+                elif not chunks:
+                    stats["empty"] += 1
+                else:
+                    batch.append((path, chunks))
+                    batch_chunks += len(chunks)
+            if batch and (batch_chunks >= args.batch_size or not running):
+                embed_batch(session_id, batch)
+                stats["embedded"] += len(batch)
+                stats["chunks"] += batch_chunks
+                batch, batch_chunks = [], 0
+            if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                report()
+                last_report = time.perf_counter()
+    if paths:
+        report()
+    return time.perf_counter() - started
+
+
+def resolve_session(args):
+    if args.session_id:
+        session_data = app.get_session(args.session_id)
+        if not session_data:
+            raise SystemExit(f"Session {args.session_id} not found")
+        session_id = args.session_id
+    else:
+        session_id = app.create_session_record(args.create, args.use_case)["session_id"]
+        print(f"Created session {session_id}")
+        session_data = app.get_session(session_id)
+    if not app.owns_session(session_id):
+        raise SystemExit(f"Session {session_id} is stored on {app.get_session_owner(session_id)}; run this there")
+    if session_data.get("archived"):
+        print(f"Restoring archived session {session_id}...")
+        app.restore_session(session_id)
+    return session_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory or archive of documents into a session")
+    parser.add_argument("source", help="Directory, .zip or .tar(.gz|.bz2|.xz) archive")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--session-id", help="Existing session to add the documents to")
+    target.add_argument("--create", metavar="DESCRIPTION", help="Create a new session with this description")
+    parser.add_argument("--use-case", default="", help="Use case of a session made with --create")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--batch-size", type=int, default=2048, help="Chunks embedded per batch")
+    parser.add_argument("--output", help="Write the ingest statistics to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    session_id = resolve_session(args)
+    stats = {"copied": 0, "bytes_copied": 0, "already_present": 0, "duplicates": 0, "unsupported": 0,
+             "name_collisions": 0, "already_embedded": 0, "embedded": 0, "empty": 0, "failed": 0, "chunks": 0}
+    timings = {}
+    started = time.perf_counter()
+
+    try:
+        print(f"Copying documents from {args.source}...")
+        phase = time.perf_counter()
+        documents = copy_documents(session_id, args.source, stats)
+        timings["copy_s"] = round(time.perf_counter() - phase, 2)
+        print(f"  {stats['copied']} copied ({stats['bytes_copied'] / 1024 ** 2:.1f} MB), "
+              f"{stats['already_present']} already present, {stats['duplicates']} duplicates, "
+              f"{stats['unsupported']} unsupported, {stats['name_collisions']} name collisions")
+
+        pending = [path for path in documents if app.read_chunk_cache_meta(session_id, path) is None]
+        stats["already_embedded"] = len(documents) - len(pending)
+        print(f"Parsing and embedding {len(pending)} documents with {args.workers} workers "
+              f"({stats['already_embedded']} already embedded)...")
+        timings["embed_s"] = round(embed_documents(session_id, pending, args, stats), 2)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {stats['embedded']} documents; run the same command again to resume")
+        return 130
+
+    print("Building the index...")
+    phase = time.perf_counter()
+    build_stats = {}
+    app.bump_versions(session_id, "documents")
+    built = app.request_vector_store_build(session_id, stats=build_stats)
+    documents_path = app.get_documents_path(session_id)
+    documents_count = len([f for f in os.listdir(documents_path) if os.path.isfile(os.path.join(documents_path, f))])
+    app.update_session(session_id, {"documents_count": documents_count, **build_stats})
+    timings["build_s"] = round(time.perf_counter() - phase, 2)
+    timings["total_s"] = round(time.perf_counter() - started, 2)
+
+    embed_s = timings["embed_s"] or 1e-9
+    throughput = {
+        "documents_per_s": round(stats["embedded"] / embed_s, 2),
+        "chunks_per_s": round(stats["chunks"] / embed_s, 1),
+        "copy_mb_per_s": round(stats["bytes_copied"] / 1024 ** 2 / (timings["copy_s"] or 1e-9), 1)
+    }
+    print(f"\nSession {session_id}: {documents_count} documents, index {'built' if built else 'NOT built'} "
+          f"({app.get_index_info(session_id).get('chunks', 0)} chunks)")
+    print(f"{stats['embedded']} documents and {stats['chunks']} chunks embedded in {timings['embed_s']:.1f}s: "
+          f"{throughput['documents_per_s']} docs/s, {throughput['chunks_per_s']} chunks/s")
+    print(f"Copy {timings['copy_s']:.1f}s, parse + embed {timings['embed_s']:.1f}s, build {timings['build_s']:.1f}s, "
+          f"total {timings['total_s']:.1f}s")
+    if stats["failed"]:
+        print(f"{stats['failed']} documents could not be parsed")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"session_id": session_id, "parameters": vars(args), "stats": stats, "timings": timings,
+                       "throughput": throughput, "index_built": built}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0 if built else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
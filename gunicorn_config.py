@@ -4,6 +4,11 @@ Gunicorn configuration file for production deployment
 
 import multiprocessing
 import os
+import shutil
+
+# Prometheus: workers write their metrics here and /metrics sums them. Must be set before the
+# workers import the app, and is emptied at startup so counters do not carry over between runs
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', 'logs/prometheus_multiproc')
 
 # Server Socket
 bind = f"0.0.0.0:{os.getenv('PORT', '5002')}"
@@ -42,6 +47,9 @@ tmp_upload_dir = None
 def on_starting(server):
     """Called just before the master process is initialized."""
     print("Starting Gunicorn server...")
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -74,3 +82,9 @@ def post_request(worker, req, environ, resp):
 def worker_exit(server, worker):
     """Called just after a worker has been exited."""
     print(f"Worker exited (pid: {worker.pid})")
+
+def child_exit(server, worker):
+    """Called in the master after a worker has exited."""
+    # Drop the dead worker's live gauges (in-flight requests) from the aggregate
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Session snapshot tool for the Enhanced AI Chatbot Platform
+Exports a session (configuration, custom prompt, documents, chunk cache and built index) to one
+.tar.gz file, and imports such a file into another server without re-embedding the documents.
+Both directions stream, so snapshots never have to fit in memory:
+
+    python session_snapshot.py export <session_id> -o bot.tar.gz --conversations
+    python session_snapshot.py --admin-token $ADMIN_TOKEN --base-url http://staging:5002 import bot.tar.gz
+    python session_snapshot.py --admin-token $ADMIN_TOKEN copy <session_id> --base-url http://node-a:5002 --to http://node-b:5002 --keep-id
+"""
+
+import argparse
+import json
+import os
+import sys
+import requests
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def export_stream(base_url, session_id, conversations):
+    response = requests.get(f"{base_url}/api/sessions/{session_id}/export",
+                            params={"conversations": str(conversations).lower()}, stream=True, timeout=(10, 600))
+    if response.status_code != 200:
+        raise SystemExit(f"Export failed: HTTP {response.status_code} {response.text[:200]}")
+    return response
+
+
+def import_body(base_url, body, keep_id, rebuild, admin_token, trust_index=False):
+    """POST a snapshot; ``body`` is a file object or an iterator of blocks, sent chunked as it is read
+    
+    Importing needs the receiving server's ADMIN_TOKEN. Its index is built from the snapshot's chunks
+    unless ``trust_index`` lets it use the snapshot's FAISS files as they are.
+    
+    On a multi-node deployment a kept id may belong to another node; that answers 421 with the owner's
+    URL, which is returned as ``{"owner": ...}`` so the caller can send the snapshot there instead.
+    """
+    response = requests.post(f"{base_url}/api/sessions/import", data=body,
+                             params={"keep_id": str(keep_id).lower(), "rebuild": str(rebuild).lower(),
+                                     "trust_index": str(trust_index).lower()},
+                             headers={"Content-Type": "application/gzip", "X-Admin-Token": admin_token or ""},
+                             timeout=(10, 3600))
+    if response.status_code == 421 and response.json().get("owner"):
+        return {"owner": response.json()["owner"]}
+    if response.status_code != 201:
+        raise SystemExit(f"Import failed: HTTP {response.status_code} {response.text[:500]}")
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import chatbot sessions with their built index")
+    parser.add_argument("--base-url", default="http://localhost:5002")
+    parser.add_argument("--admin-token", default=os.getenv("ADMIN_TOKEN"),
+                        help="ADMIN_TOKEN of the importing server (default: $ADMIN_TOKEN)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Download a session snapshot")
+    export_parser.add_argument("session_id")
+    export_parser.add_argument("-o", "--output", help="Snapshot file (default: session-<id>.tar.gz)")
+    export_parser.add_argument("--conversations", action="store_true", help="Include conversation history")
+
+    import_parser = commands.add_parser("import", help="Create a session from a snapshot file")
+    import_parser.add_argument("snapshot")
+    import_parser.add_argument("--keep-id", action="store_true", help="Keep the exported session id")
+    import_parser.add_argument("--rebuild", action="store_true",
+                               help="Re-embed the documents (needed if the servers use different embedding models)")
+    import_parser.add_argument("--trust-index", action="store_true",
+                               help="Use the snapshot's FAISS files instead of building the index from its chunks")
+
+    copy_parser = commands.add_parser("copy", help="Stream a session from --base-url straight into --to")
+    copy_parser.add_argument("session_id")
+    copy_parser.add_argument("--to", required=True, help="Base URL of the receiving server")
+    copy_parser.add_argument("--conversations", action="store_true")
+    copy_parser.add_argument("--keep-id", action="store_true")
+    copy_parser.add_argument("--rebuild", action="store_true")
+    copy_parser.add_argument("--trust-index", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        output = args.output or f"session-{args.session_id[:8]}.tar.gz"
+        written = 0
+        with export_stream(args.base_url, args.session_id, args.conversations) as response, open(output, "wb") as f:
+            for block in response.iter_content(BLOCK_SIZE):
+                f.write(block)
+                written += len(block)
+        print(f"Exported session {args.session_id} to {output} ({written / 1024 ** 2:.1f} MB)")
+    elif args.command == "import":
+        with open(args.snapshot, "rb") as f:
+            result = import_body(args.base_url, f, args.keep_id, args.rebuild, args.admin_token, args.trust_index)
+        if "owner" in result:
+            print(f"Session belongs to {result['owner']}, importing there")
+            with open(args.snapshot, "rb") as f:
+                result = import_body(result["owner"], f, args.keep_id, args.rebuild,
+                                     args.admin_token, args.trust_index)
+        print(json.dumps(result, indent=2))
+    else:
+        with export_stream(args.base_url, args.session_id, args.conversations) as response:
+            result = import_body(args.to, response.iter_content(BLOCK_SIZE), args.keep_id, args.rebuild,
+                                 args.admin_token, args.trust_index)
+        if "owner" in result:
+            # The first stream was used up; export again straight to the owner
+            print(f"Session belongs to {result['owner']}, importing there")
+            with export_stream(args.base_url, args.session_id, args.conversations) as response:
+                result = import_body(result["owner"], response.iter_content(BLOCK_SIZE), args.keep_id, args.rebuild,
+                                     args.admin_token, args.trust_index)
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
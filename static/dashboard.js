@@ -2,6 +2,9 @@
 let currentSession = null;
 let currentConversationId = null;
 
+// Conditional GET cache for the read endpoints: last ETag and parsed body per URL
+const etagCache = new Map();
+
 // DOM elements
 const navItems = document.querySelectorAll('.nav-item');
 const contentSections = document.querySelectorAll('.content-section');
@@ -121,7 +124,7 @@ async function loadAvailableSessions() {
         loadBtn.disabled = true;
         
         console.log('Fetching sessions from /api/sessions/list'); // Debug log
-        const response = await fetch('/api/sessions/list');
+        const response = await cachedFetch('/api/sessions/list');
         const data = await response.json();
         
         console.log('Sessions response:', data); // Debug log
@@ -240,7 +243,7 @@ async function handleLoadSession(e) {
     showLoading('Loading session...');
     
     try {
-        const response = await fetch(`/api/sessions/${sessionId}/status`);
+        const response = await cachedFetch(`/api/sessions/${sessionId}/status`);
         const data = await response.json();
         
         if (response.ok) {
@@ -276,7 +279,7 @@ async function updateSessionDisplay(sessionData = null) {
     // Load session data if not provided
     if (!sessionData) {
         try {
-            const response = await fetch(`/api/sessions/${currentSession}/status`);
+            const response = await cachedFetch(`/api/sessions/${currentSession}/status`);
             sessionData = await response.json();
         } catch (error) {
             console.error('Failed to load session data:', error);
@@ -337,6 +340,52 @@ function handleFileSelect(e) {
     uploadFiles(files);
 }
 
+// Files above this size use the resumable upload protocol instead of one multipart request
+const RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+async function uploadFileResumable(file, onProgress) {
+    const createResponse = await fetch(`/api/sessions/${currentSession}/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const upload = await createResponse.json();
+    if (!createResponse.ok) throw new Error(upload.error || 'Could not start upload');
+    
+    const uploadUrl = `/api/sessions/${currentSession}/uploads/${upload.upload_id}`;
+    let received = 0;
+    let retries = 0;
+    
+    while (received < file.size) {
+        const end = Math.min(received + upload.part_size, file.size) - 1;
+        try {
+            const response = await fetch(uploadUrl, {
+                method: 'PUT',
+                headers: { 'Content-Range': `bytes ${received}-${end}/${file.size}` },
+                body: file.slice(received, end + 1)
+            });
+            const data = await response.json();
+            if (!response.ok && response.status !== 409) throw new Error(data.error || 'Upload failed');
+            // On success and on 409 the server tells us where to continue
+            received = data.received;
+            retries = 0;
+            onProgress(received / file.size);
+        } catch (error) {
+            if (++retries > UPLOAD_MAX_RETRIES) throw error;
+            // Connection dropped: ask the server how much arrived and resume from there
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const status = await fetch(uploadUrl).then(r => r.json()).catch(() => null);
+            if (status && typeof status.received === 'number') received = status.received;
+        }
+    }
+    
+    const finalizeResponse = await fetch(`${uploadUrl}/finalize`, { method: 'POST' });
+    const result = await finalizeResponse.json();
+    if (!finalizeResponse.ok) throw new Error(result.error || 'Upload failed');
+    return result;
+}
+
 async function uploadFiles(files) {
     if (!currentSession) {
         showToast('Please create or load a session first', 'error');
@@ -345,9 +394,6 @@ async function uploadFiles(files) {
     
     if (files.length === 0) return;
     
-    const formData = new FormData();
-    files.forEach(file => formData.append('files', file));
-    
     // Show progress
     const progressContainer = document.getElementById('upload-progress');
     const progressFill = document.getElementById('progress-fill');
@@ -357,6 +403,36 @@ async function uploadFiles(files) {
     progressFill.style.width = '0%';
     progressText.textContent = 'Uploading files...';
     
+    // Large files go part by part so a dropped connection only costs the current part
+    const largeFiles = files.filter(file => file.size > RESUMABLE_UPLOAD_THRESHOLD);
+    files = files.filter(file => file.size <= RESUMABLE_UPLOAD_THRESHOLD);
+    for (const file of largeFiles) {
+        try {
+            progressText.textContent = `Uploading ${file.name}...`;
+            await uploadFileResumable(file, fraction => {
+                progressFill.style.width = Math.round(fraction * 100) + '%';
+            });
+            showToast(`Uploaded ${file.name} successfully`, 'success');
+        } catch (error) {
+            showToast(`Error uploading ${file.name}: ${error.message}`, 'error');
+        }
+    }
+    
+    if (files.length === 0) {
+        progressText.textContent = 'Upload complete!';
+        setTimeout(() => {
+            progressContainer.style.display = 'none';
+            loadDocuments();
+            updateSessionDisplay();
+        }, 1000);
+        return;
+    }
+    
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    progressFill.style.width = '0%';
+    progressText.textContent = 'Uploading files...';
+    
     try {
         // Simulate progress
         let progress = 0;
@@ -387,6 +463,11 @@ async function uploadFiles(files) {
                 showToast(`Some files had errors: ${data.errors.join(', ')}`, 'warning');
             }
             
+            if (data.duplicates && data.duplicates.length > 0) {
+                const skipped = data.duplicates.map(d => `${d.filename} (same as ${d.duplicate_of})`);
+                showToast(`Skipped identical files: ${skipped.join(', ')}`, 'warning');
+            }
+            
             // Refresh documents list and session status
             setTimeout(() => {
                 progressContainer.style.display = 'none';
@@ -410,7 +491,7 @@ async function loadDocuments() {
     if (!currentSession) return;
     
     try {
-        const response = await fetch(`/api/sessions/${currentSession}/documents`);
+        const response = await cachedFetch(`/api/sessions/${currentSession}/documents`);
         const data = await response.json();
         
         if (response.ok) {
@@ -552,7 +633,7 @@ async function loadCurrentPrompt() {
     if (!currentSession) return;
     
     try {
-        const response = await fetch(`/api/sessions/${currentSession}/prompt`);
+        const response = await cachedFetch(`/api/sessions/${currentSession}/prompt`);
         const data = await response.json();
         
         if (response.ok) {
@@ -863,7 +944,7 @@ async function loadConversationHistory() {
     if (!currentSession) return;
     
     try {
-        const response = await fetch(`/api/sessions/${currentSession}/conversations`);
+        const response = await cachedFetch(`/api/sessions/${currentSession}/conversations`);
         const data = await response.json();
         
         if (response.ok) {
@@ -920,7 +1001,7 @@ async function loadConversationMessages(conversationId) {
     if (!currentSession) return;
     
     try {
-        const response = await fetch(`/api/sessions/${currentSession}/conversations`);
+        const response = await cachedFetch(`/api/sessions/${currentSession}/conversations`);
         const data = await response.json();
         
         if (response.ok) {
@@ -949,7 +1030,7 @@ async function clearAllHistory() {
     showLoading('Clearing history...');
     
     try {
-        const response = await fetch(`/api/sessions/${currentSession}/conversations`);
+        const response = await cachedFetch(`/api/sessions/${currentSession}/conversations`);
         const data = await response.json();
         
         if (response.ok) {
@@ -985,6 +1066,28 @@ async function clearAllHistory() {
 }
 
 // Utility Functions
+
+// Fetch a read endpoint, revalidating with If-None-Match; a 304 reuses the cached body
+async function cachedFetch(url) {
+    const cached = etagCache.get(url);
+    const response = await fetch(url, {
+        headers: cached ? { 'If-None-Match': cached.etag } : {},
+        cache: 'no-store'  // Revalidation happens here, so keep the browser cache out of the way
+    });
+    
+    if (response.status === 304 && cached) {
+        return { ok: true, status: 200, json: async () => cached.data };
+    }
+    
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        etagCache.set(url, { etag, data });
+    } else {
+        etagCache.delete(url);
+    }
+    return { ok: response.ok, status: response.status, json: async () => data };
+}
 function showLoading(message = 'Loading...') {
     const overlay = document.getElementById('loading-overlay');
     const text = overlay.querySelector('p');
@@ -0,0 +1,67 @@
+"""
+Shared test setup for the Enhanced AI Chatbot Platform
+app.py is imported once, offline: MongoDB points at a closed port so the local JSON storage is
+used, the embedding model is replaced by a deterministic hashed bag of words, and the working
+directory (vector_stores, local_db) is a temporary folder.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import numpy as np
+import pytest
+import langchain_huggingface
+from langchain_core.embeddings import Embeddings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_TOKEN = "test-admin-token"
+
+
+class HashEmbeddings(Embeddings):
+    """384-dimensional unit vectors from hashed words, so similar texts get similar vectors"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _vector(self, text):
+        vector = np.zeros(384, dtype="float32")
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+langchain_huggingface.HuggingFaceEmbeddings = HashEmbeddings
+os.environ["MONGO_URI"] = "mongodb://127.0.0.1:1/"
+os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+os.chdir(tempfile.mkdtemp(prefix="chatbot-tests-"))
+sys.path.insert(0, ROOT)
+
+import app as chatbot_app  # noqa: E402
+
+
+@pytest.fixture
+def app_module():
+    return chatbot_app
+
+
+@pytest.fixture
+def client():
+    chatbot_app.app.config["TESTING"] = True
+    return chatbot_app.app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Token": ADMIN_TOKEN}
+
+
+@pytest.fixture
+def session_id():
+    return chatbot_app.create_session_record("Test bot", "Tests")["session_id"]
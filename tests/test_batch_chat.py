@@ -0,0 +1,36 @@
+"""Request validation of the batch question-answering endpoint (user-028)"""
+
+import json
+import pytest
+
+
+@pytest.mark.parametrize("parallelism", ["x", [2], {"n": 2}, 0, -3])
+def test_bad_parallelism_is_rejected(client, session_id, parallelism):
+    response = client.post(f"/api/sessions/{session_id}/chat/batch",
+                           json={"questions": ["a"], "parallelism": parallelism})
+    assert response.status_code == 400
+    assert "parallelism" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("persist", ["false", "true", 0, 1, [True]])
+def test_persist_must_be_a_boolean(client, session_id, persist):
+    response = client.post(f"/api/sessions/{session_id}/chat/batch",
+                           json={"questions": ["a"], "persist": persist})
+    assert response.status_code == 400
+    assert "persist" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("parallelism, expected", [(None, 4), ("2", 2), (1000, 4)])
+def test_parallelism_defaults_and_is_capped(client, session_id, app_module, monkeypatch, parallelism, expected):
+    monkeypatch.setattr(app_module, "BATCH_MAX_PARALLELISM", 4)
+    monkeypatch.setattr(app_module, "generate_response", lambda *args, **kwargs: "answer")
+    response = client.post(f"/api/sessions/{session_id}/chat/batch",
+                           json={"questions": ["a", "b"], "parallelism": parallelism})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line["response"] for line in lines[:-1]] == ["answer", "answer"]
+    assert lines[-1]["summary"]["parallelism"] == expected
+
+
+def test_questions_are_required(client, session_id):
+    assert client.post(f"/api/sessions/{session_id}/chat/batch", json={"questions": []}).status_code == 400
@@ -0,0 +1,46 @@
+"""Re-running a bulk ingest keeps only documents whose bytes are unchanged (user-049)"""
+
+import bulk_ingest
+import pytest
+
+
+@pytest.fixture
+def stats():
+    return {"copied": 0, "bytes_copied": 0, "already_present": 0, "duplicates": 0, "unsupported": 0,
+            "name_collisions": 0}
+
+
+def stored(app_module, session_id, name):
+    with open(f"{app_module.get_documents_path(session_id)}/{name}", "rb") as f:
+        return f.read()
+
+
+def test_a_document_edited_at_the_same_size_is_replaced(app_module, session_id, tmp_path, stats):
+    (tmp_path / "guide.txt").write_bytes(b"Filters are replaced every 6 months.")
+    bulk_ingest.copy_documents(session_id, str(tmp_path), stats)
+    document = f"{app_module.get_documents_path(session_id)}/guide.txt"
+    app_module.save_chunk_cache(session_id, document, [app_module.Document(page_content="old", metadata={})],
+                                app_module.np.zeros((1, 384), dtype="float32"))
+
+    (tmp_path / "guide.txt").write_bytes(b"Filters are replaced every 9 months.")
+    bulk_ingest.copy_documents(session_id, str(tmp_path), stats)
+    assert stored(app_module, session_id, "guide.txt") == b"Filters are replaced every 9 months."
+    assert app_module.read_chunk_cache_meta(session_id, document) is None
+    assert stats["copied"] == 2 and stats["already_present"] == 0
+
+    bulk_ingest.copy_documents(session_id, str(tmp_path), stats)
+    assert stats["copied"] == 2 and stats["already_present"] == 1
+
+
+def test_flattened_name_collisions_keep_the_first_file(app_module, session_id, tmp_path, stats):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "b.txt").write_bytes(b"from the subfolder")
+    (tmp_path / "a_b.txt").write_bytes(b"from the top level")
+    documents = bulk_ingest.copy_documents(session_id, str(tmp_path), stats)
+    assert [path.rsplit("/", 1)[1] for path in documents] == ["a_b.txt"]
+    assert stats["name_collisions"] == 1
+
+    first = stored(app_module, session_id, "a_b.txt")
+    bulk_ingest.copy_documents(session_id, str(tmp_path), stats)
+    assert stored(app_module, session_id, "a_b.txt") == first
+    assert stats["copied"] == 1 and stats["already_present"] == 1
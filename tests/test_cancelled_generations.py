@@ -0,0 +1,102 @@
+"""Stopped generations: stored messages always advance the ETag, and the savings estimate is honest (user-050)"""
+
+import json
+
+
+def cancelled_generation(completion_tokens):
+    def generate_response(prompt, stats=None, **kwargs):
+        stats.update(cancelled="deadline", completion_tokens=completion_tokens)
+        return "partial" if completion_tokens else ""
+    return generate_response
+
+
+def conversations_etag(client, session_id):
+    return client.get(f"/api/sessions/{session_id}/conversations").headers["ETag"].strip('"')
+
+
+def test_discarded_answer_still_changes_the_conversations(app_module, client, session_id, monkeypatch):
+    monkeypatch.setattr(app_module, "PARTIAL_ANSWER_POLICY", "discard")
+    monkeypatch.setattr(app_module, "generate_response", cancelled_generation(3))
+    etag = conversations_etag(client, session_id)
+
+    response = client.post(f"/api/sessions/{session_id}/chat", json={"message": "Tell me everything"})
+    assert response.status_code == 200
+
+    conversations = client.get(f"/api/sessions/{session_id}/conversations", headers={"If-None-Match": etag})
+    assert conversations.status_code == 200
+    messages = conversations.get_json()["conversations"][0]["messages"]
+    assert [message["message_type"] for message in messages] == ["user"]
+
+
+def test_batch_answers_persisted_before_a_disconnect_change_the_conversations(app_module, client, session_id,
+                                                                              monkeypatch):
+    monkeypatch.setattr(app_module, "generate_response", lambda *args, **kwargs: "answer")
+    etag = conversations_etag(client, session_id)
+    response = client.post(f"/api/sessions/{session_id}/chat/batch",
+                           json={"questions": ["a", "b", "c"], "parallelism": 1, "persist": True}, buffered=False)
+    first = json.loads(next(response.response))
+    response.close()  # The client goes away after the first answer
+
+    assert first["response"] == "answer"
+    assert conversations_etag(client, session_id) != etag
+
+
+def test_no_savings_estimate_before_the_model_finished_an_answer(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "_completion_tokens_mean", {})
+    saved = app_module.GENERATION_TOKENS_SAVED.labels("deadline")
+    before = saved._value.get()
+    stats = {}
+    app_module.record_cancelled_generation("llama3.2", "deadline", 5, stats)
+    assert stats["tokens_saved_estimate"] is None
+    assert saved._value.get() == before
+
+    app_module.record_generation_metrics({"eval_count": 40}, 1.0, "llama3.2")
+    app_module.record_cancelled_generation("llama3.2", "deadline", 5, stats)
+    assert stats["tokens_saved_estimate"] == 35
+    assert saved._value.get() == before + 35
+
+
+class RecordingOllama:
+    """Stands in for the requests module: records the timeout and streams one finished answer"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    def post(self, url, json=None, stream=False, timeout=None):
+        self.timeouts.append(timeout)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    status_code = 200
+
+    def iter_lines(self):
+        yield b'{"response": "ok", "done": true, "eval_count": 1}'
+
+
+def test_a_budget_that_ran_out_after_the_check_is_a_cancellation(app_module, monkeypatch):
+    deadline = app_module.RequestDeadline(5)
+    monkeypatch.setattr(deadline, "remaining", lambda: 0.0)  # Ran out between check() and remaining()
+    ollama = RecordingOllama()
+    errors = app_module.OLLAMA_ERRORS.labels("other")
+    errors_before = errors._value.get()
+    stats = {}
+
+    answer = app_module.generate_response("prompt", stats=stats, http=ollama, deadline=deadline)
+    assert stats["cancelled"] == "deadline"
+    assert answer == app_module.deadline_message(deadline)
+    assert ollama.timeouts == [] and errors._value.get() == errors_before
+
+
+def test_connect_and_read_timeouts_are_capped_by_the_budget(app_module):
+    ollama = RecordingOllama()
+    assert app_module.generate_response("prompt", http=ollama, deadline=app_module.RequestDeadline(3)) == "ok"
+    connect_timeout, read_timeout = ollama.timeouts[0]
+    assert 0 < connect_timeout <= 3 and 0 < read_timeout <= 3
+
+    app_module.generate_response("prompt", http=ollama, deadline=app_module.RequestDeadline(None))
+    assert ollama.timeouts[1] == (10, 120)
@@ -0,0 +1,100 @@
+"""Streamed chunks are the chunks of the whole file, whatever the part sizes (user-036)"""
+
+import json
+import random
+import pytest
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14))) + rng.choice(".!?")
+
+
+def document(seed):
+    """Headings, paragraphs, long paragraphs without blank lines, table rows, form feeds and CRLF"""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(40):
+        kind = rng.random()
+        if kind < 0.1:
+            parts.append(rng.choice(["# ", "## "]) + rng.choice(WORDS).title())
+        elif kind < 0.15:
+            parts.append(rng.choice(WORDS).upper())
+        elif kind < 0.25:
+            parts.append("\f" + rng.choice(["", "  ", "\f", "\n"]) + sentence(rng))
+        elif kind < 0.35:
+            parts.append("\n".join(f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} |" for _ in range(rng.randint(2, 30))))
+        elif kind < 0.45:
+            parts.append(" ".join(sentence(rng) for _ in range(rng.randint(60, 200))))
+        else:
+            parts.append(" ".join(sentence(rng) for _ in range(rng.randint(1, 6))))
+    return "".join(part + rng.choice(["\n\n", "\n \n", "\r\n\r\n", "\n", "\n\n\n", " \f "]) for part in parts)
+
+
+def batch_chunks(text, chunker):
+    return chunker.split_text(text.replace("\r\n", "\n").replace("\r", "\n"))
+
+
+def streamed_chunks(app_module, text, chunker, part_size, round_trip=False):
+    streamer = app_module.StreamingTextChunker(chunker)
+    chunks = []
+    for start in range(0, len(text), part_size):
+        chunks += streamer.feed(text[start:start + part_size])
+        if round_trip:
+            streamer = app_module.StreamingTextChunker(chunker, json.loads(json.dumps(streamer.state())))
+    return chunks + streamer.flush()
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("unit,chunk_size,chunk_overlap", [("characters", 500, 50), ("tokens", 120, 20)])
+def test_streamed_chunks_match_whole_file_chunks(app_module, seed, unit, chunk_size, chunk_overlap):
+    chunker = app_module.StructuredChunker(chunk_size, chunk_overlap, unit)
+    text = document(seed)
+    expected = batch_chunks(text, chunker)
+    for part_size in (1, 7, 64, 1000, 5000, len(text)):
+        assert streamed_chunks(app_module, text, chunker, part_size) == expected, f"part_size={part_size}"
+
+
+def test_state_survives_a_json_round_trip(app_module):
+    chunker = app_module.StructuredChunker(300, 30, "characters")
+    text = document(7)
+    expected = batch_chunks(text, chunker)
+    for part_size in (3, 250, 4096):
+        assert streamed_chunks(app_module, text, chunker, part_size, round_trip=True) == expected
+
+
+def test_form_feeds_are_page_breaks_not_text(app_module):
+    chunker = app_module.StructuredChunker(1000, 0, "characters")
+    text = "First page text.\f\fSecond page text.\n\n\f  Third page."
+    expected = [("First page text.", ""), ("Second page text.", ""), ("Third page.", "")]
+    assert batch_chunks(text, chunker) == expected
+    assert streamed_chunks(app_module, text, chunker, 1) == expected
+
+
+def test_long_paragraph_is_cut_where_the_whole_file_is(app_module):
+    chunker = app_module.StructuredChunker(200, 20, "characters")
+    rng = random.Random(3)
+    paragraph = " ".join(sentence(rng) for _ in range(2000))  # Far longer than max_buffer
+    text = "# Intro\n\n" + paragraph + "\n\nEnd."
+    expected = batch_chunks(text, chunker)
+    assert all(len(chunk) <= 200 for chunk, _ in expected)
+    for part_size in (1, 100, 4096):
+        assert streamed_chunks(app_module, text, chunker, part_size) == expected
+
+
+def test_upload_parts_are_chunked_like_the_whole_file(app_module, client, session_id):
+    text = document(11).replace("\r\n", "\n")
+    data = text.encode("utf-8")
+    response = client.post(f"/api/sessions/{session_id}/uploads", json={"filename": "notes.txt", "size": len(data)})
+    upload_id = response.get_json()["upload_id"]
+    for start in range(0, len(data), 3000):
+        part = data[start:start + 3000]
+        headers = {"Content-Range": f"bytes {start}-{start + len(part) - 1}/{len(data)}"}
+        assert client.put(f"/api/sessions/{session_id}/uploads/{upload_id}", data=part, headers=headers).status_code == 200
+        app_module.process_upload_increment(session_id, upload_id)
+    app_module.process_upload_increment(session_id, upload_id, final=True)
+    
+    with open(f"{app_module.get_upload_path(session_id, upload_id)}/chunks.jsonl", encoding="utf-8") as f:
+        streamed = [json.loads(line)["content"] for line in f]
+    assert streamed == [chunk for chunk, _ in app_module.StructuredChunker().split_text(text)]
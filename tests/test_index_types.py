@@ -0,0 +1,33 @@
+"""Index type selection and search quality of the flat, IVF and HNSW indexes (user-029)"""
+
+import numpy as np
+import pytest
+
+
+def test_auto_index_type_follows_chunk_count(app_module):
+    assert app_module.choose_index_settings(100)["index_type"] == "flat"
+    assert app_module.choose_index_settings(app_module.INDEX_HNSW_MIN_CHUNKS)["index_type"] == "hnsw"
+    assert app_module.choose_index_settings(app_module.INDEX_IVF_MIN_CHUNKS)["index_type"] == "ivf"
+
+
+def test_ivf_keeps_enough_training_points_per_centroid(app_module):
+    settings = app_module.choose_index_settings(2000, {"index_type": "ivf"})
+    assert 2000 // settings["nlist"] >= 39
+    assert 1 <= settings["nprobe"] <= settings["nlist"]
+
+
+def test_session_overrides_win(app_module):
+    settings = app_module.choose_index_settings(10, {"index_type": "hnsw", "hnsw_m": 8, "ef_search": 64})
+    assert settings["index_type"] == "hnsw"
+    assert settings["hnsw_m"] == 8
+    assert settings["ef_search"] == 64
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_index_finds_each_vector_itself(app_module, index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype("float32")
+    settings = app_module.choose_index_settings(len(vectors), {"index_type": index_type}, vectors.shape[1])
+    index = app_module.create_faiss_index(vectors, settings)
+    _, ids = index.search(vectors[:50], 1)
+    assert (ids[:, 0] == np.arange(50)).mean() >= 0.9
@@ -0,0 +1,66 @@
+"""Record-by-record JSON reading gives the same records whatever the read size (user-035)"""
+
+import io
+import json
+import pytest
+
+FIXTURES = {
+    "object_of_scalars": {"price": 12.99, "scale": 1.5e3, "delta": -0.25, "tiny": 1e-7, "id": 123456789012,
+                          "name": "widget", "active": True, "deleted": False, "note": None},
+    "array_of_records": [{"sku": f"A{i}", "price": 10 + i / 100, "stock": i * 1000, "ratio": -i * 2.5e-3}
+                         for i in range(8)],
+    "nested": {"store": {"rating": 4.75, "geo": {"lat": 52.520008, "lon": 13.404954}},
+               "products": [{"price": 1.5, "tags": ["a", "b"]}, {"price": 2e2, "tags": []}],
+               "total": 201.5},
+    "top_level_number": 3.14159e-2,
+}
+
+
+def read_records(app_module, text, read_size):
+    return list(app_module.JsonRecordReader(io.StringIO(text), read_size=read_size))
+
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+@pytest.mark.parametrize("indent", [None, 2])
+def test_records_do_not_depend_on_the_read_size(app_module, name, indent):
+    text = json.dumps(FIXTURES[name], indent=indent)
+    expected = read_records(app_module, text, len(text) + 1)
+    for read_size in range(1, len(text) + 1):
+        assert read_records(app_module, text, read_size) == expected, f"read_size={read_size}"
+
+
+def test_records_hold_the_original_values(app_module):
+    records = dict(read_records(app_module, json.dumps(FIXTURES["nested"]), 7))
+    assert records["$.store"] == {"rating": 4.75}
+    assert records["$.store.geo"] == {"lat": 52.520008, "lon": 13.404954}
+    assert records["$.products[1]"] == {"price": 2e2, "tags": []}
+    assert records["$"] == {"total": 201.5}
+
+
+def test_truncated_input_still_fails(app_module):
+    with pytest.raises(ValueError):
+        read_records(app_module, '{"price": 12.', 4)
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_json_and_jsonl_files_give_one_document_per_record(app_module, tmp_path, suffix):
+    records = FIXTURES["array_of_records"]
+    path = tmp_path / f"export{suffix}"
+    if suffix == ".jsonl":
+        path.write_text("\n".join(json.dumps(record) for record in records) + "\n")
+    else:
+        path.write_text(json.dumps(records))
+    documents = list(app_module.iter_json_documents(str(path)))
+    assert [doc.metadata["json_path"] for doc in documents] == [f"$[{i}]" for i in range(len(records))]
+    assert documents[3].page_content == "sku: A3\nprice: 10.03\nstock: 3000\nratio: -0.0075"
+
+
+def test_json_file_is_indexed_from_the_chunk_cache(app_module, session_id):
+    path = f"{app_module.get_documents_path(session_id)}/catalog.json"
+    with open(path, "w") as f:
+        json.dump([{"sku": f"A{i}", "description": f"warranty terms for product {i}"} for i in range(50)], f)
+    assert app_module.build_vector_store_for_session(session_id)
+    assert app_module.get_index_info(session_id)["chunks"] == 50
+    # The second build reads the cached chunks and vectors instead of embedding again
+    assert app_module.build_vector_store_for_session(session_id)
+    assert "warranty" in app_module.retrieve_context_for_session(session_id, "warranty terms")
@@ -0,0 +1,104 @@
+"""Rolling conversation memory: no message is lost between the verbatim window and the summary (user-026)"""
+
+from datetime import datetime, timedelta
+
+
+def add_turns(app_module, session_id, conversation_id, count):
+    started = datetime(2026, 1, 1)
+    for i in range(count):
+        for offset, kind in ((0, "user"), (1, "bot")):
+            app_module.conversations_collection.insert_one({
+                "session_id": session_id,
+                "conversation_id": conversation_id,
+                "message": f"{kind[0]}{i + 1}",
+                "message_type": kind,
+                "timestamp": started + timedelta(seconds=2 * i + offset)
+            })
+
+
+def history_lines(app_module, session_id, conversation_id, stats=None):
+    context = app_module.get_conversation_context(session_id, conversation_id, rolling_memory=True, stats=stats)
+    return context.split("\n")
+
+
+def test_unsummarized_messages_stay_in_the_prompt(app_module, session_id):
+    # Three turns and no summary yet: u1 and b1 are outside the window but must not be dropped
+    add_turns(app_module, session_id, "c1", 3)
+    stats = {}
+    lines = history_lines(app_module, session_id, "c1", stats)
+    assert lines == ["User: u1", "Assistant: b1", "User: u2", "Assistant: b2", "User: u3", "Assistant: b3"]
+    assert stats["history_messages"] == 6
+
+
+def test_summarized_messages_are_replaced_by_the_summary(app_module, session_id):
+    add_turns(app_module, session_id, "c1", 4)
+    app_module.summaries_collection.update_one({"session_id": session_id, "conversation_id": "c1"}, {"$set": {
+        "summary": "The user asked about u1 and u2.",
+        "summarized_count": 4
+    }}, upsert=True)
+    stats = {}
+    lines = history_lines(app_module, session_id, "c1", stats)
+    assert lines[0] == "Summary of earlier conversation: The user asked about u1 and u2."
+    assert lines[1:] == ["User: u3", "Assistant: b3", "User: u4", "Assistant: b4"]
+    assert stats["history_messages"] == 8
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def json(self):
+        return {"response": "summary"}
+
+
+def fake_ollama(monkeypatch, app_module, status_code=200):
+    """Answer summary requests with ``status_code``; returns the list of prompts sent"""
+    prompts = []
+
+    def fake_post(url, json=None, timeout=None):
+        prompts.append(json["prompt"])
+        return FakeResponse(status_code)
+
+    monkeypatch.setattr(app_module.requests, "post", fake_post)
+    return prompts
+
+
+def test_summary_folds_only_messages_outside_the_window(app_module, session_id, monkeypatch):
+    prompts = fake_ollama(monkeypatch, app_module)
+    add_turns(app_module, session_id, "c1", 3)
+    assert app_module.update_conversation_summary(session_id, "c1")
+    assert "User: u1" in prompts[0] and "User: u2" not in prompts[0]
+
+    # Everything after the folded messages is still sent verbatim
+    lines = history_lines(app_module, session_id, "c1")
+    assert lines[1:] == ["User: u2", "Assistant: b2", "User: u3", "Assistant: b3"]
+
+
+def test_prompt_history_is_capped_while_summaries_fail(app_module, session_id, monkeypatch):
+    prompts = fake_ollama(monkeypatch, app_module, status_code=500)
+    add_turns(app_module, session_id, "c1", 20)
+    assert not app_module.update_conversation_summary(session_id, "c1")
+    assert len(prompts) == 1
+
+    stats = {}
+    lines = history_lines(app_module, session_id, "c1", stats)
+    cap = app_module.ROLLING_MEMORY_WINDOW + app_module.ROLLING_MEMORY_SLACK
+    assert len(lines) == cap
+    assert lines[-1] == "Assistant: b20" and lines[0] == f"User: u{20 - cap // 2 + 1}"
+    assert stats["history_messages"] == 40
+
+
+def test_one_summary_update_folds_a_bounded_number_of_messages(app_module, session_id, monkeypatch):
+    monkeypatch.setattr(app_module, "ROLLING_MEMORY_FOLD_MAX", 6)
+    prompts = fake_ollama(monkeypatch, app_module)
+    add_turns(app_module, session_id, "c1", 10)
+    query = {"session_id": session_id, "conversation_id": "c1"}
+
+    assert app_module.update_conversation_summary(session_id, "c1")
+    assert "Assistant: b3" in prompts[0] and "User: u4" not in prompts[0]
+    assert app_module.summaries_collection.find_one(query)["summarized_count"] == 6
+
+    # The next update carries on where this one stopped
+    assert app_module.update_conversation_summary(session_id, "c1")
+    assert "User: u4" in prompts[1] and "Assistant: b6" in prompts[1] and "User: u7" not in prompts[1]
+    assert app_module.summaries_collection.find_one(query)["summarized_count"] == 12
@@ -0,0 +1,49 @@
+"""The session list's ETag changes with every session change, on any node (user-048)"""
+
+from datetime import datetime
+import pytest
+
+
+def list_etag(client, etag=None):
+    response = client.get("/api/sessions/list", headers={"If-None-Match": etag} if etag else {})
+    return response.status_code, response.headers.get("ETag", "").strip('"')
+
+
+@pytest.fixture
+def cluster_mode(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "CLUSTER_ENABLED", True)
+    monkeypatch.setattr(app_module, "owns_session", lambda session_id: True)
+    monkeypatch.setattr(app_module, "get_session_owner", lambda session_id: "http://node-a:5002")
+
+
+def test_list_is_revalidated_until_a_session_changes(app_module, client, session_id):
+    status, etag = list_etag(client)
+    assert status == 200 and etag
+    assert list_etag(client, etag)[0] == 304
+    app_module.update_session(session_id, {"custom_prompt": "Be brief."})
+    assert list_etag(client, etag)[0] == 200
+
+
+def test_bumps_advance_the_shared_counter_in_cluster_mode(app_module, session_id, cluster_mode):
+    before = app_module.read_shared_sessions_version()
+    app_module.bump_versions(session_id, "conversations")
+    assert app_module.read_shared_sessions_version() != before
+
+
+def test_a_change_on_another_node_invalidates_the_list(app_module, client, session_id, cluster_mode):
+    status, etag = list_etag(client)
+    assert status == 200
+    assert list_etag(client, etag)[0] == 304
+
+    # Another node creates a session: the shared database changes, this node's files do not
+    local_versions = app_module.read_versions()
+    other_id = "00000000-0000-4000-8000-000000000000"
+    app_module.sessions_collection.insert_one({"session_id": other_id, "user_description": "Made elsewhere",
+                                               "use_case": "Tests", "created_at": datetime.utcnow()})
+    app_module.versions_collection.update_one({"name": "sessions"}, {"$inc": {"version": 1}}, upsert=True)
+    assert app_module.read_versions() == local_versions
+    try:
+        status, new_etag = list_etag(client, etag)
+        assert status == 200 and new_etag != etag
+    finally:
+        app_module.sessions_collection.delete_many({"session_id": other_id})
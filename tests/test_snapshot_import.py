@@ -0,0 +1,114 @@
+"""Snapshot import is an admin endpoint and only deserializes FAISS files it is told to trust (user-047)"""
+
+import io
+import json
+import tarfile
+import numpy as np
+
+TEXT = "\n\n".join(f"Section {i}. The warranty covers part {i} for {i + 1} years after purchase." for i in range(30))
+
+
+def snapshot_of(client, session_id):
+    files = {"files": (io.BytesIO(TEXT.encode()), "warranty.txt")}
+    response = client.post(f"/api/sessions/{session_id}/documents/upload", data=files,
+                           content_type="multipart/form-data")
+    assert response.get_json()["vector_store_updated"]
+    return client.get(f"/api/sessions/{session_id}/export").data
+
+
+def rewrite(snapshot, change):
+    """The snapshot with each member's data replaced by ``change(name, data)``; None drops the member"""
+    output = io.BytesIO()
+    with tarfile.open(fileobj=io.BytesIO(snapshot), mode="r:gz") as source, \
+            tarfile.open(fileobj=output, mode="w:gz") as target:
+        for member in source:
+            data = change(member.name, source.extractfile(member).read())
+            if data is not None:
+                member.size = len(data)
+                target.addfile(member, io.BytesIO(data))
+    return output.getvalue()
+
+
+def corrupt_index_files(snapshot):
+    """Every faiss_index file but the pointer replaced by junk"""
+    return rewrite(snapshot, lambda name, data: b"not a faiss index" * 10
+                   if name.startswith("faiss_index/") and name.count("/") == 2 else data)
+
+
+def published_index(app_module, session_id):
+    path = app_module.get_published_index_path(app_module.get_vector_store_path(session_id))
+    with open(f"{path}/{app_module.INDEX_FILE}", "rb") as f:
+        return f.read()
+
+
+def import_snapshot(client, snapshot, headers, **params):
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return client.post(f"/api/sessions/import?{query}", data=snapshot, headers=headers,
+                       content_type="application/gzip")
+
+
+def test_import_requires_the_admin_token(client, session_id):
+    snapshot = snapshot_of(client, session_id)
+    assert import_snapshot(client, snapshot, {}).status_code == 401
+    assert import_snapshot(client, snapshot, {"X-Admin-Token": "wrong"}).status_code == 401
+
+
+def test_index_is_built_from_the_snapshot_vectors(app_module, client, session_id, admin_headers, monkeypatch):
+    snapshot = corrupt_index_files(snapshot_of(client, session_id))
+
+    def no_embedding(texts):
+        raise AssertionError("the snapshot vectors should make re-embedding unnecessary")
+
+    monkeypatch.setattr(app_module.embeddings, "embed_documents", no_embedding)
+    response = import_snapshot(client, snapshot, admin_headers)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result["rebuilt"] is False
+    assert result["index"]["chunks"] == app_module.get_index_info(session_id)["chunks"]
+    assert "warranty covers part 7" in app_module.retrieve_context_for_session(result["session_id"], "part 7 warranty")
+
+
+def test_trust_index_keeps_the_shipped_index(app_module, client, session_id, admin_headers):
+    response = import_snapshot(client, snapshot_of(client, session_id), admin_headers, trust_index="true")
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result["rebuilt"] is False
+    assert published_index(app_module, result["session_id"]) == published_index(app_module, session_id)
+
+
+def test_snapshots_without_plain_vectors_are_re_embedded(app_module, client, session_id, admin_headers):
+    snapshot = rewrite(corrupt_index_files(snapshot_of(client, session_id)),
+                       lambda name, data: None if name.startswith("index_vectors/") else data)
+    response = import_snapshot(client, snapshot, admin_headers)
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result["rebuilt"] is True
+    assert "warranty covers part 7" in app_module.retrieve_context_for_session(result["session_id"], "part 7 warranty")
+
+
+def test_snapshots_over_the_size_cap_are_refused(app_module, client, session_id, admin_headers, monkeypatch):
+    snapshot = snapshot_of(client, session_id)
+    monkeypatch.setattr(app_module, "SNAPSHOT_MAX_SIZE", len(snapshot) - 1)
+    assert import_snapshot(client, snapshot, admin_headers).status_code == 413
+
+
+def test_plain_index_data_is_exported_in_batches(app_module, client, session_id, admin_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "SNAPSHOT_BATCH_ROWS", 2)
+    requested = []
+    get_chunks = app_module.SessionVectorStore.get_chunks
+    monkeypatch.setattr(app_module.SessionVectorStore, "get_chunks",
+                        lambda self, ids: requested.append(len(ids)) or get_chunks(self, ids))
+    snapshot = snapshot_of(client, session_id)
+    assert max(requested) == 2 and sum(requested) == app_module.get_index_info(session_id)["chunks"] > 2
+
+    with tarfile.open(fileobj=io.BytesIO(snapshot), mode="r:gz") as archive:
+        members = {member.name: archive.extractfile(member).read() for member in archive}
+    vectors = np.load(io.BytesIO(members["index_vectors/vectors.npy"]))
+    chunks = [json.loads(line)["content"] for line in members["index_vectors/chunks.jsonl"].splitlines()]
+    vector_store = app_module.load_vector_store_for_session(session_id)
+    rows = range(len(chunks))
+    assert np.array_equal(vectors, vector_store.get_vectors(rows))
+    assert chunks == [vector_store.get_chunks(rows)[i].page_content for i in rows]
+
+    response = import_snapshot(client, corrupt_index_files(snapshot), admin_headers)
+    assert response.get_json()["index"]["chunks"] == len(chunks)
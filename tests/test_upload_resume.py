@@ -0,0 +1,63 @@
+"""A worker that dies mid-increment leaves no duplicate chunks behind (user-033)"""
+
+import json
+
+TEXT = "\n\n".join(f"Paragraph {i}. " + "The pump needs service every month. " * 12 for i in range(40))
+
+
+def start_upload(client, session_id, data):
+    response = client.post(f"/api/sessions/{session_id}/uploads", json={"filename": "manual.txt", "size": len(data)})
+    return response.get_json()["upload_id"]
+
+
+def send_part(client, session_id, upload_id, data, start, end):
+    headers = {"Content-Range": f"bytes {start}-{end - 1}/{len(data)}"}
+    assert client.put(f"/api/sessions/{session_id}/uploads/{upload_id}", data=data[start:end],
+                      headers=headers).status_code == 200
+
+
+def test_rows_of_an_unrecorded_increment_are_dropped_on_resume(app_module, client, session_id, monkeypatch):
+    monkeypatch.setattr(app_module, "schedule_upload_processing", lambda session_id, upload_id: None)
+    data = TEXT.encode()
+    upload_id = start_upload(client, session_id, data)
+    upload_path = app_module.get_upload_path(session_id, upload_id)
+    send_part(client, session_id, upload_id, data, 0, len(data) // 2)
+    app_module.process_upload_increment(session_id, upload_id)
+
+    # The next increment appends its rows, then the worker dies before progress.json is written
+    write_progress = app_module._write_upload_progress
+
+    def die(*args):
+        raise SystemExit("worker killed")
+
+    monkeypatch.setattr(app_module, "_write_upload_progress", die)
+    send_part(client, session_id, upload_id, data, len(data) // 2, len(data))
+    try:
+        app_module.process_upload_increment(session_id, upload_id)
+    except SystemExit:
+        pass
+    monkeypatch.setattr(app_module, "_write_upload_progress", write_progress)
+    with open(f"{upload_path}/chunks.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) > app_module._read_upload_progress(upload_path)["chunks"]
+
+    response = client.post(f"/api/sessions/{session_id}/uploads/{upload_id}/finalize")
+    assert response.status_code == 200
+
+    expected = [chunk for chunk, _ in app_module.StructuredChunker().split_text(TEXT)]
+    cached_chunks, cached_vectors = app_module.load_chunk_cache(
+        session_id, app_module.Path(app_module.get_documents_path(session_id)) / "manual.txt")
+    assert [chunk.page_content for chunk in cached_chunks] == expected
+    assert cached_vectors.shape == (len(expected), 384)
+    assert [row.tolist() for row in cached_vectors] == app_module.embeddings.embed_documents(expected)
+
+
+def test_progress_records_the_file_lengths(app_module, client, session_id):
+    data = TEXT.encode()
+    upload_id = start_upload(client, session_id, data)
+    upload_path = app_module.get_upload_path(session_id, upload_id)
+    send_part(client, session_id, upload_id, data, 0, len(data))
+    app_module.process_upload_increment(session_id, upload_id)
+    with open(f"{upload_path}/progress.json") as f:
+        progress = json.load(f)
+    assert progress["chunks_bytes"] == app_module.os.path.getsize(f"{upload_path}/chunks.jsonl") > 0
+    assert progress["vectors_bytes"] == progress["chunks"] * 384 * 4
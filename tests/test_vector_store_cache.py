@@ -0,0 +1,59 @@
+"""Stores leaving a worker's cache are closed, but not while a search still holds them (user-030)"""
+
+import os
+import pytest
+
+
+@pytest.fixture
+def make_indexed_session(app_module):
+    def make():
+        session_id = app_module.create_session_record("Indexed bot", "Tests")["session_id"]
+        path = os.path.join(app_module.get_documents_path(session_id), "notes.txt")
+        with open(path, "w") as f:
+            f.write("\n\n".join(f"Paragraph {i} about shipping, refunds and warranty terms." for i in range(20)))
+        assert app_module.build_vector_store_for_session(session_id)
+        return session_id
+    return make
+
+
+def is_closed(store):
+    return store._connection is None and store.index is None
+
+
+def test_evicted_store_is_closed(app_module, make_indexed_session, monkeypatch):
+    monkeypatch.setattr(app_module, "VECTOR_STORE_CACHE_SIZE", 1)
+    first, second = make_indexed_session(), make_indexed_session()
+    store = app_module.load_vector_store_for_session(first)
+    app_module.load_vector_store_for_session(second)
+    assert is_closed(store)
+
+
+def test_held_store_closes_after_release(app_module, make_indexed_session, monkeypatch):
+    monkeypatch.setattr(app_module, "VECTOR_STORE_CACHE_SIZE", 1)
+    first, second = make_indexed_session(), make_indexed_session()
+    store = app_module.load_vector_store_for_session(first, hold=True)
+    app_module.load_vector_store_for_session(second)
+    assert not is_closed(store)
+    assert store.similarity_search("refunds", k=2)
+    app_module.release_vector_store(store)
+    assert is_closed(store)
+
+
+def test_replaced_version_is_closed_and_collected(app_module, make_indexed_session):
+    session_id = make_indexed_session()
+    old_store = app_module.load_vector_store_for_session(session_id)
+    old_version = os.path.basename(old_store.path)
+    assert app_module.build_vector_store_for_session(session_id)
+    new_store = app_module.load_vector_store_for_session(session_id)
+    assert new_store is not old_store
+    assert is_closed(old_store)
+    assert not os.path.exists(os.path.join(app_module.get_vector_store_path(session_id), old_version))
+
+
+def test_retrieval_releases_its_hold(app_module, make_indexed_session):
+    session_id = make_indexed_session()
+    assert "refunds" in app_module.retrieve_context_for_session(session_id, "refunds")
+    store = app_module.load_vector_store_for_session(session_id)
+    assert store._holders == 0
+    app_module.drop_cached_vector_store(session_id)
+    assert is_closed(store)